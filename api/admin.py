@@ -1,45 +1,17 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
-from django.http import HttpResponse
-from django.utils.encoding import smart_str
-import pandas as pd
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from django.http import FileResponse, Http404, HttpResponseGone
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
 from .models import (
     Branch, CustomUser, Sale, SaleItem, Product, Vendor,
-    StockMovement, AuditLog, LedgerEntry
+    StockMovement, StockCheckpoint, InventorySnapshot, AuditLog, LedgerEntry, OutboxMessage, ReportJob
 )
-
-# ---------- EXPORT HELPERS ----------
-
-def export_as_excel(queryset, fields, filename):
-    data = queryset.values(*fields)
-    df = pd.DataFrame(list(data))
-    response = HttpResponse(content_type="application/vnd.ms-excel")
-    response["Content-Disposition"] = f'attachment; filename="{filename}.xlsx"'
-    df.to_excel(response, index=False)
-    return response
-
-def export_as_pdf(queryset, fields, filename):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer)
-
-    y = 800
-    for obj in queryset.values(*fields):
-        line = ", ".join([f"{k}: {v}" for k, v in obj.items()])
-        p.drawString(50, y, smart_str(line))
-        y -= 20
-        if y <= 50:  # new page if needed
-            p.showPage()
-            y = 800
-
-    p.save()
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="{filename}.pdf"'
-    return response
+from .reports import REPORTS, open_artifact, pk_ranges, request_job
+from .search import filter_products
 
 # ---------- BASE ADMIN WITH EXPORT ----------
 
@@ -56,12 +28,27 @@ class ExportAdmin(admin.ModelAdmin):
             return qs.filter(branch=request.user.branch)
         return qs
 
+    def queue_export(self, request, queryset, fmt):
+        # Rendered by the report workers; the admin gets a link to the job.
+        # Jobs are per user: ReportJobAdmin shows users only their own.
+        job, _ = request_job("admin_export", {
+            "user": request.user.pk,
+            "model": self.model._meta.label,
+            "fields": self.export_fields,
+            # Runs of ids rather than every id: selecting a whole table stays one pair
+            "pk_ranges": pk_ranges(queryset.order_by("pk").values_list("pk", flat=True).iterator()),
+            "format": fmt,
+            "filename": self.export_filename,
+        }, user_id=request.user.pk)
+        url = reverse("admin:api_reportjob_change", args=[job.pk])
+        self.message_user(request, format_html('Export queued as <a href="{}">report job #{}</a>.', url, job.pk))
+
     def export_excel(self, request, queryset):
-        return export_as_excel(queryset, self.export_fields, self.export_filename)
+        self.queue_export(request, queryset, "xlsx")
     export_excel.short_description = "Export selected as Excel"
 
     def export_pdf(self, request, queryset):
-        return export_as_pdf(queryset, self.export_fields, self.export_filename)
+        self.queue_export(request, queryset, "pdf")
     export_pdf.short_description = "Export selected as PDF"
 
 # ---------- MODEL ADMINS ----------
@@ -108,6 +95,16 @@ class ProductAdmin(ExportAdmin):
     export_fields = ["id", "name", "sku", "price", "quantity", "branch__name"]
     export_filename = "products"
 
+    def get_readonly_fields(self, request, obj=None):
+        # Stock changes after creation go through stock movements
+        return ("quantity",) if obj else ()
+
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index instead of icontains scans over name/sku
+        if not search_term.strip():
+            return queryset, False
+        return filter_products(queryset, search_term), False
+
 
 @admin.register(Sale)
 class SaleAdmin(ExportAdmin):
@@ -141,6 +138,12 @@ class StockMovementAdmin(ExportAdmin):
     export_fields = ["id", "product__name", "quantity", "movement_type", "branch__name", "created_at"]
     export_filename = "stock_movements"
 
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(AuditLog)
 class AuditLogAdmin(ExportAdmin):
@@ -158,3 +161,70 @@ class LedgerEntryAdmin(ExportAdmin):
     search_fields = ("description",)
     export_fields = ["id", "branch__name", "description", "amount", "date"]
     export_filename = "ledger_entries"
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "status", "attempts", "available_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "recipients")
+    readonly_fields = ("created_at", "sent_at", "last_error")
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "created_by", "created_at", "finished_at", "download_link")
+    list_filter = ("kind", "status")
+    readonly_fields = (
+        "kind", "params", "branch", "fingerprint", "status", "artifact", "error",
+        "created_by", "created_at", "started_at", "finished_at", "download_link",
+    )
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related("created_by")
+        # Exports carry the rows their admin could see
+        return qs if request.user.is_superuser else qs.filter(created_by=request.user)
+
+    def get_urls(self):
+        download = path(
+            "<int:pk>/download/",
+            self.admin_site.admin_view(self.download_view),
+            name="api_reportjob_download",
+        )
+        return [download, *super().get_urls()]
+
+    def download_view(self, request, pk):
+        job = get_object_or_404(self.get_queryset(request), pk=pk)
+        if not self.has_view_permission(request, job) or job.status != "done":
+            raise Http404("The report is not ready.")
+        artifact = open_artifact(job)
+        if artifact is None:
+            return HttpResponseGone("The report file is gone; export the rows again.")
+        report = REPORTS[job.kind]
+        return FileResponse(
+            artifact,
+            as_attachment=True,
+            filename=report.filename(job.params),
+            content_type=report.content_type(job.params),
+        )
+
+    @admin.display(description="Download")
+    def download_link(self, obj):
+        if obj.status != "done":
+            return "-"
+        return format_html('<a href="{}">{}</a>', reverse("admin:api_reportjob_download", args=[obj.pk]), "Download")
+
+
+@admin.register(StockCheckpoint)
+class StockCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("id", "product", "quantity", "movement_id", "created_at")
+    search_fields = ("product__name", "product__sku")
+    readonly_fields = ("product", "quantity", "movement_id", "created_at")
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ("id", "date", "branch", "product", "quantity")
+    list_filter = ("branch", "date")
+    search_fields = ("product__name", "product__sku")
+    readonly_fields = ("branch", "product", "date", "quantity", "created_at")
@@ -9,4 +9,9 @@ class ApiConfig(AppConfig):
         """
         Import signals when the app is ready.
         """
+        from django.db.models.signals import post_save
+
         import api.signals  # noqa
+
+        # Last, once every receiver that diffs against loaded values is connected
+        post_save.connect(api.signals.refresh_loaded, dispatch_uid="audit_refresh_loaded")
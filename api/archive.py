@@ -0,0 +1,155 @@
+"""
+Cold storage for AuditLog rows.
+
+Rows older than ``settings.AUDIT_ARCHIVE_AFTER_DAYS`` are moved out of the
+database into one append-only, gzip-compressed JSONL segment per month under
+``settings.AUDIT_ARCHIVE_ROOT``. Each archive run appends a new gzip member,
+so a segment is never rewritten. ``manifest.json`` records, per segment, its
+time range, row count, the models it contains and the (timestamp, id) of
+the last row archived into it. The range and models let queries skip
+segments that can't match.
+
+Archived lines hold the same representation AuditLogSerializer returns, so
+the API serves hot and archived rows in one format.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog
+from .serializers import AuditLogSerializer
+
+MANIFEST = "manifest.json"
+
+
+def archive_root():
+    return settings.AUDIT_ARCHIVE_ROOT
+
+
+def load_manifest():
+    path = os.path.join(archive_root(), MANIFEST)
+    if not os.path.exists(path):
+        return {"segments": {}}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _save_manifest(manifest):
+    path = os.path.join(archive_root(), MANIFEST)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def archive_audit_logs(older_than_days=None, batch_size=5000):
+    """
+    Move audit rows older than the cutoff into monthly segments.
+
+    Works in batches, oldest first: each batch is appended to its segments
+    and the manifest before the rows are deleted in the same transaction.
+    If a run dies between the two, the next run finds those rows again;
+    rows at or before a segment's last archived position are only deleted,
+    not appended twice. (If it dies before the manifest is saved, the rows
+    are appended again, and reads drop the duplicate ids.) Returns the
+    number of rows archived.
+    """
+    days = settings.AUDIT_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    os.makedirs(archive_root(), exist_ok=True)
+    manifest = load_manifest()
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                AuditLog.objects.filter(timestamp__lt=cutoff)
+                .select_related("user")
+                .order_by("timestamp", "id")[:batch_size]
+            )
+            if not batch:
+                break
+            months = {}
+            for entry, row in zip(batch, AuditLogSerializer(batch, many=True).data):
+                months.setdefault(timezone.localtime(entry.timestamp).strftime("%Y-%m"), []).append(row)
+            for month, rows in months.items():
+                _append_segment(manifest, month, rows)
+            _save_manifest(manifest)
+            AuditLog.objects.filter(pk__in=[entry.pk for entry in batch]).delete()
+        archived += len(batch)
+    return archived
+
+
+def _append_segment(manifest, month, rows):
+    segment = manifest["segments"].setdefault(
+        month, {"file": f"audit-{month}.jsonl.gz", "rows": 0, "first": None, "last": None, "models": []}
+    )
+    # Rows come in (timestamp, id) order: ones up to the last position
+    # recorded are already in the segment
+    position = segment.get("archived_to")
+    if position:
+        after = (parse_datetime(position[0]), position[1])
+        rows = [row for row in rows if (parse_datetime(row["timestamp"]), row["id"]) > after]
+    if not rows:
+        return
+    with gzip.open(os.path.join(archive_root(), segment["file"]), "at", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, separators=(",", ":")))
+            fh.write("\n")
+    timestamps = [row["timestamp"] for row in rows]
+    segment["rows"] += len(rows)
+    segment["first"] = min(filter(None, [segment["first"], *timestamps]), key=parse_datetime)
+    segment["last"] = max(filter(None, [segment["last"], *timestamps]), key=parse_datetime)
+    segment["models"] = sorted(set(segment["models"]) | {row["model_name"] for row in rows})
+    segment["archived_to"] = [rows[-1]["timestamp"], rows[-1]["id"]]
+
+
+def query_archive(model_name=None, object_id=None, start=None, end=None, limit=100, position=None, reverse=False):
+    """
+    Archived rows matching the filters, newest first.
+
+    ``start``/``end`` are aware datetimes (inclusive start, exclusive end).
+    ``position`` is a ``(timestamp, id)`` pair: only rows older than it are
+    returned, or with ``reverse`` only rows newer than it, oldest first.
+    Segments are pruned through the manifest before any file is opened.
+    """
+    matches, seen = [], set()
+    for month, segment in sorted(load_manifest()["segments"].items(), reverse=not reverse):
+        if model_name and model_name not in segment["models"]:
+            continue
+        first, last = parse_datetime(segment["first"]), parse_datetime(segment["last"])
+        if (start and last < start) or (end and first >= end):
+            continue
+        if position and (last < position[0] if reverse else first > position[0]):
+            continue
+        needle = None if object_id is None else f'"object_id":{json.dumps(str(object_id))}'
+        with gzip.open(os.path.join(archive_root(), segment["file"]), "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if needle and needle not in line:
+                    continue
+                row = json.loads(line)
+                if row["id"] in seen:
+                    continue
+                if model_name and row["model_name"] != model_name:
+                    continue
+                if object_id is not None and row["object_id"] != str(object_id):
+                    continue
+                timestamp = parse_datetime(row["timestamp"])
+                if (start and timestamp < start) or (end and timestamp >= end):
+                    continue
+                if position and ((timestamp, row["id"]) <= position if reverse else (timestamp, row["id"]) >= position):
+                    continue
+                seen.add(row["id"])
+                matches.append(row)
+        # Segments are monthly and visited in page order: once a full page is
+        # collected, the segments after it can't contribute
+        if len(matches) >= limit:
+            break
+    matches.sort(key=lambda row: (parse_datetime(row["timestamp"]), row["id"]), reverse=not reverse)
+    return matches[:limit]
@@ -0,0 +1,116 @@
+"""
+Buffered audit-log writer.
+
+Events recorded inside a transaction are held in memory and written with a
+single insert when the transaction commits; if it (or the savepoint
+they were recorded in) rolls back they are discarded with it. Events
+recorded in autocommit mode are written straight away.
+
+Which actions are recorded for which model is configured by
+``settings.AUDIT_LOG_MODELS`` ({model name: [actions]}); models that aren't
+listed record every action, and an empty list turns auditing off.
+"""
+import functools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import db_datetime, insert_rows
+from .models import AuditLog
+from .transactions import commit_buffer
+
+
+def is_audited(model_name, action):
+    if model_name == AuditLog.__name__:
+        return False
+    actions = getattr(settings, "AUDIT_LOG_MODELS", {}).get(model_name)
+    return actions is None or action in actions
+
+
+def log(action, model_name, object_id=None, changes=None, user=None, ip_address=None):
+    """
+    Record one audit event; ``changes`` is JSON-encoded if it isn't a string
+    already. ``user`` may be a user, a token user or a user id.
+    """
+    if not is_audited(model_name, action.lower()):
+        return
+    if changes is not None and not isinstance(changes, str):
+        changes = json.dumps(changes, cls=DjangoJSONEncoder, separators=(",", ":"))
+    entry = AuditLog(
+        user_id=getattr(user, "pk", user),
+        action=action,
+        model_name=model_name,
+        object_id=None if object_id is None else str(object_id),
+        changes=changes,
+        ip_address=ip_address,
+    )
+    if transaction.get_connection().in_atomic_block:
+        commit_buffer("audit", list, _write).append(entry)
+    else:
+        _write([entry])
+
+
+def remember_loaded(instance):
+    """Keep the field values an instance was loaded (or last saved) with."""
+    loaded = instance.__dict__.copy()
+    loaded.pop("_audit_loaded", None)
+    instance._audit_loaded = loaded
+
+
+def loaded_value(instance, attname, default=None):
+    """Value ``attname`` had when the instance was loaded (or last saved)."""
+    return getattr(instance, "_audit_loaded", {}).get(attname, default)
+
+
+def snapshot(instance):
+    """Every concrete field of ``instance``, for create and delete events."""
+    return {
+        field.name: _plain(field.value_from_object(instance))
+        for field in instance._meta.concrete_fields
+    }
+
+
+def diff(instance):
+    """
+    Fields changed since the instance was loaded: ``{name: [old, new]}``.
+
+    Deferred fields and ``auto_now`` timestamps are ignored, so a save that
+    only bumps ``updated_at`` yields an empty diff.
+    """
+    loaded = getattr(instance, "_audit_loaded", None)
+    if loaded is None:
+        return snapshot(instance)
+    current = instance.__dict__
+    changes = {}
+    for field in _diffable_fields(type(instance)):
+        attname = field.attname
+        if attname not in loaded or attname not in current:
+            continue
+        old, new = loaded[attname], current[attname]
+        if old != new and (type(old) is type(new) or field.to_python(old) != field.to_python(new)):
+            changes[field.name] = [_plain(old), _plain(new)]
+    return changes
+
+
+@functools.cache
+def _diffable_fields(model):
+    return [field for field in model._meta.concrete_fields if not getattr(field, "auto_now", False)]
+
+
+def _plain(value):
+    # FieldFile (ImageField) isn't JSON serializable; its name is what matters
+    return getattr(value, "name", value) if hasattr(value, "storage") else value
+
+
+AUDIT_COLUMNS = ("user_id", "action", "model_name", "object_id", "changes", "ip_address", "timestamp")
+
+
+def _write(entries):
+    now = db_datetime(timezone.now())
+    insert_rows(AuditLog, AUDIT_COLUMNS, [
+        (entry.user_id, entry.action, entry.model_name, entry.object_id, entry.changes, entry.ip_address or None, now)
+        for entry in entries
+    ])
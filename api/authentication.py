@@ -0,0 +1,101 @@
+"""
+Stateless JWT authentication.
+
+Tokens minted by /api/token/ (and re-minted by /api/token/refresh/) carry
+the user's ``role``, ``branch_id`` and ``username``, so ClaimsJWTAuthentication
+builds the request user from the token instead of loading the CustomUser
+row. Tokens minted before these claims existed still load the row.
+
+When a change makes those claims wrong (role, branch, deactivation or
+deletion), the user's current claims are pinned in the
+``TOKEN_REVOCATION_CACHE`` for one access-token lifetime. Access tokens
+that disagree with them are refused. Once the entry expires, every token
+minted before the change has expired too.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import Branch
+
+CLAIMS = ("role", "branch_id")
+
+
+def user_claims(user):
+    return {"role": user.role, "branch_id": user.branch_id, "username": user.username}
+
+
+def _pinned_key(user_id):
+    return f"token-claims:{user_id}"
+
+
+def pin_claims(user, active=True):
+    """Refuse ``user``'s tokens whose claims differ from the current ones (or all, if inactive)."""
+    caches[settings.TOKEN_REVOCATION_CACHE].set(
+        _pinned_key(user.pk),
+        {"active": active and user.is_active, "role": user.role, "branch_id": user.branch_id},
+        timeout=api_settings.ACCESS_TOKEN_LIFETIME.total_seconds(),
+    )
+
+
+class ClaimsUser(TokenUser):
+    """Request user built from token claims; ``branch`` is loaded only if read."""
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def role(self):
+        return self.token["role"]
+
+    @cached_property
+    def branch_id(self):
+        return self.token["branch_id"]
+
+    @cached_property
+    def branch(self):
+        return Branch.objects.filter(pk=self.branch_id).first() if self.branch_id else None
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in CLAIMS):
+            return super().get_user(validated_token)
+        user = ClaimsUser(validated_token)
+        pinned = caches[settings.TOKEN_REVOCATION_CACHE].get(_pinned_key(user.id))
+        if pinned is not None and (
+            not pinned["active"] or any(pinned[claim] != validated_token[claim] for claim in CLAIMS)
+        ):
+            raise AuthenticationFailed("Token is no longer valid for this user.", code="token_revoked")
+        return user
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token.payload.update(user_claims(user))
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # Claims are copied from the refresh token; restamp them from the user row
+        access = AccessToken(data["access"])
+        user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]})
+        access.payload.update(user_claims(user))
+        data["access"] = str(access)
+        if "refresh" in data:
+            refresh = RefreshToken(data["refresh"])
+            refresh.payload.update(user_claims(user))
+            data["refresh"] = str(refresh)
+        return data
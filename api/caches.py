@@ -0,0 +1,127 @@
+"""
+Caches.
+
+``LRUCache`` is a small thread-safe, size-bounded LRU with an optional TTL
+and tags, so entries can be dropped by what they were built from (e.g. a
+product id) rather than by key. It is per process: invalidation only
+reaches the current worker, and the TTL bounds how stale other workers can
+get.
+
+Catalog versions are random tokens in the shared (file-based) cache, one
+per scope: a branch id, ``"all"`` for unscoped product listings and
+``"branches"`` for the branch list. Cached listings embed the version in
+their key, so bumping it retires every entry built from the old data in
+every worker at once. A bump writes a new token rather than incrementing:
+FileBasedCache.incr is a read then a write, so two workers bumping at once
+could both write the same value and leave a listing cached in between
+live for CATALOG_CACHE_TIMEOUT; a plain set can't be lost that way. Writes
+bump a scope immediately and once more when their transaction commits, so
+a listing another request cached in between (from the old data) is
+retired too.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .transactions import commit_buffer
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._data = OrderedDict()  # key -> (expires, tags, value)
+        self._tags = {}  # tag -> {keys}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, tags=()):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._discard(key)
+            self._data[key] = (expires, tuple(tags), value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._discard(next(iter(self._data)))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _discard(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Barcode/SKU scan results, tagged with the product id and ("code", scanned code)
+scan_cache = LRUCache(
+    maxsize=getattr(settings, "SCAN_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "SCAN_CACHE_TTL", 300),
+)
+
+
+def _version_key(scope):
+    return f"catalog-version:{scope}"
+
+
+def catalog_version(scope):
+    """Current version of a catalog scope."""
+    shared = caches[settings.CATALOG_VERSION_CACHE]
+    version = shared.get(_version_key(scope))
+    if version is None:
+        # add, so workers finding the token lost agree on its replacement
+        shared.add(_version_key(scope), uuid.uuid4().hex, timeout=None)
+        version = shared.get(_version_key(scope))
+    return version
+
+
+def bump_catalog_version(*scopes):
+    shared = caches[settings.CATALOG_VERSION_CACHE]
+    for scope in set(scopes):
+        shared.set(_version_key(scope), uuid.uuid4().hex, timeout=None)
+
+
+def _bump_pending(scopes):
+    bump_catalog_version(*scopes)
+
+
+def bump_catalog_on_commit(*scopes):
+    """Bump ``scopes`` now and again on commit; one commit callback per transaction."""
+    bump_catalog_version(*scopes)
+    if transaction.get_connection().in_atomic_block:
+        commit_buffer("catalog-bumps", set, _bump_pending).update(scopes)
@@ -0,0 +1,14 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Not enough stock."
+    default_code = "insufficient_stock"
+
+
+class ArtifactGone(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "The report file is gone; request the report again."
+    default_code = "artifact_gone"
@@ -0,0 +1,204 @@
+"""
+Ledger report PDFs.
+
+Entries are read ``EXPORT_CHUNK_SIZE`` at a time with
+``.values_list().iterator()`` and drawn onto A4 pages. Every page places
+the same template (title, filters, column headings and rules), drawn once
+as a PDF form; each page adds the balance brought forward, its rows, the
+totals carried forward and its number. Debits, credits and the running
+balance (credits less debits, starting from the balance before the
+report) are kept as the rows go by, so no more than one chunk of entries
+is held at a time. reportlab keeps a canvas's pages until ``save()``, so
+pages are drawn ``BATCH_PAGES`` to a canvas and each finished batch is
+appended to the output (``pdfjoin``). Memory is bounded by one batch
+(about 20 KB of drawing operators per page, ~4 MiB) plus one chunk of
+entries, and a few bytes of cross-reference per page.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .exports import within
+from .models import Branch, LedgerEntry
+from .pdfjoin import PdfJoiner
+
+FIELDS = ("date", "reference", "description", "transaction_type", "amount")
+PAGE_COMPRESSION = 1
+# Pages drawn per reportlab canvas before they are written out (see pdfjoin)
+BATCH_PAGES = 200
+FONT, BOLD, SIZE = "Helvetica", "Helvetica-Bold", 8
+MARGIN = 40
+ROW_HEIGHT = 13
+TEMPLATE = "ledger-page"
+# (heading, left edge, width); amounts are right-aligned within their width
+COLUMNS = {
+    "date": ("Date", 40, 70),
+    "reference": ("Reference", 112, 64),
+    "description": ("Description", 178, 163),
+    "debit": ("Debit", 343, 68),
+    "credit": ("Credit", 413, 68),
+    "balance": ("Balance", 483, 72),
+}
+AMOUNTS = ("debit", "credit", "balance")
+
+
+def balance(entries):
+    """Credits less debits over ``entries``."""
+    totals = entries.aggregate(
+        credit=Sum("amount", filter=Q(transaction_type="credit")),
+        debit=Sum("amount", filter=Q(transaction_type="debit")),
+    )
+    return (totals["credit"] or 0) - (totals["debit"] or 0)
+
+
+def render(out, start=None, end=None, branch=None):
+    """The ledger report of ``branch`` (None: all) from ``start`` to ``end`` (whole days); returns the page count."""
+    entries = within(LedgerEntry.objects.all(), "date", "branch_id", start, end, branch)
+    opening = 0
+    if start:
+        before = within(LedgerEntry.objects.all(), "date", "branch_id", end=start - timedelta(days=1), branch=branch)
+        opening = balance(before)
+    name = Branch.objects.filter(pk=branch).values_list("name", flat=True).first() if branch is not None else None
+    subtitle = " · ".join([
+        name or "All branches",
+        f"{start or 'First entry'} to {end or timezone.localdate()}",
+        f"Printed {timezone.localtime():%Y-%m-%d %H:%M}",
+    ])
+    return LedgerReport(out, "Ledger report", subtitle, opening).write(entries)
+
+
+def _fit(text, width):
+    """``text`` cut short (with an ellipsis) to fit ``width`` points."""
+    text = " ".join((text or "").split())
+    full = stringWidth(text, FONT, SIZE)
+    if full <= width:
+        return text
+    text = text[: int(len(text) * width / full)]
+    while text and stringWidth(text + "…", FONT, SIZE) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+class LedgerReport:
+    """Draws ledger rows onto a PDF written to ``out``; ``write`` returns the page count."""
+
+    def __init__(self, out, title, subtitle, opening=Decimal("0")):
+        self.joiner = PdfJoiner(out)
+        self.title, self.subtitle = title, subtitle
+        self.width, self.height = A4
+        self.top, self.bottom = self.height - MARGIN - 64, MARGIN + 2 * ROW_HEIGHT
+        self.balance = Decimal(opening)
+        self.debit = self.credit = Decimal("0")
+        self.pages = 0
+        self._new_batch()
+
+    def write(self, entries):
+        self._start_page()
+        rows = entries.order_by("date", "pk").values_list(*FIELDS)
+        for row in rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            self._entry(*row)
+        self._totals("Closing balance", BOLD, self._next_line())
+        self._end_page()
+        self._end_batch()
+        self.joiner.close()
+        return self.pages
+
+    def _new_batch(self):
+        self.batch = BytesIO()
+        self.canvas = canvas.Canvas(self.batch, pagesize=A4, pageCompression=PAGE_COMPRESSION)
+        self.canvas.setTitle(self.title)
+        self._draw_template()
+
+    def _end_batch(self):
+        self.canvas.save()
+        self.joiner.add(self.batch.getvalue())
+
+    def _draw_template(self):
+        title, subtitle = self.title, self.subtitle
+        c, top = self.canvas, self.height - MARGIN
+        c.beginForm(TEMPLATE)
+        c.setFont(BOLD, 14)
+        c.drawString(MARGIN, top - 14, title)
+        c.setFont(FONT, SIZE)
+        c.drawString(MARGIN, top - 28, subtitle)
+        c.setFont(BOLD, SIZE)
+        for key, (heading, x, width) in COLUMNS.items():
+            if key in AMOUNTS:
+                c.drawRightString(x + width, top - 48, heading)
+            else:
+                c.drawString(x, top - 48, heading)
+        c.line(MARGIN, top - 52, self.width - MARGIN, top - 52)
+        c.line(MARGIN, MARGIN + ROW_HEIGHT + 4, self.width - MARGIN, MARGIN + ROW_HEIGHT + 4)
+        c.endForm()
+
+    def _next_line(self):
+        if self.y < self.bottom:
+            self._end_page("Carried forward")
+            self._start_page()
+        y = self.y
+        self.y -= ROW_HEIGHT
+        return y
+
+    def _start_page(self):
+        if self.pages and self.pages % BATCH_PAGES == 0:
+            self._end_batch()
+            self._new_batch()
+        self.pages += 1
+        self.canvas.doForm(TEMPLATE)
+        # All of a page's cells go into one text object
+        self.text = self.canvas.beginText()
+        self.font = None
+        self.y = self.top
+        self._totals("Brought forward" if self.pages > 1 else "Opening balance", FONT, self.y)
+        self.y -= ROW_HEIGHT
+
+    def _end_page(self, label=None):
+        if label:
+            self._totals(label, BOLD, MARGIN + 4)
+        self._set_font(FONT)
+        page_number = f"Page {self.pages}"
+        self.text.setTextOrigin((self.width - stringWidth(page_number, FONT, SIZE)) / 2, MARGIN - 16)
+        self.text.textOut(page_number)
+        self.canvas.drawText(self.text)
+        self.canvas.showPage()
+
+    def _set_font(self, font):
+        if font != self.font:
+            self.text.setFont(font, SIZE)
+            self.font = font
+
+    def _cell(self, key, text, y):
+        _, x, width = COLUMNS[key]
+        if key in AMOUNTS:
+            x += width - stringWidth(text, self.font, SIZE)
+        self.text.setTextOrigin(x, y)
+        self.text.textOut(text)
+
+    def _totals(self, label, font, y):
+        self._set_font(font)
+        self._cell("reference", label, y)
+        self._cell("debit", f"{self.debit:,.2f}", y)
+        self._cell("credit", f"{self.credit:,.2f}", y)
+        self._cell("balance", f"{self.balance:,.2f}", y)
+
+    def _entry(self, date, reference, description, transaction_type, amount):
+        y = self._next_line()
+        self._set_font(FONT)
+        self._cell("date", timezone.localtime(date).strftime("%Y-%m-%d %H:%M"), y)
+        self._cell("reference", _fit(reference, COLUMNS["reference"][2] - 4), y)
+        self._cell("description", _fit(description, COLUMNS["description"][2] - 4), y)
+        if transaction_type == "debit":
+            self.debit += amount
+            self.balance -= amount
+        else:
+            self.credit += amount
+            self.balance += amount
+        self._cell("debit" if transaction_type == "debit" else "credit", f"{amount:,.2f}", y)
+        self._cell("balance", f"{self.balance:,.2f}", y)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_audit_logs
+
+
+class Command(BaseCommand):
+    help = "Move old AuditLog rows into compressed monthly archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.AUDIT_ARCHIVE_AFTER_DAYS,
+            help="Archive rows older than this many days.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        archived = archive_audit_logs(options["days"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} audit log row(s)."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollup from Sale and SaleItem rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to recompute (YYYY-MM-DD); defaults to the first sale.")
+        parser.add_argument("--end", help="Last day to recompute (YYYY-MM-DD); defaults to the last sale.")
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ("start", "end"):
+            if options[name]:
+                bounds[name] = parse_date(options[name])
+                if bounds[name] is None:
+                    raise CommandError(f"--{name} must use the YYYY-MM-DD format.")
+        written = backfill(**bounds)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup row(s)."))
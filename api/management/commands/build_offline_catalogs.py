@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Branch
+from api.offline_catalog import build_catalog
+
+
+class Command(BaseCommand):
+    help = "Build the offline SQLite catalog of every branch whose catalog changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branch", type=int, help="Only build this branch id.")
+        parser.add_argument("--force", action="store_true", help="Rebuild even if the version is unchanged.")
+
+    def handle(self, *args, **options):
+        branch_ids = [options["branch"]] if options["branch"] else Branch.objects.values_list("pk", flat=True)
+        for branch_id in branch_ids:
+            path, version = build_catalog(branch_id, force=options["force"])
+            self.stdout.write(f"Branch {branch_id}: {path.name} ({path.stat().st_size:,} bytes)")
+        self.stdout.write(self.style.SUCCESS("Offline catalogs are up to date."))
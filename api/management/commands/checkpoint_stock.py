@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.stock import checkpoint_stock
+
+
+class Command(BaseCommand):
+    help = "Record a stock checkpoint for every product that moved since its last one."
+
+    def handle(self, *args, **options):
+        created = checkpoint_stock()
+        self.stdout.write(self.style.SUCCESS(f"Recorded {created} stock checkpoint(s)."))
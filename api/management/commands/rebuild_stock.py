@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.stock import rebuild_on_hand, verify_on_hand
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.quantity from stock checkpoints and movements."
+
+    def add_arguments(self, parser):
+        parser.add_argument("products", nargs="*", type=int, help="Limit to these product ids.")
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report products whose quantity disagrees with the movement log.",
+        )
+
+    def handle(self, *args, **options):
+        product_ids = options["products"] or None
+        if options["verify"]:
+            mismatches = verify_on_hand(product_ids)
+            for row in mismatches:
+                self.stdout.write(
+                    f"{row['product']} {row['name']}: recorded {row['recorded']}, computed {row['computed']}"
+                )
+            style = self.style.WARNING if mismatches else self.style.SUCCESS
+            self.stdout.write(style(f"{len(mismatches)} mismatched product(s)."))
+            return
+
+        result = rebuild_on_hand(product_ids)
+        self.stdout.write(self.style.SUCCESS(f"Updated {result['updated']} product(s)."))
+        if result["negative"]:
+            ids = ", ".join(map(str, result["negative"]))
+            self.stdout.write(self.style.WARNING(f"Movement log is negative for product(s) {ids}; left unchanged."))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.reports import run_pending
+
+
+class Command(BaseCommand):
+    help = "Render queued report jobs, including ones left behind by a stopped worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when empty.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            ran = run_pending(limit=1)
+            total += ran
+            if ran:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Rendered {total} report(s)."))
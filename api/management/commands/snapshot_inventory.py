@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.stock import snapshot_inventory
+
+
+class Command(BaseCommand):
+    help = "Record each product's end-of-day quantity (defaults to yesterday)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Day to snapshot, YYYY-MM-DD.")
+        parser.add_argument("--branch", type=int, help="Only snapshot this branch id.")
+
+    def handle(self, *args, **options):
+        if options["date"]:
+            day = parse_date(options["date"])
+            if day is None:
+                raise CommandError("Use the YYYY-MM-DD format for --date.")
+        else:
+            day = timezone.localdate() - timedelta(days=1)
+
+        total = snapshot_inventory(day, options["branch"])
+        self.stdout.write(self.style.SUCCESS(f"Recorded {total} inventory snapshot(s) for {day}."))
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_checkpoints(apps, schema_editor):
+    # Existing quantities become the opening balance as of the latest movement
+    Product = apps.get_model('api', 'Product')
+    StockCheckpoint = apps.get_model('api', 'StockCheckpoint')
+    StockMovement = apps.get_model('api', 'StockMovement')
+    upto = StockMovement.objects.aggregate(last=models.Max('id'))['last'] or 0
+    StockCheckpoint.objects.bulk_create(
+        (
+            StockCheckpoint(product_id=pk, quantity=quantity, movement_id=upto)
+            for pk, quantity in Product.objects.values_list('pk', 'quantity').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_auditlog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('movement_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Checkpoint',
+                'verbose_name_plural': 'Stock Checkpoints',
+                'ordering': ['-movement_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'id'], name='api_stockmo_product_44d8bd_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockcheckpoint',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='api.product'),
+        ),
+        migrations.AddIndex(
+            model_name='stockcheckpoint',
+            index=models.Index(fields=['product', '-movement_id'], name='api_stockch_product_3367ba_idx'),
+        ),
+        migrations.RunPython(open_checkpoints, migrations.RunPython.noop),
+    ]
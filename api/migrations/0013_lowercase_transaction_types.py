@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.models.functions import Lower, Now
+
+
+def lowercase_transaction_types(apps, schema_editor):
+    # Purchases and sales stored "Debit" / "Credit" rather than the choice keys
+    LedgerEntry = apps.get_model("api", "LedgerEntry")
+    LedgerEntry.objects.filter(transaction_type__in=["Debit", "Credit"]).update(
+        transaction_type=Lower("transaction_type"), updated_at=Now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_report_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_transaction_types, migrations.RunPython.noop),
+    ]
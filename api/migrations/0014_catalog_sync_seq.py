@@ -0,0 +1,103 @@
+from django.db import migrations, models
+
+# Catalog sync positions. A single-row counter is bumped by triggers on every
+# product insert/update and tombstone insert, and the row takes the new value.
+# The counter is written under the database write lock, which SQLite holds
+# until commit (transactions BEGIN IMMEDIATE), so values become visible in
+# commit order and a row can never land behind a cursor a till already holds.
+# The trigger's own UPDATE does not fire it again: recursive_triggers is off.
+CREATE = [
+    "CREATE TABLE api_catalog_seq (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)",
+    "UPDATE api_product SET sync_seq = id",
+    "UPDATE api_producttombstone SET sync_seq = id + (SELECT COALESCE(MAX(id), 0) FROM api_product)",
+    """
+    INSERT INTO api_catalog_seq (id, value)
+    SELECT 1, MAX(COALESCE((SELECT MAX(sync_seq) FROM api_product), 0),
+                  COALESCE((SELECT MAX(sync_seq) FROM api_producttombstone), 0))
+    """,
+    """
+    CREATE TRIGGER api_product_sync_seq_insert AFTER INSERT ON api_product BEGIN
+        UPDATE api_catalog_seq SET value = value + 1;
+        UPDATE api_product SET sync_seq = (SELECT value FROM api_catalog_seq) WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_product_sync_seq_update AFTER UPDATE ON api_product BEGIN
+        UPDATE api_catalog_seq SET value = value + 1;
+        UPDATE api_product SET sync_seq = (SELECT value FROM api_catalog_seq) WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_producttombstone_sync_seq_insert AFTER INSERT ON api_producttombstone BEGIN
+        UPDATE api_catalog_seq SET value = value + 1;
+        UPDATE api_producttombstone SET sync_seq = (SELECT value FROM api_catalog_seq) WHERE id = new.id;
+    END
+    """,
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS api_producttombstone_sync_seq_insert",
+    "DROP TRIGGER IF EXISTS api_product_sync_seq_update",
+    "DROP TRIGGER IF EXISTS api_product_sync_seq_insert",
+    "DROP TABLE IF EXISTS api_catalog_seq",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+def add_column(table):
+    # ADD COLUMN keeps the table; AddField would rebuild it on SQLite and drop
+    # the FTS triggers of 0009 with it
+    return migrations.RunSQL(
+        f'ALTER TABLE "{table}" ADD COLUMN "sync_seq" bigint NOT NULL DEFAULT 0',
+        f'ALTER TABLE "{table}" DROP COLUMN "sync_seq"',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_lowercase_transaction_types'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[add_column("api_product"), add_column("api_producttombstone")],
+            state_operations=[
+                migrations.AddField(
+                    model_name='product',
+                    name='sync_seq',
+                    field=models.BigIntegerField(default=0, editable=False),
+                ),
+                migrations.AddField(
+                    model_name='producttombstone',
+                    name='sync_seq',
+                    field=models.BigIntegerField(default=0, editable=False),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['branch', 'sync_seq'], name='api_product_branch__4e07bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sync_seq'], name='api_product_sync_se_0ebfc4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producttombstone',
+            index=models.Index(fields=['branch', 'sync_seq'], name='api_product_branch__063d7b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producttombstone',
+            index=models.Index(fields=['sync_seq'], name='api_product_sync_se_2bcab4_idx'),
+        ),
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
@@ -1,9 +1,10 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, Sum
 from django.contrib.auth.models import AbstractUser, Group, Permission
 import uuid
+from decimal import Decimal
 
 
 class Branch(models.Model):
@@ -49,11 +50,18 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Catalog sync position, set by a database trigger on every write (migration 0014)
+    sync_seq = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ["-updated_at"]
         indexes = [
             models.Index(fields=["barcode"]),
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["branch", "updated_at", "id"]),
+            models.Index(fields=["updated_at", "id"]),
+            models.Index(fields=["branch", "sync_seq"]),
+            models.Index(fields=["sync_seq"]),
         ]
         constraints = [
             models.CheckConstraint(check=Q(quantity__gte=0), name="product_qty_nonnegative"),
@@ -77,6 +85,9 @@ class Vendor(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+        ]
         verbose_name = "Vendor"
         verbose_name_plural = "Vendors"
 
@@ -103,18 +114,22 @@ class Purchase(models.Model):
         related_name="purchases_created",
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     notes = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+        ]
 
     def __str__(self):
         return f"Purchase {self.invoice_no} - {self.vendor or 'Unknown Vendor'}"
 
     def calculate_totals(self):
-        self.subtotal = sum(item.total_price for item in self.items.all())
+        self.subtotal = self.items.aggregate(total=Sum("total_price"))["total"] or Decimal("0.00")
         self.total_amount = self.subtotal - self.discount
-        self.save()
+        self.save(update_fields=["subtotal", "total_amount", "updated_at"])
 
 
 class PurchaseItem(models.Model):
@@ -124,6 +139,7 @@ class PurchaseItem(models.Model):
     quantity = models.PositiveIntegerField()
     unit_cost = models.DecimalField(max_digits=12, decimal_places=2)
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-id"]
@@ -160,18 +176,22 @@ class Sale(models.Model):
         related_name="sales_created",
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     notes = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_no} - {self.customer_name or 'Walk-in Customer'}"
 
     def calculate_totals(self):
-        self.subtotal = sum(item.total_price for item in self.items.all())
+        self.subtotal = self.items.aggregate(total=Sum("total_price"))["total"] or Decimal("0.00")
         self.total_amount = self.subtotal - self.discount
-        self.save()
+        self.save(update_fields=["subtotal", "total_amount", "updated_at"])
 
 
 class SaleItem(models.Model):
@@ -181,6 +201,7 @@ class SaleItem(models.Model):
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-id"]
@@ -197,6 +218,42 @@ class SaleItem(models.Model):
         return f"{self.product_name or self.product} x {self.quantity}"
 
 
+class DailySalesRollup(models.Model):
+    """
+    Sales totals per day, branch, payment method and cashier, kept current
+    inside each sale's transaction (api/rollups.py) so reports never scan
+    Sale. ``backfill_sales_rollup`` rebuilds it from the sales.
+    """
+
+    day = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    payment_method = models.CharField(max_length=50, blank=True, default="")
+    cashier = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    sale_count = models.IntegerField(default=0)
+    item_quantity = models.IntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["-day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "branch", "payment_method", "cashier"], name="unique_daily_sales_rollup"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["branch", "day"]),
+        ]
+        verbose_name = "Daily Sales Rollup"
+        verbose_name_plural = "Daily Sales Rollups"
+
+    def __str__(self):
+        return f"{self.day} {self.branch or 'No branch'} {self.payment_method or '-'}: {self.total_amount}"
+
+
 # ---------------- Ledger & Stock ----------------
 class LedgerEntry(models.Model):
     TRANSACTION_TYPES = (
@@ -216,9 +273,13 @@ class LedgerEntry(models.Model):
         null=True,
         blank=True,
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-date"]
+        indexes = [
+            models.Index(fields=["date", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type} - {self.amount}"
@@ -249,10 +310,17 @@ class StockMovement(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["product", "id"]),
+            models.Index(fields=["created_at", "id"]),
+        ]
         verbose_name = "Stock Movement"
         verbose_name_plural = "Stock Movements"
 
     def save(self, *args, **kwargs):
+        # Movements are an append-only event log; corrections are new movements
+        if not self._state.adding:
+            raise ValueError("Stock movements are append-only and can't be changed once saved.")
         if not self.reference:
             self.reference = f"{self.movement_type}-{uuid.uuid4().hex[:8].upper()}"
         super().save(*args, **kwargs)
@@ -261,6 +329,154 @@ class StockMovement(models.Model):
         return f"{self.product} {self.movement_type} {self.quantity}"
 
 
+class StockCheckpoint(models.Model):
+    """
+    On-hand quantity of a product after every movement with id <= movement_id.
+
+    Current stock is the latest checkpoint plus the movements after it. A
+    checkpoint with movement_id 0 is the opening balance of a new product.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="checkpoints")
+    quantity = models.IntegerField()
+    movement_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-movement_id"]
+        indexes = [
+            models.Index(fields=["product", "-movement_id"]),
+        ]
+        verbose_name = "Stock Checkpoint"
+        verbose_name_plural = "Stock Checkpoints"
+
+    def __str__(self):
+        return f"{self.product} = {self.quantity} @ movement {self.movement_id}"
+
+
+class InventorySnapshot(models.Model):
+    """Quantity of a product at the end of ``date``, written daily by snapshot_inventory."""
+
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, related_name="inventory_snapshots")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="inventory_snapshots")
+    date = models.DateField()
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "date"], name="unique_product_snapshot_date"),
+        ]
+        indexes = [
+            models.Index(fields=["branch", "date"]),
+            models.Index(fields=["date"]),
+        ]
+        verbose_name = "Inventory Snapshot"
+        verbose_name_plural = "Inventory Snapshots"
+
+    def __str__(self):
+        return f"{self.product} = {self.quantity} on {self.date}"
+
+
+class ProductTombstone(models.Model):
+    """Left behind by a deleted product so catalog sync can tell tills to drop it."""
+
+    product_id = models.BigIntegerField()
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True)
+    sku = models.CharField(max_length=100)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    sync_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        ordering = ["-deleted_at"]
+        indexes = [
+            models.Index(fields=["branch", "deleted_at", "id"]),
+            models.Index(fields=["deleted_at", "id"]),
+            models.Index(fields=["branch", "sync_seq"]),
+            models.Index(fields=["sync_seq"]),
+        ]
+        verbose_name = "Product Tombstone"
+        verbose_name_plural = "Product Tombstones"
+
+    def __str__(self):
+        return f"{self.sku} deleted {self.deleted_at}"
+
+
+# ---------------- Outbox ----------------
+class OutboxMessage(models.Model):
+    """Notification mail written in the business transaction and sent later by drain_outbox."""
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.TextField(help_text="Comma-separated recipient addresses")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+
+# ---------------- Report jobs ----------------
+class ReportJob(models.Model):
+    """A report rendered off the request by the local worker pool (see api.reports)."""
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+        ("expired", "Expired"),
+    )
+
+    kind = models.CharField(max_length=30)
+    params = models.JSONField(default=dict)
+    # Branch the report is limited to (None: every branch)
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    fingerprint = models.CharField(max_length=64, help_text="Kind, parameters and version of the data read")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    artifact = models.FileField(upload_to="reports/", blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["fingerprint"]),
+            models.Index(fields=["status", "started_at"]),
+        ]
+        verbose_name = "Report Job"
+        verbose_name_plural = "Report Jobs"
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
 # ---------------- Audit & Users ----------------
 class AuditLog(models.Model):
     user = models.ForeignKey(
@@ -278,6 +494,10 @@ class AuditLog(models.Model):
 
     class Meta:
         ordering = ["-timestamp"]
+        indexes = [
+            models.Index(fields=["timestamp", "id"]),
+            models.Index(fields=["model_name", "object_id"]),
+        ]
         verbose_name = "Audit Log"
         verbose_name_plural = "Audit Logs"
 
@@ -296,6 +516,7 @@ class CustomUser(AbstractUser):
     role = models.CharField(max_length=30, choices=ROLE_CHOICES, default="cashier")
     branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True)
     phone = models.CharField(max_length=30, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # ✅ prevent clashes with auth.User
     groups = models.ManyToManyField(Group, related_name="customuser_set", blank=True)
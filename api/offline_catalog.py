@@ -0,0 +1,116 @@
+"""
+Prebuilt per-branch SQLite catalogs for offline tills.
+
+Each file holds the branch's active products with a barcode index, so tills
+can look up scans locally. Files are cached under OFFLINE_CATALOG_ROOT and
+named after the branch catalog's fingerprint; a build is only done when
+that fingerprint changes. (This is not ``caches.catalog_version``, the
+per-scope token that retires cached listings.)
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Product, ProductTombstone
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY,
+    sku TEXT NOT NULL,
+    barcode TEXT,
+    name TEXT NOT NULL,
+    price TEXT NOT NULL,
+    quantity INTEGER NOT NULL
+);
+"""
+
+
+def catalog_root():
+    return Path(settings.OFFLINE_CATALOG_ROOT)
+
+
+def fingerprint(branch_id):
+    """
+    Hash of the branch's product count, latest update and latest deletion.
+    Changes whenever a product of the branch is created, updated,
+    deactivated or deleted: two index-backed aggregates, no table scan.
+    """
+    products = Product.objects.filter(branch_id=branch_id).aggregate(count=Count("id"), updated=Max("updated_at"))
+    deleted = ProductTombstone.objects.filter(branch_id=branch_id).aggregate(last=Max("id"))["last"]
+    key = f"{branch_id}:{products['count']}:{products['updated']}:{deleted}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def catalog_path(branch_id, fingerprint):
+    return catalog_root() / f"branch-{branch_id}-{fingerprint}.sqlite3"
+
+
+def build_catalog(branch_id, force=False):
+    """Return ``(path, fingerprint)`` of the branch's current catalog, building it if needed."""
+    current = fingerprint(branch_id)
+    path = catalog_path(branch_id, current)
+    if path.exists() and not force:
+        return path, current
+
+    root = catalog_root()
+    root.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=f".branch-{branch_id}-", suffix=".sqlite3")
+    os.close(fd)
+    try:
+        db = sqlite3.connect(tmp)
+        try:
+            db.execute("PRAGMA journal_mode = OFF")
+            db.executescript(SCHEMA)
+            rows = (
+                Product.objects.filter(branch_id=branch_id, is_active=True)
+                .order_by("id")
+                .values_list("id", "sku", "barcode", "name", "price", "quantity")
+                .iterator(chunk_size=5000)
+            )
+            db.executemany(
+                "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)",
+                ((pk, sku, barcode or None, name, str(price), quantity) for pk, sku, barcode, name, price, quantity in rows),
+            )
+            db.execute("CREATE INDEX products_barcode ON products (barcode)")
+            db.execute("CREATE UNIQUE INDEX products_sku ON products (sku)")
+            db.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [("branch", str(branch_id)), ("version", current), ("built_at", timezone.now().isoformat())],
+            )
+            db.commit()
+            db.execute("VACUUM")
+        finally:
+            db.close()
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+    # Older builds of this branch's catalog are no longer served
+    for stale in root.glob(f"branch-{branch_id}-*.sqlite3"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return path, current
+
+
+def open_catalog(branch_id):
+    """
+    ``(file, fingerprint)`` of the branch's current catalog, opened for reading.
+
+    A concurrent build of a newer catalog deletes the older file; once it is
+    open the download survives that, and if it went first the newer catalog
+    is built (or picked up) and opened instead.
+    """
+    while True:
+        path, current = build_catalog(branch_id)
+        try:
+            return open(path, "rb"), current
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,89 @@
+import logging
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FROM_EMAIL = "noreply@retailm.com"
+ADMIN_RECIPIENTS = ["admin@retailm.com"]
+
+
+def enqueue_mail(subject, message, recipient_list=None, from_email=DEFAULT_FROM_EMAIL):
+    """
+    Queue a mail in the caller's transaction.
+
+    Nothing is sent here: the row only becomes visible to ``drain_outbox``
+    once the surrounding transaction commits, and disappears with it on rollback.
+    """
+    return OutboxMessage.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email,
+        recipients=",".join(recipient_list or ADMIN_RECIPIENTS),
+    )
+
+
+def drain(batch_size=100, max_attempts=5, retry_delay=60, lease=300):
+    """
+    Send one batch of due messages over a single mail connection.
+
+    Claimed rows are leased for ``lease`` seconds so concurrent drains skip
+    them, and a crashed drain's rows become due again afterwards. A failed
+    send is retried with exponential backoff starting at ``retry_delay``
+    seconds and marked failed after ``max_attempts``. Returns ``(sent, failed)``.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=lease)
+    due = OutboxMessage.objects.filter(status="pending", available_at__lte=now)
+    ids = list(due.values_list("pk", flat=True)[:batch_size])
+    if not ids:
+        return 0, 0
+    due.filter(pk__in=ids).update(available_at=lease_until)
+    batch = list(OutboxMessage.objects.filter(pk__in=ids, available_at=lease_until))
+
+    sent, failed = [], 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        # Server unreachable: every leased message takes the failed attempt
+        logger.warning("Could not open the mail connection: %s", exc)
+        for message in batch:
+            _record_failure(message, exc, max_attempts, retry_delay)
+        return 0, len(batch)
+    try:
+        for message in batch:
+            email = EmailMessage(
+                subject=message.subject,
+                body=message.body,
+                from_email=message.from_email,
+                to=message.recipients.split(","),
+                connection=connection,
+            )
+            try:
+                email.send()
+            except Exception as exc:
+                failed += 1
+                _record_failure(message, exc, max_attempts, retry_delay)
+            else:
+                sent.append(message.pk)
+    finally:
+        connection.close()
+
+    OutboxMessage.objects.filter(pk__in=sent).update(status="sent", sent_at=timezone.now())
+    return len(sent), failed
+
+
+def _record_failure(message, exc, max_attempts, retry_delay):
+    message.attempts += 1
+    message.last_error = str(exc)
+    if message.attempts >= max_attempts:
+        message.status = "failed"
+        logger.error("Giving up on outbox message %s: %s", message.pk, exc)
+    else:
+        message.available_at = timezone.now() + timedelta(seconds=retry_delay * 2 ** (message.attempts - 1))
+    message.save(update_fields=["attempts", "last_error", "status", "available_at"])
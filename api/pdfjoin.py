@@ -0,0 +1,110 @@
+"""
+One PDF written from several, a part at a time.
+
+reportlab keeps every page of a canvas until ``save()``, so a long report is
+drawn as a series of short PDFs instead and ``PdfJoiner`` appends each
+one's pages to ``out`` as soon as it is finished. Only the byte offset of
+every object written is kept, for the cross-reference table at the end.
+
+The parts must be what reportlab writes: a classic ``xref`` table, every
+object at the offset it lists and followed by the next one, no object
+streams. Each part's catalog, page tree and info dictionary are dropped
+(the first part's info dictionary is kept) and its pages hung under one
+page tree written last.
+"""
+import re
+
+HEADER = b"%PDF-1.3\n%\x93\x8c\x8b\x9e\n"
+REFERENCE = re.compile(rb"(\d+) 0 R\b")
+OBJECT = re.compile(rb"\d+ 0 obj\r?\n")
+STREAM = re.compile(rb"stream\r?\n")
+# Object numbers of the page tree and catalog, written last
+PAGES, CATALOG = 1, 2
+
+
+def _trailer_ref(pdf, key):
+    return int(re.search(rb"/" + key + rb" (\d+) 0 R", pdf[pdf.rindex(b"trailer"):]).group(1))
+
+
+def _offsets(pdf):
+    """Object number -> offset, from the part's xref table."""
+    start = int(pdf[pdf.rindex(b"startxref") + 9:].split()[0])
+    lines = pdf[start:pdf.index(b"trailer", start)].split(b"\n")
+    first, count = (int(value) for value in lines[1].split())
+    offsets = {}
+    for number, line in enumerate(lines[2:2 + count], first):
+        offset, _, kind = line.split()[:3]
+        if kind == b"n":
+            offsets[number] = int(offset)
+    return offsets, start
+
+
+class PdfJoiner:
+    def __init__(self, out):
+        self.out = out
+        self.offsets = {}
+        self.kids = []
+        self.info = None
+        self.position = 0
+        self._write(HEADER)
+
+    def _write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+    def add(self, pdf):
+        """Append the pages of the PDF ``pdf`` (bytes)."""
+        offsets, xref = _offsets(pdf)
+        root, info = _trailer_ref(pdf, b"Root"), _trailer_ref(pdf, b"Info")
+        ends = dict(zip(sorted(offsets.values()), sorted(offsets.values())[1:] + [xref]))
+
+        def body(number):
+            data = pdf[offsets[number]:ends[offsets[number]]]
+            data = data[OBJECT.match(data).end():]
+            return data[:data.rindex(b"endobj")].rstrip()
+
+        pages = int(re.search(rb"/Pages (\d+) 0 R", body(root)).group(1))
+        kids = [int(number) for number in REFERENCE.findall(re.search(rb"/Kids \[(.*?)\]", body(pages), re.S).group(1))]
+        dropped = {root, pages, info}
+        numbers = {PAGES: PAGES}
+        base = max(max(self.offsets, default=CATALOG), CATALOG)
+        for number in sorted(offsets):
+            if number not in dropped:
+                base += 1
+                numbers[number] = base
+        numbers[pages] = PAGES
+
+        def renumber(text):
+            return REFERENCE.sub(lambda match: b"%d 0 R" % numbers[int(match.group(1))], text)
+
+        if self.info is None:
+            self.info = body(info)
+        for number in sorted(offsets):
+            if number in dropped:
+                continue
+            data = body(number)
+            stream = STREAM.search(data)
+            if stream:
+                # Only the dictionary holds references; the stream is copied as is
+                data = renumber(data[:stream.start()]) + data[stream.start():]
+            else:
+                data = renumber(data)
+            self._object(numbers[number], data)
+        self.kids.extend(numbers[number] for number in kids)
+
+    def close(self):
+        """Write the page tree, catalog, info and cross-reference table."""
+        kids = b" ".join(b"%d 0 R" % number for number in self.kids)
+        self._object(PAGES, b"<< /Count %d /Kids [ %s ] /Type /Pages >>" % (len(self.kids), kids))
+        self._object(CATALOG, b"<< /PageMode /UseNone /Pages %d 0 R /Type /Catalog >>" % PAGES)
+        info = max(self.offsets) + 1
+        self._object(info, self.info or b"<< >>")
+        xref = self.position
+        lines = [b"xref", b"0 %d" % (info + 1), b"0000000000 65535 f "]
+        lines += [b"%010d 00000 n " % self.offsets[number] for number in range(1, info + 1)]
+        self._write(b"\n".join(lines) + b"\n")
+        self._write(b"trailer\n<< /Info %d 0 R /Root %d 0 R /Size %d >>\nstartxref\n%d\n%%%%EOF\n" % (info, CATALOG, info + 1, xref))
@@ -89,9 +89,9 @@ class BranchOrReadOnly(BasePermission):
             return True
         if request.user.role == 'admin':
             return True
-        user_branch = getattr(request.user, 'branch', None)
-        obj_branch = getattr(obj, 'branch', None)
-        return user_branch and obj_branch and user_branch.id == obj_branch.id
+        user_branch = getattr(request.user, 'branch_id', None)
+        obj_branch = getattr(obj, 'branch_id', None)
+        return bool(user_branch and obj_branch and user_branch == obj_branch)
 
 
 class OwnerOrReadOnly(BasePermission):
@@ -99,7 +99,7 @@ class OwnerOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in SAFE_METHODS:
             return True
-        return hasattr(obj, 'created_by') and obj.created_by == request.user
+        return hasattr(obj, 'created_by_id') and obj.created_by_id == request.user.pk
 
 
 class IsSelfOrAdmin(BasePermission):
@@ -107,7 +107,7 @@ class IsSelfOrAdmin(BasePermission):
     def has_object_permission(self, request, view, obj):
         return (
             request.user.is_authenticated and (
-                obj == request.user or request.user.role == 'admin'
+                obj.pk == request.user.pk or request.user.role == 'admin'
             )
         )
 
@@ -118,12 +118,12 @@ class BranchRestrictedAccess(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.role == 'admin':
             return True
-        user_branch = request.user.branch
-        obj_branch = getattr(obj, 'branch', None)
+        user_branch = request.user.branch_id
+        obj_branch = getattr(obj, 'branch_id', None)
         if obj_branch and user_branch:
-            return obj_branch.id == user_branch.id
-        if hasattr(obj, 'sale') and obj.sale.branch and user_branch:
-            return obj.sale.branch.id == user_branch.id
+            return obj_branch == user_branch
+        if hasattr(obj, 'sale') and obj.sale.branch_id and user_branch:
+            return obj.sale.branch_id == user_branch
         return False
 
 
@@ -131,6 +131,6 @@ class CreatorOrAdminAccess(BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.role == 'admin':
             return True
-        if hasattr(obj, 'created_by'):
-            return obj.created_by == request.user
+        if hasattr(obj, 'created_by_id'):
+            return obj.created_by_id == request.user.pk
         return False
@@ -0,0 +1,75 @@
+"""
+Query instrumentation.
+
+``QueryRecorder`` counts the SQL a block runs on every database connection
+and groups it by template, so the same statement run once per row (an N+1)
+shows up as one template with a high count. ``QueryCountMiddleware`` wraps
+each request in a recorder when ``QUERY_INSPECTION`` is on: it adds
+``X-Query-Count`` to the response and logs a warning for any template run
+``QUERY_REPEAT_THRESHOLD`` times or more.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# "IN (%s, %s, %s)" and multi-row VALUES lists vary with the data, not the code
+_PLACEHOLDER_RUNS = re.compile(r"%s(?:\s*,\s*%s)+")
+_VALUES_RUNS = re.compile(r"VALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+
+
+def sql_template(sql):
+    return _VALUES_RUNS.sub(r"VALUES \1", _PLACEHOLDER_RUNS.sub("%s, ...", sql))
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.templates = Counter()
+        self.count = 0
+        self.duration = 0.0
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.templates[sql_template(sql)] += 1
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def repeated(self, threshold=None):
+        """Templates run at least ``threshold`` times, most frequent first."""
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        return [(template, n) for template, n in self.templates.most_common() if n >= threshold]
+
+
+class QueryCountMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_INSPECTION", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        response["X-Query-Count"] = str(recorder.count)
+        for template, n in recorder.repeated():
+            logger.warning("Possible N+1 on %s %s: %d x %s", request.method, request.path, n, template)
+        return response
@@ -0,0 +1,320 @@
+"""
+Report jobs: Excel, PDF and CSV/NDJSON reports rendered off the request.
+
+``request_job`` answers a request for a report with the job that renders
+it. Jobs carry a fingerprint of their kind, their parameters and the
+version of every table the report reads (row count, last id, last
+update), so asking again before the data changes returns the job already
+queued, running or done (and its artifact) instead of rendering again.
+
+New jobs go to a local thread pool of REPORT_WORKERS threads once their
+transaction commits; ``run_report_jobs`` runs any left pending, including
+jobs whose worker died more than REPORT_JOB_LEASE seconds into them.
+Artifacts are written to MEDIA_ROOT/reports/. When a job is done, the
+artifacts of older jobs with the same parameters are deleted.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import chain
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.encoding import smart_str
+from reportlab.pdfgen import canvas
+
+from . import ledger_report
+from .exports import STREAM_CONTENT_TYPES, XLSX_CONTENT_TYPE, csv_stream, ndjson_stream, within, write_xlsx
+from .models import Branch, LedgerEntry, ReportJob, Sale, SaleItem, StockMovement
+
+logger = logging.getLogger(__name__)
+
+# Resources dumped as CSV/NDJSON: model, date field, branch field
+DUMPS = {
+    "sales": (Sale, "created_at", "branch_id"),
+    "sale-items": (SaleItem, "sale__created_at", "sale__branch_id"),
+    "stock-movements": (StockMovement, "created_at", "branch_id"),
+    "ledger-entries": (LedgerEntry, "date", "branch_id"),
+}
+
+
+def _filters(params):
+    """(start, end, branch) from job parameters."""
+    start, end = (params.get(name) for name in ("start", "end"))
+    return start and date.fromisoformat(start), end and date.fromisoformat(end), params.get("branch")
+
+
+def _models_read(model, paths):
+    """``model`` and every model reached by the ``__`` lookups in ``paths``."""
+    models = {model}
+    for path in paths:
+        current = model
+        for name in path.split("__")[:-1]:
+            current = current._meta.get_field(name).related_model
+            models.add(current)
+    return models
+
+
+def pk_ranges(pks):
+    """Sorted ``pks`` as ``[first, last]`` runs of consecutive ids: a whole table is one run."""
+    ranges = []
+    for pk in pks:
+        if ranges and pk == ranges[-1][1] + 1:
+            ranges[-1][1] = pk
+        else:
+            ranges.append([pk, pk])
+    return ranges
+
+
+# Two variables each, well under SQLite's limit per statement
+RUNS_PER_QUERY = 500
+
+
+def _in_ranges(queryset, ranges):
+    """``queryset`` limited to the ``pk_ranges``, as one queryset per RUNS_PER_QUERY runs, in pk order."""
+    for start in range(0, len(ranges), RUNS_PER_QUERY):
+        runs = Q()
+        for first, last in ranges[start:start + RUNS_PER_QUERY]:
+            runs |= Q(pk__range=(first, last))
+        yield queryset.filter(runs).order_by("pk")
+
+
+class Report(ABC):
+    """One kind of report: the tables it reads, its file name and type, and how it is written."""
+
+    @abstractmethod
+    def sources(self, params):
+        """Models the report reads, for the data version in its fingerprint."""
+
+    @abstractmethod
+    def filename(self, params):
+        """File name the artifact is downloaded as."""
+
+    @abstractmethod
+    def content_type(self, params):
+        """Content type of the artifact."""
+
+    @abstractmethod
+    def write(self, out, params):
+        """Write the report to the binary file ``out``."""
+
+
+class SalesExcel(Report):
+    def sources(self, params):
+        return {Sale}
+
+    def filename(self, params):
+        return "sales_report.xlsx"
+
+    def content_type(self, params):
+        return XLSX_CONTENT_TYPE
+
+    def write(self, out, params):
+        sales = within(Sale.objects.order_by("id"), "created_at", "branch_id", *_filters(params))
+        write_xlsx(out, sales, [field.attname for field in Sale._meta.concrete_fields], "Sales")
+
+
+class LedgerPdf(Report):
+    def sources(self, params):
+        return {LedgerEntry, Branch}
+
+    def filename(self, params):
+        return "ledger_report.pdf"
+
+    def content_type(self, params):
+        return "application/pdf"
+
+    def write(self, out, params):
+        ledger_report.render(out, *_filters(params))
+
+
+class Dump(Report):
+    def sources(self, params):
+        model, date_field, branch_field = DUMPS[params["resource"]]
+        return _models_read(model, [date_field, branch_field])
+
+    def filename(self, params):
+        return f"{params['resource']}.{params['format']}"
+
+    def content_type(self, params):
+        return STREAM_CONTENT_TYPES[params["format"]]
+
+    def write(self, out, params):
+        model, date_field, branch_field = DUMPS[params["resource"]]
+        rows = within(model.objects.order_by("pk"), date_field, branch_field, *_filters(params))
+        stream = {"csv": csv_stream, "ndjson": ndjson_stream}[params["format"]]
+        for block in stream(rows, [field.attname for field in model._meta.concrete_fields]):
+            out.write(block)
+
+
+class AdminExport(Report):
+    """
+    Rows picked in the admin (``pk_ranges`` of ``model``), as Excel or as
+    "field: value" lines in a PDF. Rows are read a few hundred runs per
+    query, so a selection of any size stays under SQLite's variable limit.
+    """
+
+    def sources(self, params):
+        return _models_read(apps.get_model(params["model"]), params["fields"])
+
+    def filename(self, params):
+        return f"{params['filename']}.{params['format']}"
+
+    def content_type(self, params):
+        return XLSX_CONTENT_TYPE if params["format"] == "xlsx" else "application/pdf"
+
+    def write(self, out, params):
+        selected = list(_in_ranges(apps.get_model(params["model"]).objects.all(), params["pk_ranges"]))
+        if params["format"] == "xlsx":
+            write_xlsx(out, selected, params["fields"], params["filename"])
+            return
+        p = canvas.Canvas(out)
+        y = 800
+        rows = chain.from_iterable(
+            queryset.values(*params["fields"]).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE) for queryset in selected
+        )
+        for row in rows:
+            p.drawString(50, y, smart_str(", ".join(f"{k}: {v}" for k, v in row.items())))
+            y -= 20
+            if y <= 50:  # new page if needed
+                p.showPage()
+                y = 800
+        p.save()
+
+
+REPORTS = {
+    "sales_excel": SalesExcel(),
+    "ledger_pdf": LedgerPdf(),
+    "dump": Dump(),
+    "admin_export": AdminExport(),
+}
+
+
+def data_version(models):
+    """Changes whenever a row of ``models`` is added or deleted, or updated where they have updated_at."""
+    state = []
+    for model in sorted(models, key=lambda model: model._meta.label):
+        aggregates = {"count": Count("pk"), "last": Max("pk")}
+        if any(field.name == "updated_at" for field in model._meta.concrete_fields):
+            aggregates["updated"] = Max("updated_at")
+        state.append([model._meta.label, model.objects.aggregate(**aggregates)])
+    return state
+
+
+def request_job(kind, params, user_id=None, branch=None):
+    """
+    ``(job, created)`` for a ``kind`` report over ``params``: an identical
+    job queued, running or done over unchanged data if there is one, else a
+    new job, handed to the worker pool when the transaction commits.
+    ``branch`` is the branch the report is limited to, for access checks.
+    """
+    report = REPORTS[kind]
+    params = json.loads(json.dumps(params, sort_keys=True, default=str))
+    version = data_version(report.sources(params))
+    fingerprint = hashlib.sha256(json.dumps([kind, params, version], default=str).encode()).hexdigest()
+    jobs = ReportJob.objects.filter(fingerprint=fingerprint, status__in=("pending", "running", "done"))
+    for job in jobs.order_by("-pk")[:1]:
+        if job.status != "done" or job.artifact.storage.exists(job.artifact.name):
+            return job, False
+    job = ReportJob.objects.create(
+        kind=kind, params=params, branch_id=branch, fingerprint=fingerprint, created_by_id=user_id
+    )
+    transaction.on_commit(lambda: _submit(job.pk))
+    return job, True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _submit(job_id):
+    global _pool
+    if not settings.REPORT_WORKERS:
+        run_job(job_id)
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.REPORT_WORKERS, thread_name_prefix="report-job")
+    _pool.submit(_work, job_id)
+
+
+def _work(job_id):
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("Report job %s could not be run", job_id)
+    finally:
+        # Worker threads hold their own connection
+        connection.close()
+
+
+def run_job(job_id):
+    """Render a pending job unless another worker claimed it first; returns whether this call ran it."""
+    now = timezone.now()
+    if not ReportJob.objects.filter(pk=job_id, status="pending").update(status="running", started_at=now, updated_at=now):
+        return False
+    job = ReportJob.objects.get(pk=job_id)
+    report = REPORTS[job.kind]
+    root = Path(settings.MEDIA_ROOT) / "reports"
+    root.mkdir(parents=True, exist_ok=True)
+    name = f"{job.pk}-{job.fingerprint[:12]}-{report.filename(job.params)}"
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=f".{job.pk}-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            report.write(out, job.params)
+        os.replace(tmp, root / name)
+    except Exception as exc:
+        Path(tmp).unlink(missing_ok=True)
+        logger.exception("Report job %s failed", job.pk)
+        _finish(job, "failed", error=str(exc))
+        return True
+    _finish(job, "done", artifact=f"reports/{name}")
+
+    # Older artifacts with the same parameters were rendered from older data
+    older = ReportJob.objects.filter(kind=job.kind, params=job.params, status="done", pk__lt=job.pk)
+    for stale in older:
+        stale.artifact.delete(save=False)
+    older.update(status="expired", artifact="", updated_at=timezone.now())
+    return True
+
+
+def open_artifact(job):
+    """
+    The artifact of a done job, open for reading, or None if its file is
+    gone (deleted by hand or by another server); the job is then marked
+    expired so the next request renders it again.
+    """
+    try:
+        return job.artifact.open("rb")
+    except FileNotFoundError:
+        ReportJob.objects.filter(pk=job.pk, status="done").update(
+            status="expired", artifact="", updated_at=timezone.now()
+        )
+        return None
+
+
+def _finish(job, status, **fields):
+    now = timezone.now()
+    ReportJob.objects.filter(pk=job.pk).update(status=status, finished_at=now, updated_at=now, **fields)
+
+
+def run_pending(limit=None):
+    """
+    Run pending jobs in this process, after returning to the queue jobs
+    whose worker started them over REPORT_JOB_LEASE seconds ago and never
+    finished. Returns how many ran.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.REPORT_JOB_LEASE)
+    ReportJob.objects.filter(status="running", started_at__lt=stale).update(status="pending", updated_at=timezone.now())
+    pending = ReportJob.objects.filter(status="pending").order_by("pk").values_list("pk", flat=True)
+    return sum(run_job(job_id) for job_id in list(pending[:limit]))
@@ -0,0 +1,174 @@
+"""
+Daily sales rollup.
+
+DailySalesRollup holds one row per (day, branch, payment method, cashier)
+with running totals. Every change to a sale is applied as a delta in the
+transaction that makes it:
+
+* ``create_sales`` (API and bulk sync) calls ``record_sales`` for its batch;
+* Sale / SaleItem saves and deletes made elsewhere (admin, shell) go
+  through the signal receivers in api/signals.py, which diff against the
+  values the instance was loaded with.
+
+``backfill`` recomputes a date range from Sale and SaleItem, and repairs
+any drift.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, Sale, SaleItem
+
+AMOUNTS = ("subtotal", "discount", "total_amount")
+KEY_FIELDS = ("branch_id", "created_at", "payment_method", "created_by_id")
+
+
+def rollup_key(branch_id, created_at, payment_method, created_by_id):
+    return (timezone.localdate(created_at), branch_id, payment_method or "", created_by_id)
+
+
+def sale_key(sale):
+    return rollup_key(*(getattr(sale, name) for name in KEY_FIELDS))
+
+
+def sale_key_from(values):
+    return rollup_key(*(values[name] for name in KEY_FIELDS))
+
+
+def apply(deltas):
+    """Add ``{key: {field: delta}}`` to the rollup, creating rows as needed."""
+    for (day, branch_id, payment_method, cashier_id), delta in deltas.items():
+        delta = {field: value for field, value in delta.items() if value}
+        if not delta:
+            continue
+        key = {"day": day, "branch_id": branch_id, "payment_method": payment_method, "cashier_id": cashier_id}
+        # Deleting a branch or cashier nulls their rows' keys (SET_NULL), which
+        # can leave several rows for one key; add to just one of them.
+        rows = DailySalesRollup.objects.filter(pk__in=DailySalesRollup.objects.filter(**key).values("pk")[:1])
+        increments = {field: F(field) + value for field, value in delta.items()}
+        if rows.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                DailySalesRollup.objects.create(**key, **delta)
+        except IntegrityError:
+            # A concurrent sale created the row first
+            rows.update(**increments)
+
+
+def record_sales(sales, lines):
+    """Add newly created ``sales`` (with their item ``lines``, anything with a ``quantity``) in one update per key."""
+    deltas = defaultdict(lambda: defaultdict(Decimal))
+    for sale, sale_lines in zip(sales, lines):
+        delta = deltas[sale_key(sale)]
+        delta["sale_count"] += 1
+        delta["item_quantity"] += sum(line.quantity for line in sale_lines)
+        for field in AMOUNTS:
+            delta[field] += getattr(sale, field) or 0
+    apply(deltas)
+
+
+# ---------- deltas for single saves / deletes ----------
+def _contribution(values, items=0):
+    return sale_key_from(values), {
+        "sale_count": 1,
+        "item_quantity": items,
+        **{field: Decimal(values[field] or 0) for field in AMOUNTS},
+    }
+
+
+def _combine(*parts):
+    deltas = defaultdict(lambda: defaultdict(Decimal))
+    for sign, (key, contribution) in parts:
+        for field, value in contribution.items():
+            deltas[key][field] += sign * value
+    return deltas
+
+
+def sale_saved(values, previous=None):
+    """
+    A Sale saved outside ``create_sales``: ``values`` are its fields now,
+    ``previous`` the ones it was loaded with (None when created).
+    """
+    if previous is None:
+        apply(_combine((1, _contribution(values))))
+        return
+    if all(previous.get(name) == values[name] for name in (*KEY_FIELDS, *AMOUNTS)):
+        return
+    old_key, new_key = sale_key_from(previous), sale_key_from(values)
+    # Item quantities only move when the sale lands in another row
+    items = 0
+    if old_key != new_key:
+        items = SaleItem.objects.filter(sale_id=values["id"]).aggregate(n=Sum("quantity"))["n"] or 0
+    apply(_combine((-1, _contribution(previous, items)), (1, _contribution(values, items))))
+
+
+def sale_deleted(values):
+    # Its items are deleted (and subtracted) one by one before it
+    apply(_combine((-1, _contribution(values))))
+
+
+def items_changed(sale, quantity):
+    if quantity:
+        apply({sale_key(sale): {"item_quantity": quantity}})
+
+
+# ---------- repair ----------
+def _day_filter(field, start, end):
+    filters = {}
+    if start:
+        filters[f"{field}__gte"] = start
+    if end:
+        filters[f"{field}__lte"] = end
+    return filters
+
+
+@transaction.atomic
+def backfill(start=None, end=None):
+    """Recompute the rollup for days in [start, end] (every day when omitted). Returns rows written."""
+    group = {
+        "day": TruncDate("created_at"),
+        "cashier_id": F("created_by_id"),
+        "method": Coalesce("payment_method", Value("")),
+    }
+    sales = (
+        Sale.objects.annotate(**group)
+        .filter(**_day_filter("day", start, end))
+        .values("day", "branch_id", "method", "cashier_id")
+        .annotate(sale_count=Count("id"), **{field: Sum(field) for field in AMOUNTS})
+        .order_by()
+    )
+    items = (
+        SaleItem.objects.annotate(
+            day=TruncDate("sale__created_at"),
+            branch_id_=F("sale__branch_id"),
+            cashier_id=F("sale__created_by_id"),
+            method=Coalesce("sale__payment_method", Value("")),
+        )
+        .filter(**_day_filter("day", start, end))
+        .values("day", "branch_id_", "method", "cashier_id")
+        .annotate(quantity=Sum("quantity"))
+        .order_by()
+    )
+    quantities = {
+        (row["day"], row["branch_id_"], row["method"], row["cashier_id"]): row["quantity"] for row in items
+    }
+    rows = [
+        DailySalesRollup(
+            day=row["day"],
+            branch_id=row["branch_id"],
+            payment_method=row["method"],
+            cashier_id=row["cashier_id"],
+            sale_count=row["sale_count"],
+            item_quantity=quantities.get((row["day"], row["branch_id"], row["method"], row["cashier_id"]), 0),
+            **{field: row[field] or 0 for field in AMOUNTS},
+        )
+        for row in sales
+    ]
+    DailySalesRollup.objects.filter(**_day_filter("day", start, end)).delete()
+    DailySalesRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,112 @@
+"""
+Serializer-free rendering of list pages.
+
+``RowPlan.compile(serializer)`` turns a ModelSerializer (already trimmed by
+``?fields=`` / ``?omit=``) into a list of column steps over ``.values()``
+rows, once per request. Rendering a row is then a dict build with each
+field's own ``to_representation`` applied to the raw column, so the output
+matches the serializer's exactly without a field binding per object.
+
+Supported fields: model columns, primary-key relations, one-level dotted
+sources over a foreign key (``branch.name``) and nested list serializers
+over a reverse foreign key (``items``). Anything else (method fields,
+nested objects, ``source="*"``) makes ``compile`` return None and the
+caller falls back to the serializer.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import relations, serializers
+
+
+class RowPlan:
+    def __init__(self, model, steps, children):
+        self.model = model
+        # (name, column, guard, convert): ``guard`` is the foreign key a dotted
+        # source goes through; when it is null the serializer skips the key
+        self.steps = steps
+        # name -> (plan, foreign key attname on the child)
+        self.children = children
+
+    @classmethod
+    def compile(cls, serializer):
+        model = serializer.Meta.model
+        opts = model._meta
+        steps, children = [], {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                try:
+                    relation = opts.get_field(field.source)
+                except FieldDoesNotExist:
+                    return None
+                child = cls.compile(field.child) if relation.one_to_many else None
+                if child is None:
+                    return None
+                children[name] = (child, relation.field.attname)
+                steps.append((name, None, None, None))
+                continue
+            if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)):
+                return None
+            parts = field.source.split(".")
+            if len(parts) > 2:
+                return None
+            try:
+                model_field = opts.get_field(parts[0])
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                return None
+            if len(parts) == 2:
+                if not model_field.many_to_one:
+                    return None
+                column, guard = "__".join(parts), parts[0]
+            else:
+                column, guard = parts[0], None
+            if isinstance(field, relations.PrimaryKeyRelatedField):
+                if field.pk_field is not None:
+                    return None
+                convert = None  # .values() already gives the pk
+            elif isinstance(field, relations.RelatedField):
+                return None
+            else:
+                convert = field.to_representation
+            steps.append((name, column, guard, convert))
+        return cls(model, steps, children)
+
+    def columns(self, *extra):
+        columns = {self.model._meta.pk.attname, *extra}
+        for _, column, guard, _ in self.steps:
+            if column is not None:
+                columns.add(column)
+            if guard is not None:
+                columns.add(guard)
+        return sorted(columns)
+
+    def values(self, queryset, *extra):
+        """``queryset`` as the ``.values()`` rows this plan (and ``extra`` columns) read."""
+        return queryset.prefetch_related(None).values(*self.columns(*extra))
+
+    def render(self, rows):
+        pk = self.model._meta.pk.attname
+        nested = {}
+        if self.children and rows:
+            ids = [row[pk] for row in rows]
+            for name, (plan, fk) in self.children.items():
+                grouped = nested[name] = {}
+                child_rows = list(plan.values(plan.model._default_manager.filter(**{f"{fk}__in": ids}), fk))
+                for child_row, data in zip(child_rows, plan.render(child_rows)):
+                    grouped.setdefault(child_row[fk], []).append(data)
+
+        rendered = []
+        for row in rows:
+            data = {}
+            for name, column, guard, convert in self.steps:
+                if column is None:
+                    data[name] = nested[name].get(row[pk], [])
+                    continue
+                if guard is not None and row[guard] is None:
+                    continue
+                value = row[column]
+                data[name] = value if value is None or convert is None else convert(value)
+            rendered.append(data)
+        return rendered
@@ -0,0 +1,75 @@
+"""
+Product full-text search.
+
+On SQLite this queries the ``api_product_fts`` FTS5 index (migration 0009)
+over name, sku, barcode and description: every word of the query is
+matched as a prefix and results are ranked with bm25, name hits first.
+Other databases fall back to ``icontains`` on name and sku.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+# bm25 column weights: name, sku, barcode, description
+WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_available():
+    return connection.vendor == "sqlite"
+
+
+def fts_query(text):
+    """Turn user input into an FTS5 query of quoted prefix terms ("" if nothing searchable)."""
+    return " ".join(f'"{word}"*' for word in _WORD.findall(text or ""))
+
+
+def filter_products(queryset, text):
+    """Narrow ``queryset`` to products matching ``text`` (unranked, any size)."""
+    query = fts_query(text)
+    if not query:
+        return queryset.none()
+    if not fts_available():
+        return queryset.filter(Q(name__icontains=text) | Q(sku__icontains=text))
+    return queryset.filter(pk__in=RawSQL("SELECT rowid FROM api_product_fts WHERE api_product_fts MATCH %s", [query]))
+
+
+def _ranked(query, branch_id, limit):
+    sql = "SELECT api_product_fts.rowid FROM api_product_fts"
+    params = []
+    if branch_id is not None:
+        sql += " JOIN api_product ON api_product.id = api_product_fts.rowid AND api_product.branch_id = %s"
+        params.append(branch_id)
+    sql += f" WHERE api_product_fts MATCH %s ORDER BY bm25(api_product_fts, {', '.join(map(str, WEIGHTS))}) LIMIT %s"
+    params += [query, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_products(text, branch_id=None, limit=50):
+    """
+    Ids of the best ``limit`` matches for ``text``, best first.
+
+    bm25 has to score every match before the LIMIT applies, so matches on
+    name/sku/barcode are ranked first and description-only matches (far
+    more numerous for short prefixes) are only ranked to fill the page.
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+    if not fts_available():
+        products = filter_products(Product.objects.all(), text)
+        if branch_id is not None:
+            products = products.filter(branch_id=branch_id)
+        return list(products.order_by("name").values_list("pk", flat=True)[:limit])
+
+    ids = _ranked(f"{{name sku barcode}} : ({query})", branch_id, limit)
+    if len(ids) < limit:
+        seen = set(ids)
+        ids += [pk for pk in _ranked(query, branch_id, limit + len(ids)) if pk not in seen][: limit - len(ids)]
+    return ids
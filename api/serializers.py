@@ -1,6 +1,11 @@
 import json
+from collections import namedtuple
 from decimal import Decimal
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.reverse import reverse
 from .models import (
     Branch,
     Product,
@@ -13,23 +18,120 @@ from .models import (
     CustomUser,
     Purchase,
     PurchaseItem,
+    ReportJob,
 )
+from . import audit, rollups
+from .bulk import db_datetime, insert_rows
+from .stock import receive_stock, reserve_stock
+
+
+# One validated sale line; create_sales writes SaleItem rows from these
+SaleLine = namedtuple("SaleLine", "product quantity unit_price total_price")
+
+
+def quantities_by_product(lines):
+    """Sum (product, quantity) pairs per product: {product_id: (product, quantity)}."""
+    totals = {}
+    for product, quantity in lines:
+        _, total = totals.get(product.pk, (product, 0))
+        totals[product.pk] = (product, total + quantity)
+    return totals
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves against ``context["prefetched"][Model]``
+    (a ``{pk: instance}`` dict) before falling back to a query per value.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get("prefetched", {}).get(self.get_queryset().model)
+        if prefetched is not None:
+            try:
+                return prefetched[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+def _field_list(value):
+    return {name.strip() for name in value.split(",") if name.strip()} if value else None
+
+
+class SparseFieldsMixin:
+    """
+    ``?fields=id,name`` / ``?omit=description`` on read requests trims the
+    representation of the top-level serializer (nested serializers are kept
+    whole). ``only_fields()`` lists the model columns the remaining fields
+    read so the view can narrow its queryset with ``.only()``.
+
+    ``field_sources`` maps computed fields (SerializerMethodField, "*"
+    sources) to the columns they need; a computed field without an entry
+    disables narrowing.
+    """
+
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        params = getattr(request, "query_params", request.GET)
+        wanted, omitted = _field_list(params.get("fields")), _field_list(params.get("omit"))
+        if wanted is None and omitted is None:
+            return
+        for name in list(self.fields):
+            if (wanted is not None and name not in wanted) or (omitted and name in omitted):
+                self.fields.pop(name)
+
+    def only_fields(self):
+        """Model field paths for ``QuerySet.only()``, or None when they can't be worked out."""
+        opts = self.Meta.model._meta
+        paths = {opts.pk.name}
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in self.field_sources:
+                paths.update(self.field_sources[name])
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                continue  # reverse / many-to-many relation, not a column
+            if isinstance(field, serializers.SerializerMethodField) or field.source == "*":
+                return None
+            try:
+                model_field = opts.get_field(field.source.split(".")[0])
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                continue
+            source = field.source.replace(".", "__")
+            if isinstance(field, serializers.BaseSerializer):
+                # Nested row: the columns it reads, or all of them
+                nested = field.only_fields() if isinstance(field, SparseFieldsMixin) else None
+                if nested is None:
+                    nested = [f.name for f in model_field.related_model._meta.concrete_fields]
+                paths.update(f"{source}__{path}" for path in nested)
+            else:
+                paths.add(source)
+        return sorted(paths)
 
 
 # ---------------------- BRANCH ----------------------
-class BranchSerializer(serializers.ModelSerializer):
+class BranchSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Branch
         fields = ["id", "name", "location", "phone", "email", "created_at", "updated_at"]
 
 
 # ---------------------- PRODUCT ----------------------
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     branch = BranchSerializer(read_only=True)
     branch_id = serializers.PrimaryKeyRelatedField(
         queryset=Branch.objects.all(), source="branch", write_only=True, required=False
     )
     image_url = serializers.SerializerMethodField()
+    field_sources = {"image_url": ["image"]}
 
     class Meta:
         model = Product
@@ -59,9 +161,27 @@ class ProductSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+    def update(self, instance, validated_data):
+        quantity = validated_data.pop("quantity", None)
+        product = super().update(instance, validated_data)
+
+        # ✅ Quantity edits are recorded as an adjustment so the stock log stays complete
+        if quantity is not None and quantity != product.quantity:
+            request = self.context.get("request")
+            StockMovement.objects.create(
+                product=product,
+                branch=product.branch,
+                movement_type="adjustment",
+                quantity=quantity - product.quantity,
+                note="Quantity edited on product",
+                created_by_id=getattr(getattr(request, "user", None), "pk", None),
+            )
+            product.refresh_from_db(fields=["quantity", "updated_at"])
+        return product
+
 
 # ---------------------- VENDOR ----------------------
-class VendorSerializer(serializers.ModelSerializer):
+class VendorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Vendor
         fields = [
@@ -79,7 +199,7 @@ class VendorSerializer(serializers.ModelSerializer):
 
 
 # ---------------------- PURCHASES ----------------------
-class PurchaseItemSerializer(serializers.ModelSerializer):
+class PurchaseItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source="product.name", read_only=True)
 
     class Meta:
@@ -88,7 +208,7 @@ class PurchaseItemSerializer(serializers.ModelSerializer):
         read_only_fields = ["total_price", "product_name"]
 
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class PurchaseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = PurchaseItemSerializer(many=True)
     vendor_name = serializers.CharField(source="vendor.name", read_only=True)
     branch_name = serializers.CharField(source="branch.name", read_only=True)
@@ -124,60 +244,171 @@ class PurchaseSerializer(serializers.ModelSerializer):
         items_data = validated_data.pop("items")
         validated_data.pop("created_by", None)  # ✅ prevent duplicate
         user = self.context["request"].user
-        purchase = Purchase.objects.create(created_by=user, **validated_data)
 
-        total_amount = Decimal("0.00")
-        for item_data in items_data:
-            purchase_item = PurchaseItem.objects.create(
-                purchase=purchase,
+        # Totals are computed once in memory so the Purchase is written a single time
+        purchase_items = [
+            PurchaseItem(
                 product=item_data["product"],
+                product_name=item_data["product"].name,
                 quantity=item_data["quantity"],
                 unit_cost=item_data["unit_cost"],
+                total_price=item_data["quantity"] * item_data["unit_cost"],
             )
-            total_amount += purchase_item.total_price
+            for item_data in items_data
+        ]
+        total_amount = sum((item.total_price for item in purchase_items), Decimal("0.00"))
+        purchase = Purchase.objects.create(
+            created_by_id=user.pk,
+            subtotal=total_amount,
+            total_amount=total_amount - validated_data.get("discount", Decimal("0.00")),
+            **validated_data,
+        )
+        for purchase_item in purchase_items:
+            purchase_item.purchase = purchase
+        PurchaseItem.objects.bulk_create(purchase_items)
 
-            # ✅ Update product stock
-            product = purchase_item.product
-            product.quantity += purchase_item.quantity
-            product.save()
+        # ✅ Update product stock
+        receive_stock(quantities_by_product((item.product, item.quantity) for item in purchase_items))
 
-            # Stock Movement (IN)
-            StockMovement.objects.create(
-                product=product,
+        # Stock Movement (IN) - bulk_create skips post_save, so stock isn't applied twice
+        StockMovement.objects.bulk_create(
+            StockMovement(
+                product=item.product,
                 branch=purchase.branch,
-                movement_type="IN",
-                quantity=purchase_item.quantity,
+                movement_type="in",
+                quantity=item.quantity,
                 reference=f"PUR-{purchase.invoice_no}",
-                created_by=user,
+                created_by_id=user.pk,
             )
-
-        purchase.calculate_totals()
+            for item in purchase_items
+        )
 
         # Ledger Entry (Debit)
         LedgerEntry.objects.create(
             date=purchase.created_at.date(),
             description=f"Purchase Invoice {purchase.invoice_no}",
-            transaction_type="Debit",
+            transaction_type="debit",
             amount=total_amount,
             reference=f"PUR-{purchase.invoice_no}",
             branch=purchase.branch,
-            created_by=user,
+            created_by_id=user.pk,
         )
 
         # Audit Log
-        AuditLog.objects.create(
+        audit.log(
+            "CREATE",
+            "Purchase",
+            purchase.id,
+            {"invoice_no": purchase.invoice_no, "items": len(items_data)},
             user=user,
-            action="CREATE",
-            model_name="Purchase",
-            object_id=purchase.id,
-            changes=json.dumps({"invoice_no": purchase.invoice_no, "items": len(items_data)}),
             ip_address=self.context["request"].META.get("REMOTE_ADDR"),
         )
         return purchase
 
 
 # ---------------------- SALES ----------------------
-class SaleItemSerializer(serializers.ModelSerializer):
+SALE_COLUMNS = (
+    "invoice_no", "customer_name", "customer_phone", "branch_id", "subtotal", "discount", "total_amount",
+    "paid_amount", "payment_method", "created_by_id", "notes", "created_at", "updated_at",
+)
+
+
+def create_sales(sales_data, user, ip_address=None):
+    """
+    Persist validated sales, writing each table with a single bulk insert.
+
+    ``sales_data`` is a list of ``SaleSerializer`` validated data. Raises
+    InsufficientStock, without writing anything, if the batch can't be
+    filled. Returns the created Sale instances in order.
+    """
+    sales, lines = [], []
+    for data in sales_data:
+        data = dict(data)
+        items_data = data.pop("items")
+        data.pop("created_by", None)  # ✅ prevent duplicate
+        sale_lines = [
+            SaleLine(
+                item_data["product"],
+                item_data["quantity"],
+                item_data["unit_price"],
+                item_data["quantity"] * item_data["unit_price"],
+            )
+            for item_data in items_data
+        ]
+        subtotal = sum((line.total_price for line in sale_lines), Decimal("0.00"))
+        sales.append(
+            Sale(
+                created_by_id=user.pk,
+                subtotal=subtotal,
+                total_amount=subtotal - data.get("discount", Decimal("0.00")),
+                **data,
+            )
+        )
+        lines.append(sale_lines)
+
+    # ✅ Reserve stock first: one conditional UPDATE for every product in the batch
+    reserve_stock(
+        quantities_by_product((line.product, line.quantity) for sale_lines in lines for line in sale_lines)
+    )
+
+    # Every row is written as a plain tuple, so no post_save runs and stock
+    # isn't applied twice; sales read their ids back by (unique) invoice_no
+    created_at = timezone.now()
+    now = db_datetime(created_at)
+    insert_rows(Sale, SALE_COLUMNS, [(*(getattr(sale, name) for name in SALE_COLUMNS[:-2]), now, now) for sale in sales])
+    ids = dict(Sale.objects.filter(invoice_no__in=[sale.invoice_no for sale in sales]).values_list("invoice_no", "pk"))
+    for sale in sales:
+        sale.pk = ids[sale.invoice_no]
+        sale.created_at = sale.updated_at = created_at
+        sale._state.adding, sale._state.db = False, Sale.objects.db
+    rollups.record_sales(sales, lines)
+    insert_rows(
+        SaleItem,
+        ("sale_id", "product_id", "product_name", "quantity", "unit_price", "total_price", "updated_at"),
+        [
+            (sale.pk, line.product.pk, line.product.name, line.quantity, line.unit_price, line.total_price, now)
+            for sale, sale_lines in zip(sales, lines)
+            for line in sale_lines
+        ],
+    )
+
+    # Stock Movement (OUT)
+    insert_rows(
+        StockMovement,
+        ("product_id", "branch_id", "movement_type", "quantity", "reference", "created_by_id", "created_at"),
+        [
+            (line.product.pk, sale.branch_id, "out", line.quantity, f"SAL-{sale.invoice_no}", user.pk, now)
+            for sale, sale_lines in zip(sales, lines)
+            for line in sale_lines
+        ],
+    )
+
+    # Ledger Entry (Credit)
+    insert_rows(
+        LedgerEntry,
+        ("date", "description", "transaction_type", "amount", "reference", "branch_id", "created_by_id", "updated_at"),
+        [
+            (now, f"Sale Invoice {sale.invoice_no}", "credit", sale.subtotal, f"SAL-{sale.invoice_no}",
+             sale.branch_id, user.pk, now)
+            for sale in sales
+        ],
+    )
+
+    # Audit Log
+    for sale, sale_lines in zip(sales, lines):
+        audit.log(
+            "CREATE",
+            "Sale",
+            sale.id,
+            {"invoice_no": sale.invoice_no, "items": len(sale_lines)},
+            user=user,
+            ip_address=ip_address,
+        )
+    return sales
+
+
+class SaleItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
     product_name = serializers.CharField(source="product.name", read_only=True)
 
     class Meta:
@@ -186,7 +417,8 @@ class SaleItemSerializer(serializers.ModelSerializer):
         read_only_fields = ["total_price", "product_name"]
 
 
-class SaleSerializer(serializers.ModelSerializer):
+class SaleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
     items = SaleItemSerializer(many=True)
     branch_name = serializers.CharField(source="branch.name", read_only=True)
     created_by_name = serializers.CharField(source="created_by.username", read_only=True)
@@ -218,69 +450,12 @@ class SaleSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        items_data = validated_data.pop("items")
-        validated_data.pop("created_by", None)  # ✅ prevent duplicate
-        user = self.context["request"].user
-        sale = Sale.objects.create(created_by=user, **validated_data)
-
-        total_amount = Decimal("0.00")
-        for item_data in items_data:
-            product = item_data["product"]
-            quantity = item_data["quantity"]
-            unit_price = item_data["unit_price"]
-
-            if product.quantity < quantity:
-                raise serializers.ValidationError(f"Not enough stock for {product.name}")
-
-            sale_item = SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=quantity,
-                unit_price=unit_price,
-            )
-            total_amount += sale_item.total_price
-
-            # ✅ Update product stock
-            product.quantity -= sale_item.quantity
-            product.save()
-
-            # Stock Movement (OUT)
-            StockMovement.objects.create(
-                product=product,
-                branch=sale.branch,
-                movement_type="OUT",
-                quantity=quantity,
-                reference=f"SAL-{sale.invoice_no}",
-                created_by=user,
-            )
-
-        sale.calculate_totals()
-
-        # Ledger Entry (Credit)
-        LedgerEntry.objects.create(
-            date=sale.created_at.date(),
-            description=f"Sale Invoice {sale.invoice_no}",
-            transaction_type="Credit",
-            amount=total_amount,
-            reference=f"SAL-{sale.invoice_no}",
-            branch=sale.branch,
-            created_by=user,
-        )
-
-        # Audit Log
-        AuditLog.objects.create(
-            user=user,
-            action="CREATE",
-            model_name="Sale",
-            object_id=sale.id,
-            changes=json.dumps({"invoice_no": sale.invoice_no, "items": len(items_data)}),
-            ip_address=self.context["request"].META.get("REMOTE_ADDR"),
-        )
-        return sale
+        request = self.context["request"]
+        return create_sales([validated_data], request.user, request.META.get("REMOTE_ADDR"))[0]
 
 
 # ---------------------- LEDGER ----------------------
-class LedgerEntrySerializer(serializers.ModelSerializer):
+class LedgerEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     branch_name = serializers.CharField(source="branch.name", read_only=True)
     created_by_name = serializers.CharField(source="created_by.username", read_only=True)
 
@@ -301,7 +476,7 @@ class LedgerEntrySerializer(serializers.ModelSerializer):
 
 
 # ---------------------- STOCK ----------------------
-class StockMovementSerializer(serializers.ModelSerializer):
+class StockMovementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source="product.name", read_only=True)
     branch_name = serializers.CharField(source="branch.name", read_only=True)
     created_by_name = serializers.CharField(source="created_by.username", read_only=True)
@@ -325,9 +500,10 @@ class StockMovementSerializer(serializers.ModelSerializer):
 
 
 # ---------------------- AUDIT ----------------------
-class AuditLogSerializer(serializers.ModelSerializer):
+class AuditLogSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source="user.username", read_only=True)
     changes = serializers.SerializerMethodField()
+    field_sources = {"changes": ["changes"]}
 
     class Meta:
         model = AuditLog
@@ -351,7 +527,7 @@ class AuditLogSerializer(serializers.ModelSerializer):
 
 
 # ---------------------- USER ----------------------
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     branch_name = serializers.CharField(source="branch.name", read_only=True)
 
@@ -389,3 +565,19 @@ class UserSerializer(serializers.ModelSerializer):
             user.set_password(password)
             user.save()
         return user
+
+
+# ---------------------- REPORT JOB ----------------------
+class ReportJobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+    field_sources = {"download": ["status"]}
+
+    class Meta:
+        model = ReportJob
+        fields = ["id", "kind", "params", "branch", "status", "error", "download", "created_at", "started_at", "finished_at"]
+        read_only_fields = fields
+
+    def get_download(self, obj):
+        if obj.status != "done":
+            return None
+        return reverse("reportjob-download", args=[obj.pk], request=self.context.get("request"))
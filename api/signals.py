@@ -1,8 +1,12 @@
-import json
-from django.db.models.signals import post_save, post_delete
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
-from django.core.serializers.json import DjangoJSONEncoder
-from .models import StockMovement, AuditLog
+from . import audit, rollups
+from .authentication import CLAIMS, pin_claims
+from .caches import bump_catalog_on_commit, scan_cache
+from .models import AuditLog, Branch, CustomUser, Product, Sale, SaleItem, ProductTombstone, StockCheckpoint, StockMovement
+from .stock import apply_movement, products_changed
 
 
 # --- Update product quantity on stock movements ---
@@ -10,73 +14,193 @@ from .models import StockMovement, AuditLog
 def update_product_quantity(sender, instance, created, **kwargs):
     if not created:
         return
-    product = instance.product
-    if instance.movement_type in ["in", "return"]:
-        product.quantity += abs(instance.quantity)
-    elif instance.movement_type in ["out", "damage"]:
-        product.quantity -= abs(instance.quantity)
-    elif instance.movement_type == "adjustment":
-        product.quantity += instance.quantity  # signed delta
-    product.save()
+    # Set-based UPDATE: concurrent movements can't overwrite each other
+    apply_movement(instance)
+
+
+# --- Opening balance for new products ---
+@receiver(post_save, sender=Product)
+def open_stock_checkpoint(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.quantity:
+        StockCheckpoint.objects.create(product=instance, quantity=instance.quantity, movement_id=0)
+
+
+# --- Tombstones so catalog sync can report deletions ---
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    ProductTombstone.objects.create(product_id=instance.pk, branch_id=instance.branch_id, sku=instance.sku)
+
+
+@receiver(post_save, sender=Product)
+def record_moved_product_tombstone(sender, instance, created, raw=False, **kwargs):
+    # A product moved to another branch is gone from the one it left
+    previous = audit.loaded_value(instance, "branch_id", instance.branch_id)
+    if created or raw or previous == instance.branch_id:
+        return
+    ProductTombstone.objects.create(
+        product_id=instance.pk, branch_id=previous, sku=audit.loaded_value(instance, "sku", instance.sku)
+    )
+
+
+# --- Drop cached scan results once product changes commit ---
+def _invalidate_scans(product_ids):
+    transaction.on_commit(lambda: scan_cache.invalidate(*product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_scans(sender, instance, **kwargs):
+    # A scan may have resolved to another product through a code this one
+    # now carries (or to this one through a code it just gave up)
+    codes = {
+        audit.loaded_value(instance, "barcode", instance.barcode),
+        audit.loaded_value(instance, "sku", instance.sku),
+        instance.barcode,
+        instance.sku,
+    }
+    _invalidate_scans([instance.pk, *(("code", code) for code in codes if code)])
+
+
+@receiver(products_changed)
+def invalidate_changed_scans(sender, product_ids, **kwargs):
+    _invalidate_scans(product_ids)
+
+
+# --- Retire cached product / branch listings ---
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_catalog(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # A product moved between branches leaves the old branch's listing too
+    previous = audit.loaded_value(instance, "branch_id", instance.branch_id)
+    bump_catalog_on_commit("all", instance.branch_id, previous)
+
+
+@receiver(products_changed)
+def bump_changed_catalog(sender, product_ids, **kwargs):
+    branch_ids = Product.objects.filter(pk__in=product_ids).values_list("branch_id", flat=True).distinct()
+    bump_catalog_on_commit("all", *branch_ids)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def bump_branch_catalog(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Product listings carry the branch name
+    bump_catalog_on_commit("branches", "all", instance.pk)
+
+
+# --- Keep the daily sales rollup current (create_sales records its own batches) ---
+SALE_ROLLUP_FIELDS = ("id", *rollups.KEY_FIELDS, *rollups.AMOUNTS)
+
+
+@receiver(post_save, sender=Sale)
+def rollup_saved_sale(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    values = {name: getattr(instance, name) for name in SALE_ROLLUP_FIELDS}
+    previous = None
+    if not created:
+        previous = {name: audit.loaded_value(instance, name) for name in SALE_ROLLUP_FIELDS}
+        if previous["created_at"] is None:
+            # Loaded without some of its columns: recount its day instead
+            day = rollups.sale_key(instance)[0]
+            rollups.backfill(day, day)
+            return
+    rollups.sale_saved(values, previous)
+
+
+@receiver(post_delete, sender=Sale)
+def rollup_deleted_sale(sender, instance, **kwargs):
+    rollups.sale_deleted({name: getattr(instance, name) for name in SALE_ROLLUP_FIELDS})
+
+
+@receiver(post_save, sender=SaleItem)
+def rollup_saved_item(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous_sale = None if created else audit.loaded_value(instance, "sale_id")
+    previous = 0 if created else audit.loaded_value(instance, "quantity", instance.quantity)
+    if previous_sale not in (None, instance.sale_id):
+        rollups.items_changed(Sale.objects.get(pk=previous_sale), -previous)
+        previous = 0
+    rollups.items_changed(instance.sale, instance.quantity - previous)
+
+
+@receiver(post_delete, sender=SaleItem)
+def rollup_deleted_item(sender, instance, **kwargs):
+    sale = Sale.objects.filter(pk=instance.sale_id).first()
+    if sale is not None:
+        rollups.items_changed(sale, -instance.quantity)
+
+
+# --- Refuse tokens whose role / branch claims went stale ---
+@receiver(post_save, sender=CustomUser)
+def pin_changed_claims(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    if any(audit.loaded_value(instance, name, getattr(instance, name)) != getattr(instance, name)
+           for name in (*CLAIMS, "is_active")):
+        pin_claims(instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+def pin_deleted_user(sender, instance, **kwargs):
+    pin_claims(instance, active=False)
+
+
+# --- Remember loaded values so updates can be logged as diffs ---
+def remember_loaded(sender, instance, **kwargs):
+    audit.remember_loaded(instance)
+
+
+for model in apps.get_app_config('api').get_models():
+    if model is not AuditLog:
+        post_init.connect(remember_loaded, sender=model, dispatch_uid=f'audit_loaded_{model.__name__}')
+
+
+# --- Saved values become the loaded values for the next save ---
+def refresh_loaded(sender, instance, **kwargs):
+    """
+    Connected after every other post_save receiver (see ApiConfig.ready), so
+    each of them still sees the values the save started from.
+    """
+    if getattr(instance, '_meta', None) and instance._meta.app_label == 'api':
+        audit.remember_loaded(instance)
 
 
 # --- Log CREATE / UPDATE actions ---
 @receiver(post_save)
 def log_save(sender, instance, created, **kwargs):
-    # Prevent recursion
-    if sender is AuditLog:
-        return
-
     # Only log models in our app
     if not hasattr(instance, '_meta') or instance._meta.app_label != 'api':
         return
 
     action = 'create' if created else 'update'
-    user = getattr(instance, 'created_by', None) or getattr(instance, 'user', None)
-
-    changes = {}
-    for field in instance._meta.fields:
-        value = getattr(instance, field.name)
-        if hasattr(value, 'pk'):
-            changes[field.name] = value.pk
-        else:
-            changes[field.name] = str(value)
-
-    AuditLog.objects.create(
-        user=user,
-        action=action,
-        model_name=sender.__name__,
-        object_id=str(instance.pk),
-        changes=json.dumps(changes, cls=DjangoJSONEncoder),
-    )
+    if not audit.is_audited(sender.__name__, action):
+        return
+    user = getattr(instance, 'created_by_id', None) or getattr(instance, 'user_id', None)
+
+    # Full snapshot on create, only the changed fields on update
+    changes = audit.snapshot(instance) if created else audit.diff(instance)
+    if not changes:
+        return
+
+    audit.log(action, sender.__name__, instance.pk, changes, user=user)
 
 
 # --- Log DELETE actions ---
 @receiver(post_delete)
 def log_delete(sender, instance, **kwargs):
-    # Prevent recursion
-    if sender is AuditLog:
-        return
-
     # Only log models in our app
     if not hasattr(instance, '_meta') or instance._meta.app_label != 'api':
         return
 
-    user = getattr(instance, 'created_by', None) or getattr(instance, 'user', None)
+    if not audit.is_audited(sender.__name__, 'delete'):
+        return
+    user = getattr(instance, 'created_by_id', None) or getattr(instance, 'user_id', None)
 
     # Capture the final state before deletion
-    changes = {}
-    for field in instance._meta.fields:
-        value = getattr(instance, field.name, None)
-        if hasattr(value, 'pk'):
-            changes[field.name] = value.pk
-        else:
-            changes[field.name] = str(value)
-
-    AuditLog.objects.create(
-        user=user,
-        action='delete',
-        model_name=sender.__name__,
-        object_id=str(instance.pk),
-        changes=json.dumps(changes, cls=DjangoJSONEncoder),
-    )
+    audit.log('delete', sender.__name__, instance.pk, audit.snapshot(instance), user=user)
@@ -0,0 +1,312 @@
+"""
+Stock is event-sourced: StockMovement rows are the source of truth and
+Product.quantity is a materialized view of them, kept current by the
+set-based UPDATEs below and repairable with rebuild_on_hand().
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Max, Min, OuterRef, Subquery, Sum, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Abs, Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .exceptions import InsufficientStock
+from .models import InventorySnapshot, Product, StockCheckpoint, StockMovement
+
+# Sent with ``product_ids`` after set-based UPDATEs that bypass post_save
+products_changed = Signal()
+
+# Legacy rows from before movement types were normalised use upper case
+INBOUND_TYPES = ["in", "return", "IN"]
+OUTBOUND_TYPES = ["out", "damage", "OUT"]
+
+# Signed effect of a movement on on-hand stock; adjustments carry their own sign
+SIGNED_QUANTITY = Case(
+    When(movement_type__in=INBOUND_TYPES, then=Abs(F("quantity"))),
+    When(movement_type__in=OUTBOUND_TYPES, then=-Abs(F("quantity"))),
+    default=F("quantity"),
+    output_field=IntegerField(),
+)
+
+
+def signed_quantity(movement):
+    if movement.movement_type in INBOUND_TYPES:
+        return abs(movement.quantity)
+    if movement.movement_type in OUTBOUND_TYPES:
+        return -abs(movement.quantity)
+    return movement.quantity
+
+
+def _per_product(requested):
+    # A simple CASE over the primary key: written as When(pk=...) the ORM
+    # resolves one lookup per product, which dominated large bulk batches
+    opts = Product._meta
+    column = f"{connection.ops.quote_name(opts.db_table)}.{connection.ops.quote_name(opts.pk.column)}"
+    whens = " ".join(["WHEN %s THEN %s"] * len(requested))
+    params = [value for product_id, (_, quantity) in requested.items() for value in (product_id, quantity)]
+    return RawSQL(f"CASE {column} {whens} END", params, output_field=IntegerField())
+
+
+def reserve_stock(requested):
+    """
+    Take stock for ``{product_id: (product, quantity)}`` in one conditional UPDATE.
+
+    Every row is decremented only while ``quantity >= requested``, so
+    concurrent checkouts can never oversell. If any product is short nothing
+    is decremented and InsufficientStock (HTTP 409) is raised.
+    """
+    if not requested:
+        return
+    amount = _per_product(requested)
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(pk__in=requested, quantity__gte=amount).update(
+                quantity=F("quantity") - amount, updated_at=timezone.now()
+            )
+            if updated != len(requested):
+                raise InsufficientStock()
+            products_changed.send(sender=Product, product_ids=list(requested))
+    except InsufficientStock:
+        available = dict(Product.objects.filter(pk__in=requested).values_list("pk", "quantity"))
+        short = [
+            product.name
+            for product_id, (product, quantity) in requested.items()
+            if available.get(product_id, 0) < quantity
+        ]
+        raise InsufficientStock(f"Not enough stock for {', '.join(short)}")
+
+
+def receive_stock(requested):
+    """Add stock for ``{product_id: (product, quantity)}`` in one UPDATE."""
+    if not requested:
+        return
+    amount = _per_product(requested)
+    Product.objects.filter(pk__in=requested).update(
+        quantity=F("quantity") + amount, updated_at=timezone.now()
+    )
+    products_changed.send(sender=Product, product_ids=list(requested))
+
+
+def apply_movement(movement):
+    """Apply one saved movement to its product's on-hand quantity."""
+    delta = signed_quantity(movement)
+    if delta < 0:
+        reserve_stock({movement.product_id: (movement.product, -delta)})
+    elif delta > 0:
+        receive_stock({movement.product_id: (movement.product, delta)})
+
+
+def on_hand(product_ids=None, upto=None):
+    """
+    On-hand quantity per product derived from the movement log.
+
+    Latest checkpoint (at or before movement ``upto``) plus the signed sum of
+    the movements after it, for every product in ``product_ids`` (all when
+    None), in one query that only reads each product's tail of the log.
+    Returns ``({product_id: quantity}, {product_ids with movements since})``.
+    """
+    checkpoints = StockCheckpoint.objects.order_by("-movement_id")
+    movements = StockMovement.objects.all()
+    products = Product.objects.all()
+    if upto is not None:
+        checkpoints = checkpoints.filter(movement_id__lte=upto)
+        movements = movements.filter(id__lte=upto)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    latest = checkpoints.filter(product=OuterRef("pk"))
+    since = (
+        movements.filter(product=OuterRef("pk"), id__gt=OuterRef("since"))
+        .order_by()
+        .values("product")
+        .annotate(delta=Sum(SIGNED_QUANTITY))
+        .values("delta")
+    )
+    rows = (
+        products.annotate(
+            checkpoint=Coalesce(Subquery(latest.values("quantity")[:1]), 0),
+            since=Coalesce(Subquery(latest.values("movement_id")[:1]), 0),
+        )
+        .annotate(delta=Subquery(since))
+        .values_list("pk", "checkpoint", "delta")
+    )
+    totals, moved = {}, set()
+    for product_id, quantity, delta in rows:
+        totals[product_id] = quantity + (delta or 0)
+        if delta is not None:
+            moved.add(product_id)
+    return totals, moved
+
+
+def verify_on_hand(product_ids=None):
+    """Products whose stored quantity disagrees with the movement log."""
+    computed, _ = on_hand(product_ids)
+    products = Product.objects.filter(pk__in=computed).values_list("pk", "name", "quantity")
+    return [
+        {"product": pk, "name": name, "recorded": quantity, "computed": computed[pk]}
+        for pk, name, quantity in products
+        if computed[pk] != quantity
+    ]
+
+
+def rebuild_on_hand(product_ids=None, batch_size=500):
+    """
+    Rewrite Product.quantity from the movement log in one set-based pass.
+
+    Runs in one transaction so checkouts can't interleave. Products whose
+    log adds up to a negative quantity are left alone and reported.
+    """
+    with transaction.atomic():
+        computed, _ = on_hand(product_ids)
+        current = dict(
+            Product.objects.select_for_update().filter(pk__in=computed).values_list("pk", "quantity")
+        )
+        changed = {pk: qty for pk, qty in computed.items() if qty >= 0 and current.get(pk) != qty}
+        negative = sorted(pk for pk, qty in computed.items() if qty < 0)
+        now = timezone.now()
+        pks = list(changed)
+        for start in range(0, len(pks), batch_size):
+            chunk = {pk: (None, changed[pk]) for pk in pks[start:start + batch_size]}
+            Product.objects.filter(pk__in=chunk).update(quantity=_per_product(chunk), updated_at=now)
+        products_changed.send(sender=Product, product_ids=pks)
+    return {"updated": len(changed), "negative": negative}
+
+
+def checkpoint_stock(product_ids=None):
+    """
+    Record a checkpoint for every product that moved since its last one.
+
+    Keeps on_hand() cheap: later reads only replay movements after it.
+    """
+    with transaction.atomic():
+        upto = StockMovement.objects.aggregate(last=Max("id"))["last"] or 0
+        computed, moved = on_hand(product_ids, upto=upto)
+        StockCheckpoint.objects.bulk_create(
+            (StockCheckpoint(product_id=pk, quantity=computed[pk], movement_id=upto) for pk in moved),
+            batch_size=1000,
+        )
+    return len(moved)
+
+
+# ---------------- Point-in-time stock ----------------
+def _end_of_day(day):
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _products(branch_id=None):
+    products = Product.objects.all()
+    if branch_id is not None:
+        products = products.filter(branch_id=branch_id)
+    return products
+
+
+def _movement_totals(start=None, end=None):
+    """
+    Signed movement total per product for movements in [start, end).
+
+    Deliberately not filtered by product so the created_at index drives the
+    query; callers drop the products they aren't interested in.
+    """
+    movements = StockMovement.objects.all()
+    if start is not None:
+        movements = movements.filter(created_at__gte=start)
+    if end is not None:
+        movements = movements.filter(created_at__lt=end)
+    return dict(
+        movements.values("product_id").annotate(delta=Sum(SIGNED_QUANTITY)).order_by().values_list("product_id", "delta")
+    )
+
+
+def snapshot_inventory(day, branch_id=None):
+    """
+    Write every product's quantity at the end of ``day`` (current quantity
+    minus whatever moved since), replacing an earlier snapshot for that day.
+    """
+    end = _end_of_day(day)
+    products = _products(branch_id).filter(created_at__lt=end)
+    with transaction.atomic():
+        since = _movement_totals(start=end)
+        snapshots = [
+            InventorySnapshot(branch_id=branch, product_id=pk, date=day, quantity=quantity - since.get(pk, 0))
+            for pk, branch, quantity in products.values_list("pk", "branch_id", "quantity")
+        ]
+        InventorySnapshot.objects.bulk_create(
+            snapshots,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["product", "date"],
+            update_fields=["branch", "quantity"],
+        )
+    return len(snapshots)
+
+
+def stock_as_of(day, branch_id=None):
+    """
+    Quantity of every product at the end of ``day``.
+
+    Each branch starts from its own nearest snapshot (the latest on or
+    before ``day``, otherwise the earliest after it), since
+    ``snapshot_inventory --branch`` may have covered only some branches,
+    and replays only the movements between it and ``day``. Products no
+    snapshot covers replay back from their live quantity. The cost depends
+    on the gap to the snapshots rather than on the size of the history.
+    Returns ``({product_id: quantity}, snapshot date)``; the date is None
+    unless every product started from the same snapshot.
+    """
+    end = _end_of_day(day)
+    products = {
+        pk: (branch, created_at, quantity)
+        for pk, branch, created_at, quantity in _products(branch_id)
+        .filter(created_at__lt=end)
+        .values_list("pk", "branch_id", "created_at", "quantity")
+    }
+    snapshots = InventorySnapshot.objects.all()
+    if branch_id is not None:
+        snapshots = snapshots.filter(branch_id=branch_id)
+
+    def bases(dates, aggregate):
+        rows = dates.values("branch_id").annotate(date=aggregate("date")).order_by()
+        return dict(rows.values_list("branch_id", "date"))
+
+    before, after = bases(snapshots.filter(date__lte=day), Max), bases(snapshots.filter(date__gt=day), Min)
+    # (direction, snapshot date) -> products starting from it
+    groups = defaultdict(set)
+    for pk, (branch, _, _) in products.items():
+        if branch in before:
+            groups[(1, before[branch])].add(pk)
+        elif branch in after:
+            groups[(-1, after[branch])].add(pk)
+        else:
+            groups[(-1, None)].add(pk)
+
+    totals, live, used = {}, groups.pop((-1, None), set()), set()
+    for (sign, base), pks in groups.items():
+        taken = {pk: quantity for pk, quantity in snapshots.filter(date=base).values_list("product_id", "quantity") if pk in pks}
+        missing = pks - taken.keys()
+        if sign == 1:
+            # Products created after the snapshot start from their opening balance
+            fresh = {pk for pk in missing if products[pk][1] >= _end_of_day(base)}
+            opening = dict(
+                StockCheckpoint.objects.filter(product_id__in=fresh, movement_id=0).values_list("product_id", "quantity")
+            )
+            taken.update((pk, opening.get(pk, 0)) for pk in fresh)
+            missing -= fresh
+            moved = _movement_totals(start=_end_of_day(base), end=end)
+        else:
+            moved = _movement_totals(start=end, end=_end_of_day(base))
+        # Anything else the snapshot missed (e.g. moved between branches) replays from live
+        live |= missing
+        if taken:
+            used.add(base)
+        for pk, quantity in taken.items():
+            totals[pk] = quantity + sign * moved.get(pk, 0)
+
+    if live:
+        moved = _movement_totals(start=end)
+        for pk in live:
+            totals[pk] = products[pk][2] - moved.get(pk, 0)
+        used.add(None)
+    return totals, used.pop() if len(used) == 1 else None
@@ -1,13 +1,84 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
-from .models import Branch, Product, Sale, SaleItem, StockMovement
+from . import archive, exports, ledger_report, offline_catalog, reports, rollups
+from .caches import LRUCache, scan_cache
+from .search import fts_query
+from .transactions import commit_buffer
+from .models import (
+    AuditLog,
+    Branch,
+    DailySalesRollup,
+    LedgerEntry,
+    OutboxMessage,
+    Product,
+    ProductTombstone,
+    Purchase,
+    PurchaseItem,
+    ReportJob,
+    Sale,
+    SaleItem,
+    StockCheckpoint,
+    StockMovement,
+    Vendor,
+)
+from .outbox import drain, enqueue_mail
+from .queries import QueryRecorder, sql_template
+from .stock import checkpoint_stock, on_hand, rebuild_on_hand, snapshot_inventory, stock_as_of, verify_on_hand
 
 User = get_user_model()
 
 
+def statements(ctx, prefix):
+    """Statements in a CaptureQueriesContext starting with ``prefix`` (an executemany counts once)."""
+    return sum(re.sub(r"^\d+ times: ", "", q["sql"]).startswith(prefix) for q in ctx.captured_queries)
+
+
+class AuthenticatedTestCase(TestCase):
+    """
+    The fixture most API tests start from: ``self.branch`` and ``self.user``,
+    a ``role`` user of that branch (of none if ``branch_user`` is false),
+    whom ``self.client`` is logged in as. Subclasses add their own rows
+    after ``super().setUp()``.
+    """
+    username = "manager"
+    role = "manager"
+    branch_user = True
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Main Branch")
+        self.user = User.objects.create_user(
+            username=self.username, password="password123", role=self.role,
+            branch=self.branch if self.branch_user else None,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
 class RetailAPITestCase(TestCase):
     def setUp(self):
         # Create a branch
@@ -88,8 +159,8 @@ class RetailAPITestCase(TestCase):
         """Ensure product list returns branch-specific products."""
         response = self.client.get("/api/products/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue(len(response.data) >= 1)
-        self.assertEqual(response.data[0]["name"], "Burger")
+        self.assertTrue(len(response.data["results"]) >= 1)
+        self.assertEqual(response.data["results"][0]["name"], "Burger")
 
     def test_sale_permissions(self):
         """Ensure user can only see sales of their branch."""
@@ -101,3 +172,1878 @@ class RetailAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(len(response.data) >= 1)
         self.assertEqual(response.data[0]["branch"], self.branch.id)
+
+
+class SaleTotalsTestCase(AuthenticatedTestCase):
+    username = "cashier"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(name=f"Item {i}", sku=f"SKU-{i}", price=10, branch=self.branch, quantity=100)
+            for i in range(40)
+        ]
+
+    def _post_sale(self, invoice_no, lines, discount="0.00"):
+        payload = {
+            "invoice_no": invoice_no,
+            "branch": self.branch.id,
+            "discount": discount,
+            "items": [
+                {"product": product.id, "quantity": 2, "unit_price": "10.00"} for product in lines
+            ],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/sales/", payload, format="json")
+        return response, ctx
+
+    def test_totals_written_once(self):
+        """A 40-line basket inserts its items in one statement and never re-saves the Sale."""
+        response, ctx = self._post_sale("INV-40", self.products, discount="5.00")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        sale = Sale.objects.get(invoice_no="INV-40")
+        self.assertEqual(sale.subtotal, Decimal("800.00"))
+        self.assertEqual(sale.total_amount, Decimal("795.00"))
+        self.assertEqual(sale.items.count(), 40)
+        self.assertEqual(StockMovement.objects.filter(reference="SAL-INV-40", movement_type="out").count(), 40)
+
+        self.assertEqual(statements(ctx, 'UPDATE "api_sale"'), 0)
+        self.assertEqual(statements(ctx, 'INSERT INTO "api_saleitem"'), 1)
+
+    def test_repeated_product_lines_reserve_combined_quantity(self):
+        product = self.products[0]
+        product.quantity = 3
+        product.save()
+
+        response, _ = self._post_sale("INV-DUP", [product, product])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Sale.objects.filter(invoice_no="INV-DUP").exists())
+
+    def test_purchase_totals_written_once(self):
+        payload = {
+            "invoice_no": "PUR-1",
+            "branch": self.branch.id,
+            "items": [
+                {"product": product.id, "quantity": 5, "unit_cost": "4.00"} for product in self.products[:10]
+            ],
+        }
+        manager = User.objects.create_user(username="manager", password="password123", role="manager")
+        self.client.force_authenticate(manager)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/purchases/", payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        purchase = Purchase.objects.get(invoice_no="PUR-1")
+        self.assertEqual(purchase.total_amount, Decimal("200.00"))
+        self.assertEqual(sum(q["sql"].startswith('UPDATE "api_purchase"') for q in ctx.captured_queries), 0)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].quantity, 105)
+
+
+class BulkSaleIngestTestCase(AuthenticatedTestCase):
+    username = "cashier"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.burger = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=10)
+        self.fries = Product.objects.create(name="Fries", sku="FRS", price=50, branch=self.branch, quantity=10)
+
+    def _sale(self, invoice_no, product, quantity):
+        return {
+            "invoice_no": invoice_no,
+            "branch": self.branch.id,
+            "items": [{"product": product.id, "quantity": quantity, "unit_price": "10.00"}],
+        }
+
+    def test_bulk_creates_valid_sales_and_reports_failures(self):
+        payload = [
+            self._sale("POS-1", self.burger, 4),
+            self._sale("POS-2", self.fries, 2),
+            self._sale("POS-1", self.fries, 1),  # duplicate invoice in batch
+            self._sale("POS-3", self.burger, 7),  # only 6 burgers left after POS-1
+            {"invoice_no": "POS-4", "items": []},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/sales/bulk/", payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 3)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "created", "error", "error", "error"],
+        )
+        self.assertIn("invoice_no", response.data["results"][2]["errors"])
+        self.assertIn("items", response.data["results"][3]["errors"])
+
+        self.burger.refresh_from_db()
+        self.fries.refresh_from_db()
+        self.assertEqual(self.burger.quantity, 6)
+        self.assertEqual(self.fries.quantity, 8)
+        self.assertEqual(StockMovement.objects.filter(movement_type="out").count(), 2)
+        self.assertEqual(LedgerEntry.objects.filter(reference__startswith="SAL-POS-").count(), 2)
+        self.assertEqual(AuditLog.objects.filter(action="CREATE", model_name="Sale").count(), 2)
+
+    def test_bulk_query_count_does_not_grow_per_sale(self):
+        def ingest(prefix, count):
+            payload = [self._sale(f"{prefix}-{i}", self.burger, 1) for i in range(count)]
+            self.burger.quantity = 1000
+            self.burger.save()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post("/api/sales/bulk/", payload, format="json")
+            self.assertEqual(response.data["created"], count)
+            return len(ctx.captured_queries)
+
+        ingest("A", 1)  # creates today's rollup row
+        self.assertEqual(ingest("B", 5), ingest("C", 50))
+
+    def test_invoice_written_during_ingest_fails_only_that_sale(self):
+        from . import views
+        create_sales = views.create_sales
+
+        def racing(*args, **kwargs):
+            # The first upload of the same batch commits POS-2 after validation
+            if not Sale.objects.filter(invoice_no="POS-2").exists():
+                Sale.objects.create(invoice_no="POS-2", branch=self.branch, created_by=self.user)
+            return create_sales(*args, **kwargs)
+
+        payload = [self._sale(f"POS-{n}", self.burger, 1) for n in range(1, 4)]
+        with mock.patch.object(views, "create_sales", side_effect=racing):
+            response = self.client.post("/api/sales/bulk/", payload, format="json")
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["created", "error", "created"])
+        self.assertEqual(
+            response.data["results"][1]["errors"], {"invoice_no": ["A sale with this invoice_no already exists."]}
+        )
+
+    def test_conflicting_chunk_is_retried_by_halves(self):
+        from . import views
+        create_sales = views.create_sales
+        calls = []
+
+        def racing(*args, **kwargs):
+            calls.append(len(args[0]))
+            if not Sale.objects.filter(invoice_no="POS-3").exists():
+                Sale.objects.create(invoice_no="POS-3", branch=self.branch, created_by=self.user)
+            return create_sales(*args, **kwargs)
+
+        self.burger.quantity = 100
+        self.burger.save()
+        payload = [self._sale(f"POS-{n}", self.burger, 1) for n in range(1, 9)]
+        with mock.patch.object(views, "create_sales", side_effect=racing):
+            response = self.client.post("/api/sales/bulk/", payload, format="json")
+        self.assertEqual(response.data["created"], 7)
+        self.assertEqual(response.data["results"][2]["status"], "error")
+        self.assertEqual(calls, [8, 4, 2, 2, 1, 1, 4])
+
+    def test_bulk_writes_every_row_of_a_sale(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/sales/bulk/", [self._sale("POS-1", self.burger, 2)], format="json")
+        sale = Sale.objects.get(pk=response.data["results"][0]["id"])
+        self.assertIsNotNone(sale.created_at)
+        item = sale.items.get()
+        self.assertEqual((item.product_name, item.quantity, item.total_price), ("Burger", 2, Decimal("20.00")))
+        movement = StockMovement.objects.get(reference="SAL-POS-1")
+        self.assertEqual((movement.product_id, movement.quantity, movement.movement_type), (self.burger.pk, 2, "out"))
+        self.assertIsNotNone(movement.created_at)
+        ledger = LedgerEntry.objects.get(reference="SAL-POS-1")
+        self.assertEqual((ledger.amount, ledger.transaction_type), (Decimal("20.00"), "credit"))
+        self.assertEqual(AuditLog.objects.get(model_name="Sale", object_id=str(sale.pk)).action, "CREATE")
+
+    def test_bulk_rejects_non_list(self):
+        response = self.client.post("/api/sales/bulk/", {"invoice_no": "X"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StockReservationTestCase(TransactionTestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Main Branch")
+        self.user = User.objects.create_user(
+            username="cashier", password="password123", branch=self.branch, role="cashier"
+        )
+        self.product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=25)
+
+    def _checkout(self, invoice_no, quantity=1):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {
+            "invoice_no": invoice_no,
+            "branch": self.branch.id,
+            "items": [{"product": self.product.id, "quantity": quantity, "unit_price": "100.00"}],
+        }
+        return client.post("/api/sales/", payload, format="json").status_code
+
+    def test_insufficient_stock_is_conflict(self):
+        self.assertEqual(self._checkout("INV-1", quantity=26), status.HTTP_409_CONFLICT)
+        self.assertFalse(Sale.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 25)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        def worker(n):
+            try:
+                return self._checkout(f"INV-{n}")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            codes = list(pool.map(worker, range(40)))
+
+        self.product.refresh_from_db()
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), 25)
+        self.assertEqual(codes.count(status.HTTP_409_CONFLICT), 15)
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(Sale.objects.count(), 25)
+
+
+class StockLedgerTestCase(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=20)
+
+    def _move(self, movement_type, quantity):
+        return StockMovement.objects.create(
+            product=self.product, branch=self.branch, movement_type=movement_type, quantity=quantity
+        )
+
+    def test_quantity_is_derived_from_checkpoint_and_movements(self):
+        self._move("in", 10)
+        self._move("out", 4)
+        self._move("adjustment", -1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 25)
+        self.assertEqual(on_hand([self.product.id])[0], {self.product.id: 25})
+
+        self.assertEqual(checkpoint_stock(), 1)
+        self.assertEqual(self.product.checkpoints.first().quantity, 25)
+        self._move("return", 2)
+        self.assertEqual(on_hand([self.product.id])[0], {self.product.id: 27})
+        self.assertEqual(verify_on_hand(), [])
+
+    def test_rebuild_repairs_drifted_quantity(self):
+        self._move("in", 5)
+        Product.objects.filter(pk=self.product.pk).update(quantity=999)
+        self.assertEqual(verify_on_hand()[0]["computed"], 25)
+
+        response = self.client.post("/api/stock-movements/rebuild/", {"products": [self.product.id]}, format="json")
+        self.assertEqual(response.data, {"updated": 1, "negative": []})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 25)
+        self.assertEqual(self.client.get("/api/stock-movements/verify/").data["count"], 0)
+
+        # A bare list of ids is accepted too; other bodies are rejected
+        Product.objects.filter(pk=self.product.pk).update(quantity=999)
+        response = self.client.post("/api/stock-movements/rebuild/", [self.product.id], format="json")
+        self.assertEqual(response.data, {"updated": 1, "negative": []})
+        for body in (["x"], "1"):
+            response = self.client.post("/api/stock-movements/rebuild/", body, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_movements_are_append_only(self):
+        movement = self._move("in", 5)
+        movement.quantity = 50
+        with self.assertRaises(ValueError):
+            movement.save()
+        url = f"/api/stock-movements/{movement.id}/"
+        self.assertEqual(self.client.patch(url, {"quantity": 1}, format="json").status_code, 405)
+        self.assertEqual(self.client.delete(url).status_code, 405)
+
+    def test_quantity_edit_becomes_adjustment(self):
+        response = self.client.patch(f"/api/products/{self.product.id}/", {"quantity": 12}, format="json")
+        self.assertEqual(response.data["quantity"], 12)
+        movement = StockMovement.objects.get(product=self.product)
+        self.assertEqual((movement.movement_type, movement.quantity), ("adjustment", -8))
+        self.assertEqual(rebuild_on_hand()["updated"], 0)
+
+    def test_sale_and_purchase_movements_match_quantity(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post(
+            "/api/sales/",
+            {
+                "invoice_no": "INV-1",
+                "branch": self.branch.id,
+                "items": [{"product": self.product.id, "quantity": 3, "unit_price": "100.00"}],
+            },
+            format="json",
+        )
+        self.assertEqual(StockCheckpoint.objects.count(), 1)
+        self.assertEqual(verify_on_hand(), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 17)
+
+
+class StockAsOfTestCase(AuthenticatedTestCase):
+    username = "admin"
+    role = "admin"
+
+    def setUp(self):
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+        self.product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=100)
+        Product.objects.filter(pk=self.product.pk).update(created_at=self._at(1))
+        Product.objects.create(name="Fries", sku="FRI", price=50, branch=self.other, quantity=7)
+        # Day 10: -10, day 20: +5, day 31: -20
+        for day, movement_type, quantity in [(10, "out", 10), (20, "in", 5), (31, "out", 20)]:
+            movement = StockMovement.objects.create(
+                product=self.product, branch=self.branch, movement_type=movement_type, quantity=quantity
+            )
+            StockMovement.objects.filter(pk=movement.pk).update(created_at=self._at(day))
+
+    def _at(self, day):
+        return datetime(2025, 1, day, 12, tzinfo=dt_timezone.utc)
+
+    def _as_of(self, day):
+        return stock_as_of(datetime(2025, 1, day).date(), self.branch.id)
+
+    def test_without_snapshots_replays_back_from_live_quantity(self):
+        self.assertEqual(self._as_of(15), ({self.product.id: 90}, None))
+        self.assertEqual(self._as_of(25)[0], {self.product.id: 95})
+
+    def test_replays_only_from_nearest_snapshot(self):
+        snapshot_inventory(datetime(2025, 1, 15).date())
+        self.assertEqual(self.product.inventory_snapshots.get().quantity, 90)
+
+        # Forward from the snapshot, and backward to before it
+        self.assertEqual(self._as_of(25), ({self.product.id: 95}, datetime(2025, 1, 15).date()))
+        self.assertEqual(self._as_of(5)[0], {self.product.id: 100})
+
+    def test_branches_start_from_their_own_snapshots(self):
+        fries = Product.objects.get(sku="FRI")
+        Product.objects.filter(pk=fries.pk).update(created_at=self._at(1))
+        # Fries: 7, day 10: +3, day 20: +2
+        for day, quantity in [(10, 3), (20, 2)]:
+            movement = StockMovement.objects.create(product=fries, branch=self.other, movement_type="in", quantity=quantity)
+            StockMovement.objects.filter(pk=movement.pk).update(created_at=self._at(day))
+        on = lambda day: datetime(2025, 1, day).date()
+
+        # Only the main branch is snapshotted on day 15
+        snapshot_inventory(on(15), self.branch.id)
+        self.assertEqual(stock_as_of(on(16)), ({self.product.id: 90, fries.id: 10}, None))
+        self.assertEqual(stock_as_of(on(31))[0], {self.product.id: 75, fries.id: 12})
+        # The other branch is snapshotted on day 25 only: day 5 rolls each back from its own
+        snapshot_inventory(on(25), self.other.id)
+        self.assertEqual(stock_as_of(on(5)), ({self.product.id: 100, fries.id: 7}, None))
+        self.assertEqual(stock_as_of(on(16), self.branch.id), ({self.product.id: 90}, on(15)))
+
+    def test_endpoint(self):
+        snapshot_inventory(datetime(2025, 1, 15).date())
+        response = self.client.get("/api/products/stock-as-of/", {"date": "2025-01-31", "branch": self.branch.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["snapshot"], datetime(2025, 1, 15).date())
+        self.assertEqual([row["quantity"] for row in response.data["results"]], [75])
+        self.assertEqual(self.client.get("/api/products/stock-as-of/").status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class KeysetPaginationTestCase(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=100)
+        for n in range(7):
+            StockMovement.objects.create(product=product, branch=self.branch, movement_type="in", quantity=1)
+        # Shared timestamps: the id tiebreaker has to keep pages disjoint
+        same = timezone.now()
+        StockMovement.objects.filter(pk__in=StockMovement.objects.order_by("id").values("pk")[2:6]).update(created_at=same)
+        self.expected = list(StockMovement.objects.order_by("-created_at", "-id").values_list("pk", flat=True))
+
+    def test_walks_forward_and_back_without_gaps_or_repeats(self):
+        url, pages = "/api/stock-movements/?page_size=3", []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row["id"] for row in response.data["results"]])
+            url = response.data["next"]
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        previous = self.client.get(response.data["previous"]).data
+        self.assertEqual([row["id"] for row in previous["results"]], pages[1])
+        self.assertEqual([row["id"] for row in self.client.get(previous["previous"]).data["results"]], pages[0])
+
+    def test_pages_are_fetched_by_key_not_offset(self):
+        first = self.client.get("/api/stock-movements/?page_size=3")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data["next"])
+        self.assertFalse(any("OFFSET" in query["sql"] for query in queries.captured_queries))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/stock-movements/?cursor=bogus").status_code, 404)
+
+
+class SparseFieldsTestCase(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            name="Burger", sku="BRG", barcode="123", description="Big", price=100, branch=self.branch, quantity=5
+        )
+
+    def _get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"], [q["sql"] for q in queries.captured_queries]
+
+    def test_fields_trims_payload_and_columns(self):
+        rows, sql = self._get("/api/products/", {"fields": "id,name,sku,barcode,price,quantity"})
+        self.assertEqual(set(rows[0]), {"id", "name", "sku", "barcode", "price", "quantity"})
+        product_sql = [query for query in sql if "api_product" in query][-1]
+        self.assertNotIn("description", product_sql)
+        self.assertNotIn("api_branch", product_sql)
+
+    def test_omit_and_nested_relation(self):
+        rows, sql = self._get("/api/products/", {"omit": "description,image,image_url"})
+        self.assertNotIn("description", rows[0])
+        self.assertEqual(rows[0]["branch"]["name"], "Main Branch")
+        # One row query (branch joined), besides the conditional-GET aggregate
+        self.assertEqual(sum("api_product" in query and "COUNT(" not in query for query in sql), 1)
+
+    def test_dotted_sources_join_only_what_they_read(self):
+        Sale.objects.create(invoice_no="INV-1", branch=self.branch, created_by=self.user)
+        rows, sql = self._get("/api/sales/", {"fields": "id,invoice_no,branch_name"})
+        self.assertEqual(rows, [{"id": rows[0]["id"], "invoice_no": "INV-1", "branch_name": "Main Branch"}])
+        sale_sql = [query for query in sql if "api_sale" in query][-1]
+        self.assertIn('"api_branch"."name"', sale_sql)
+        self.assertNotIn('"api_branch"."location"', sale_sql)
+        self.assertNotIn("api_saleitem", " ".join(sql))
+
+    def test_writes_ignore_selection(self):
+        response = self.client.patch(f"/api/products/{self.product.id}/?fields=id", {"name": "Cheeseburger"}, format="json")
+        self.assertEqual(response.data["name"], "Cheeseburger")
+
+
+@override_settings(CATALOG_SYNC_PAGE_SIZE=2)
+class CatalogSyncTestCase(AuthenticatedTestCase):
+    username = "till"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+        self.products = [
+            Product.objects.create(name=f"Item {n}", sku=f"SKU-{n}", price=10, branch=self.branch, quantity=5)
+            for n in range(3)
+        ]
+        Product.objects.create(name="Elsewhere", sku="OTHER", price=10, branch=self.other)
+
+    def _sync(self, since=None):
+        params = {"since": since} if since else {}
+        response = self.client.get("/api/products/changes/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _sync_all(self, since=None):
+        changed, deleted = [], []
+        while True:
+            data = self._sync(since)
+            changed += [row["sku"] for row in data["changed"]]
+            deleted += [row["sku"] for row in data["deleted"]]
+            since = data["next"]
+            if not data["more"]:
+                return changed, deleted, since
+
+    def test_initial_load_then_deltas(self):
+        changed, deleted, cursor = self._sync_all()
+        self.assertEqual(changed, ["SKU-0", "SKU-1", "SKU-2"])
+        self.assertEqual(self._sync_all(cursor)[:2], ([], []))
+
+        self.products[1].is_active = False
+        self.products[1].save()
+        self.products[2].delete()
+        StockMovement.objects.create(product=self.products[0], branch=self.branch, movement_type="out", quantity=1)
+        changed, deleted, _ = self._sync_all(cursor)
+        self.assertEqual(changed, ["SKU-1", "SKU-0"])
+        self.assertEqual(deleted, ["SKU-2"])
+
+    def test_product_moved_to_another_branch(self):
+        _, _, cursor = self._sync_all()
+        other_till = User.objects.create_user(username="other-till", password="x", branch=self.other, role="cashier")
+        self.client.force_authenticate(other_till)
+        _, _, other_cursor = self._sync_all()
+
+        self.products[1].branch = self.other
+        self.products[1].save()
+        self.assertEqual(self._sync_all(other_cursor)[:2], (["SKU-1"], []))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self._sync_all(cursor)[:2], ([], ["SKU-1"]))
+
+        admin = User.objects.create_user(username="admin", password="x", role="admin")
+        self.client.force_authenticate(admin)
+        _, deleted, _ = self._sync_all(cursor)
+        self.assertEqual(deleted, [])
+
+    def test_change_committed_with_an_old_timestamp_is_not_missed(self):
+        _, _, cursor = self._sync_all()
+        self.products[0].name = "Renamed"
+        self.products[0].save()
+        _, _, cursor = self._sync_all(cursor)
+        # Stamped before a long transaction, committed after the cursor moved on
+        stamped = timezone.now() - timedelta(minutes=5)
+        Product.objects.filter(pk=self.products[1].pk).update(price=11, updated_at=stamped)
+        ProductTombstone.objects.filter(pk=ProductTombstone.objects.create(
+            product_id=999, branch=self.branch, sku="GONE"
+        ).pk).update(deleted_at=stamped)
+        self.assertEqual(self._sync_all(cursor)[:2], (["SKU-1"], ["GONE"]))
+
+    def test_deletions_before_first_load_are_skipped(self):
+        self.products[2].delete()
+        changed, deleted, _ = self._sync_all()
+        self.assertEqual((changed, deleted), (["SKU-0", "SKU-1"], []))
+
+    def test_up_to_date_sync_is_cheap(self):
+        _, _, cursor = self._sync_all()
+        with self.assertNumQueries(2):
+            self.client.get("/api/products/changes/", {"since": cursor, "fields": "id,sku,price,quantity"})
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/products/changes/", {"since": "nope"}).status_code, 400)
+
+
+class OfflineCatalogTestCase(AuthenticatedTestCase):
+    username = "till"
+    role = "cashier"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(OFFLINE_CATALOG_ROOT=self.tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        super().setUp()
+        self.burger = Product.objects.create(
+            name="Burger", sku="BRG", barcode="5000001", price="4.50", branch=self.branch, quantity=5
+        )
+        Product.objects.create(name="Retired", sku="OLD", barcode="5000002", price=1, branch=self.branch, is_active=False)
+
+    def _download(self, **headers):
+        response = self.client.get("/api/products/offline-catalog/", **headers)
+        if response.status_code == status.HTTP_200_OK:
+            path = f"{self.tmp.name}/download.sqlite3"
+            with open(path, "wb") as f:
+                f.write(b"".join(response.streaming_content))
+            return response, sqlite3.connect(path)
+        return response, None
+
+    def test_download_holds_active_products_with_barcode_index(self):
+        response, db = self._download()
+        self.addCleanup(db.close)
+        self.assertEqual(
+            db.execute("SELECT name, price FROM products WHERE barcode = ?", ("5000001",)).fetchall(),
+            [("Burger", "4.50")],
+        )
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM products").fetchone(), (1,))
+        plan = db.execute("EXPLAIN QUERY PLAN SELECT * FROM products WHERE barcode = '1'").fetchall()
+        self.assertIn("products_barcode", str(plan))
+        self.assertEqual(dict(db.execute("SELECT key, value FROM meta"))["version"], response["ETag"].strip('"'))
+
+    def test_etag_and_rebuild_only_on_change(self):
+        first, db = self._download()
+        db.close()
+        self.assertEqual(self._download(HTTP_IF_NONE_MATCH=first["ETag"])[0].status_code, 304)
+
+        path, _ = offline_catalog.build_catalog(self.branch.id)
+        mtime = path.stat().st_mtime_ns
+        self.assertEqual(offline_catalog.build_catalog(self.branch.id)[0].stat().st_mtime_ns, mtime)
+
+        self.burger.price = "5.00"
+        self.burger.save()
+        second, db = self._download(HTTP_IF_NONE_MATCH=first["ETag"])
+        db.close()
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertFalse(path.exists())
+
+    def test_catalog_deleted_before_it_is_opened_is_rebuilt(self):
+        build_catalog = offline_catalog.build_catalog
+
+        def superseded(branch_id):
+            # A newer build's cleanup removes the file between build and open
+            path, fingerprint = build_catalog(branch_id)
+            if superseded.first:
+                superseded.first = False
+                path.unlink()
+            return path, fingerprint
+
+        superseded.first = True
+        with mock.patch.object(offline_catalog, "build_catalog", side_effect=superseded):
+            response, db = self._download()
+        self.addCleanup(db.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM products").fetchone(), (1,))
+
+
+class ScanLookupTestCase(AuthenticatedTestCase):
+    username = "till"
+    role = "cashier"
+
+    def setUp(self):
+        scan_cache.clear()
+        self.addCleanup(scan_cache.clear)
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+        self.product = Product.objects.create(
+            name="Burger", sku="BRG", barcode="5000001", price=100, branch=self.branch, quantity=10
+        )
+        Product.objects.create(name="Fries", sku="FRI", barcode="5000002", price=50, branch=self.other)
+
+    def test_resolves_barcode_then_sku_within_branch(self):
+        self.assertEqual(self.client.get("/api/products/scan/5000001/").data["id"], self.product.id)
+        self.assertEqual(self.client.get("/api/products/scan/BRG/").data["id"], self.product.id)
+        self.assertEqual(self.client.get("/api/products/scan/5000002/").status_code, 404)
+
+    def test_repeat_scans_are_served_from_cache(self):
+        self.client.get("/api/products/scan/5000001/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/products/scan/5000001/")
+        self.assertEqual(response.data["quantity"], 10)
+
+    def test_invalidated_when_another_product_takes_the_code(self):
+        # Resolved through the SKU fallback, then a new product carries it as barcode
+        self.assertEqual(self.client.get("/api/products/scan/BRG/").data["id"], self.product.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            combo = Product.objects.create(name="Combo", sku="CMB", barcode="BRG", price=150, branch=self.branch)
+        self.assertEqual(self.client.get("/api/products/scan/BRG/").data["id"], combo.id)
+
+        # An edit moves a barcode onto a product
+        self.assertEqual(self.client.get("/api/products/scan/CMB/").data["id"], combo.id)
+        self.product.barcode = "CMB"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get("/api/products/scan/CMB/").data["id"], self.product.id)
+
+    def test_invalidated_on_save_delete_and_stock_updates(self):
+        url = "/api/products/scan/5000001/"
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            StockMovement.objects.create(product=self.product, branch=self.branch, movement_type="out", quantity=3)
+        self.assertEqual(self.client.get(url).data["quantity"], 7)
+
+        self.product.refresh_from_db()
+        self.product.price = 120
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(url).data["price"], "120.00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_lru_is_bounded(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1, tags=["x"])
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+        cache.invalidate("x")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 1)
+
+
+class CatalogCacheTestCase(AuthenticatedTestCase):
+    username = "till"
+    role = "cashier"
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        shared = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "catalog-tests"},
+            "shared": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": root.name},
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+        self.burger = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=10)
+        self.fries = Product.objects.create(name="Fries", sku="FRI", price=50, branch=self.other)
+
+    def _names(self, url="/api/products/"):
+        return [row["name"] for row in self.client.get(url).data["results"]]
+
+    def test_repeat_listing_is_served_from_cache(self):
+        self.assertEqual(self._names(), ["Burger"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self._names(), ["Burger"])
+        self.client.get("/api/branches/")
+        with self.assertNumQueries(0):
+            self.client.get("/api/branches/")
+
+    def test_product_writes_retire_their_branch_only(self):
+        self.assertEqual(self._names(), ["Burger"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fries.price = 55
+            self.fries.save()
+        with self.assertNumQueries(0):
+            self._names()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fries.branch = self.branch
+            self.fries.save()
+        self.assertEqual(self._names(), ["Fries", "Burger"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockMovement.objects.create(product=self.burger, branch=self.branch, movement_type="out", quantity=4)
+        quantities = {row["name"]: row["quantity"] for row in self.client.get("/api/products/").data["results"]}
+        self.assertEqual(quantities["Burger"], 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.delete()
+        self.assertEqual(self._names(), ["Fries"])
+
+    def test_branch_writes_retire_branch_and_product_listings(self):
+        self.client.get("/api/products/")
+        self.assertEqual(len(self.client.get("/api/branches/").data["results"]), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branch.name = "Flagship"
+            self.branch.save()
+        self.assertEqual(self.client.get("/api/products/").data["results"][0]["branch"]["name"], "Flagship")
+        with self.captureOnCommitCallbacks(execute=True):
+            Branch.objects.create(name="Airport")
+        self.assertEqual(len(self.client.get("/api/branches/").data["results"]), 3)
+
+
+class ConditionalGetTestCase(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vendor = Vendor.objects.create(name="Acme Foods")
+        self.product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch)
+
+    def test_list_answers_304_without_serializing(self):
+        first = self.client.get("/api/vendors/")
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("Last-Modified", first)
+        with mock.patch("api.serializers.VendorSerializer.to_representation") as serialize, self.assertNumQueries(1):
+            second = self.client.get("/api/vendors/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+        serialize.assert_not_called()
+        since = self.client.get("/api/vendors/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+    def test_validator_follows_changes_deletes_and_query(self):
+        etag = self.client.get("/api/vendors/")["ETag"]
+        self.vendor.phone = "555-0100"
+        self.vendor.save()
+        changed = self.client.get("/api/vendors/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertNotEqual(self.client.get("/api/vendors/?fields=id,name")["ETag"], changed["ETag"])
+
+        Vendor.objects.create(name="Beta Bakery")
+        etag = self.client.get("/api/vendors/")["ETag"]
+        Vendor.objects.filter(name="Beta Bakery").delete()
+        self.assertEqual(self.client.get("/api/vendors/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_and_related_changes(self):
+        url = f"/api/products/{self.product.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branch.name = "Flagship"
+            self.branch.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["branch"]["name"], "Flagship")
+        self.assertEqual(self.client.get("/api/products/999999/", HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_sale_edits_move_the_sale_validator(self):
+        sale = Sale.objects.create(invoice_no="INV-1", branch=self.branch, created_by=self.user)
+        item = SaleItem.objects.create(sale=sale, product=self.product, quantity=1, unit_price=100)
+        etag = self.client.get("/api/sales/")["ETag"]
+        item.quantity = 2
+        item.save()
+        response = self.client.get("/api/sales/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["total_amount"], "200.00")
+
+    def test_renamed_item_product_moves_sale_and_purchase_validators(self):
+        sale = Sale.objects.create(invoice_no="INV-1", branch=self.branch, created_by=self.user)
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=1, unit_price=100)
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=1, unit_price=100)
+        purchase = Purchase.objects.create(invoice_no="PUR-1", vendor=self.vendor, branch=self.branch, created_by=self.user)
+        PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=1, unit_cost=50, total_price=50)
+        etags = {url: self.client.get(url)["ETag"] for url in ("/api/sales/", "/api/purchases/")}
+        self.assertEqual(self.client.get("/api/sales/", HTTP_IF_NONE_MATCH=etags["/api/sales/"]).status_code, 304)
+
+        self.product.name = "Cheeseburger"
+        self.product.save()
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["results"][0]["items"][0]["product_name"], "Cheeseburger")
+
+
+    def test_deleted_item_moves_sale_and_purchase_validators(self):
+        sale = Sale.objects.create(invoice_no="INV-1", branch=self.branch, created_by=self.user)
+        first = SaleItem.objects.create(sale=sale, product=self.product, quantity=1, unit_price=100)
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=2, unit_price=100)
+        purchase = Purchase.objects.create(invoice_no="PUR-1", vendor=self.vendor, branch=self.branch, created_by=self.user)
+        bought = PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=1, unit_cost=50, total_price=50)
+        PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=2, unit_cost=50, total_price=100)
+        urls = ["/api/sales/", f"/api/sales/{sale.id}/", "/api/purchases/", f"/api/purchases/{purchase.id}/"]
+        etags = {url: self.client.get(url)["ETag"] for url in urls}
+
+        # The older item of each, so the latest item timestamp stays put
+        self.assertEqual(self.client.delete(f"/api/sale-items/{first.id}/").status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(f"/api/purchase-items/{bought.id}/").status_code, status.HTTP_204_NO_CONTENT)
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            items = response.data["results"][0]["items"] if "results" in response.data else response.data["items"]
+            self.assertEqual(len(items), 1)
+
+class FastListTestCase(AuthenticatedTestCase):
+    username = "admin1"
+    role = "admin"
+    branch_user = False
+
+    def setUp(self):
+        super().setUp()
+        self.burger = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=50)
+        self.fries = Product.objects.create(name="Fries", sku="FRI", price=50, branch=self.branch, quantity=50)
+        for n in range(3):
+            sale = Sale.objects.create(
+                invoice_no=f"INV-{n}", branch=self.branch if n else None, created_by=self.user if n != 1 else None,
+                discount=Decimal("1.50"), customer_name="Walk-in" if n else None,
+            )
+            SaleItem.objects.create(sale=sale, product=self.burger, quantity=n + 1, unit_price=Decimal("99.99"))
+            SaleItem.objects.create(sale=sale, product=self.fries if n else None, quantity=1, unit_price=50)
+        StockMovement.objects.create(product=self.burger, branch=self.branch, movement_type="in", quantity=5, created_by=self.user)
+        StockMovement.objects.create(product=self.fries, movement_type="out", quantity=2, note="spill")
+
+    def _both(self, url, params=None):
+        from .views import FastListMixin
+        fast = self.client.get(url, params)
+        with mock.patch.object(FastListMixin, "fast_list", False):
+            slow = self.client.get(url, params)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_output_is_byte_identical(self):
+        for url in ("/api/sales/", "/api/stock-movements/"):
+            self._both(url)
+            self._both(url, {"fields": "id,branch_name,created_at"})
+            self._both(url, {"omit": "created_by_name"})
+        first = self._both("/api/sales/", {"page_size": 2})
+        self._both(first.data["next"])
+
+    def test_rows_come_from_two_queries_without_serializers(self):
+        with mock.patch("api.serializers.SaleSerializer.to_representation") as serialize:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/api/sales/")
+        serialize.assert_not_called()
+        self.assertEqual(len(response.data["results"]), 3)
+        rows = [q["sql"] for q in queries.captured_queries if "COUNT(" not in q["sql"]]
+        self.assertEqual(len(rows), 2)
+
+
+class SalesRollupTestCase(AuthenticatedTestCase):
+    username = "cashier"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.other = Branch.objects.create(name="Second Branch")
+        self.admin = User.objects.create_user(username="admin1", password="password123", role="admin")
+        self.burger = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=100)
+
+    def _rollup(self):
+        return list(
+            DailySalesRollup.objects.order_by("day", "branch_id", "payment_method", "cashier_id").values(
+                "day", "branch_id", "payment_method", "cashier_id", "sale_count", "item_quantity",
+                "subtotal", "discount", "total_amount",
+            )
+        )
+
+    def _sale(self, invoice_no, quantity, **fields):
+        sale = Sale.objects.create(invoice_no=invoice_no, **{"branch": self.branch, "created_by": self.user, **fields})
+        SaleItem.objects.create(sale=sale, product=self.burger, quantity=quantity, unit_price=Decimal("10.00"))
+        return sale
+
+    def test_incremental_updates_match_backfill(self):
+        payload = {
+            "invoice_no": "API-1",
+            "branch": self.branch.id,
+            "payment_method": "card",
+            "items": [{"product": self.burger.id, "quantity": 2, "unit_price": "10.00"}],
+        }
+        self.assertEqual(self.client.post("/api/sales/", payload, format="json").status_code, status.HTTP_201_CREATED)
+        bulk = [dict(payload, invoice_no=f"BULK-{n}", payment_method=None) for n in range(3)]
+        self.assertEqual(self.client.post("/api/sales/bulk/", bulk, format="json").data["created"], 3)
+
+        moved = self._sale("ORM-1", 3, discount=Decimal("1.50"))
+        kept = self._sale("ORM-2", 1, branch=self.other)
+        gone = self._sale("ORM-3", 4)
+        moved.payment_method = "cash"
+        moved.branch = self.other
+        moved.save()
+        item = kept.items.get()
+        item.quantity = 5
+        item.save()
+        SaleItem.objects.create(sale=kept, product=self.burger, quantity=2, unit_price=Decimal("2.50"))
+        moved.items.get().delete()
+        Sale.objects.get(pk=gone.pk).delete()
+
+        incremental = self._rollup()
+        self.assertEqual(sum(row["sale_count"] for row in incremental), 6)
+        self.assertEqual(sum(row["item_quantity"] for row in incremental), 2 + 6 + 7)
+        rollups.backfill()
+        self.assertEqual(incremental, self._rollup())
+
+    def test_repeated_edits_of_one_instance(self):
+        sale = self._sale("ORM-1", 3)
+        item = sale.items.get()
+        # Each save is a delta from the one before it
+        sale.branch = self.other
+        sale.save()
+        sale.payment_method = "card"
+        sale.save()
+        item.quantity = 5
+        item.save()
+        item.quantity = 4
+        item.save()
+
+        incremental = [row for row in self._rollup() if row["sale_count"]]
+        self.assertEqual(
+            [(row["branch_id"], row["payment_method"], row["item_quantity"]) for row in incremental],
+            [(self.other.id, "card", 4)],
+        )
+        rollups.backfill()
+        self.assertEqual(incremental, self._rollup())
+
+    def test_backfill_repairs_a_range_and_command_reports_rows(self):
+        self._sale("ORM-1", 2)
+        old = self._sale("ORM-2", 3)
+        Sale.objects.filter(pk=old.pk).update(created_at=timezone.now() - timezone.timedelta(days=400))
+        rollups.backfill()
+        DailySalesRollup.objects.update(sale_count=99)
+        today = timezone.localdate()
+        self.assertEqual(rollups.backfill(start=today, end=today), 1)
+        self.assertEqual(DailySalesRollup.objects.get(day=today).sale_count, 1)
+        self.assertEqual(DailySalesRollup.objects.exclude(day=today).get().sale_count, 99)
+
+        out = StringIO()
+        call_command("backfill_sales_rollup", stdout=out)
+        self.assertIn("Wrote 2 rollup row(s).", out.getvalue())
+        self.assertEqual([row["sale_count"] for row in self._rollup()], [1, 1])
+
+    def test_reports_read_the_rollup_for_the_requested_window(self):
+        self._sale("ORM-1", 2, payment_method="cash")
+        self._sale("ORM-2", 1, payment_method="card")
+        self._sale("ORM-3", 5, branch=self.other)
+        old = self._sale("ORM-4", 1)
+        Sale.objects.filter(pk=old.pk).update(created_at=timezone.now() - timezone.timedelta(days=400))
+        rollups.backfill()
+        today = timezone.localdate()
+
+        with CaptureQueriesContext(connection) as queries:
+            daily = self.client.get("/api/sales/daily-report/")
+        self.assertFalse(any('FROM "api_sale"' in query["sql"] for query in queries.captured_queries))
+        self.assertEqual(
+            daily.data,
+            [{"day": today, "total": Decimal("30.00"), "subtotal": Decimal("30.00"),
+              "discount": Decimal("0.00"), "sales": 2, "items": 3}],
+        )
+        card = self.client.get("/api/sales/daily-report/", {"payment_method": "card"})
+        self.assertEqual(card.data[0]["total"], Decimal("10.00"))
+
+        self.client.force_authenticate(self.admin)
+        weekly = self.client.get("/api/sales/weekly-report/")
+        self.assertEqual(weekly.data[0]["week"], today - timezone.timedelta(days=today.weekday()))
+        self.assertEqual(weekly.data[0]["sales"], 3)
+        monthly = self.client.get("/api/sales/monthly-report/", {"start": "2000-01-01", "branch": self.branch.id})
+        self.assertEqual([row["sales"] for row in monthly.data], [2, 1])
+        self.assertEqual(monthly.data[0]["month"], today.replace(day=1))
+        self.assertEqual(self.client.get("/api/sales/daily-report/", {"start": "yesterday"}).status_code, 400)
+
+
+class SalesExcelExportTestCase(AuthenticatedTestCase):
+    username = "admin1"
+    role = "admin"
+    branch_user = False
+
+    def setUp(self):
+        super().setUp()
+        for n in range(5):
+            Sale.objects.create(invoice_no=f"INV-{n}", branch=self.branch, created_by=self.user, total_amount=n)
+
+    def _workbook(self, response):
+        from openpyxl import load_workbook
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], exports.XLSX_CONTENT_TYPE)
+        self.assertIn('filename="sales_report.xlsx"', response["Content-Disposition"])
+        return load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+
+    def test_streams_every_sale_with_local_datetimes(self):
+        with mock.patch("pandas.DataFrame") as dataframe:
+            workbook = self._workbook(self.client.get("/api/reports/sales_excel/"))
+        dataframe.assert_not_called()
+        rows = list(workbook["Sales"].values)
+        header = rows[0]
+        self.assertEqual(header, tuple(field.attname for field in Sale._meta.concrete_fields))
+        self.assertEqual([row[header.index("invoice_no")] for row in rows[1:]], [f"INV-{n}" for n in range(5)])
+        sale = Sale.objects.get(invoice_no="INV-0")
+        # Excel keeps milliseconds
+        self.assertAlmostEqual(
+            rows[1][header.index("created_at")], timezone.make_naive(sale.created_at), delta=timezone.timedelta(milliseconds=1)
+        )
+
+    def test_long_exports_continue_on_further_sheets(self):
+        with mock.patch.object(exports, "XLSX_MAX_ROWS", 3):
+            workbook = self._workbook(self.client.get("/api/reports/sales_excel/"))
+        self.assertEqual(workbook.sheetnames, ["Sales", "Sales (2)", "Sales (3)"])
+        self.assertEqual([len(list(sheet.values)) for sheet in workbook.worksheets], [3, 3, 2])
+
+    def test_empty_export_has_a_header(self):
+        Sale.objects.all().delete()
+        workbook = self._workbook(self.client.get("/api/reports/sales_excel/"))
+        self.assertEqual(len(list(workbook["Sales"].values)), 1)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/reports/sales_excel/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StreamingDumpTestCase(AuthenticatedTestCase):
+    username = "admin1"
+    role = "admin"
+    branch_user = False
+
+    def setUp(self):
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+        self.product = Product.objects.create(name="Burger", sku="BRG-1", price=100, quantity=50, branch=self.branch)
+        for n, (branch, day) in enumerate([(self.branch, 1), (self.branch, 2), (self.other, 2), (self.branch, 3)]):
+            sale = Sale.objects.create(invoice_no=f"INV-{n}", branch=branch, created_by=self.user, total_amount=n)
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=n + 1, unit_price=100, total_price=100)
+            Sale.objects.filter(pk=sale.pk).update(created_at=datetime(2025, 1, day, 12, tzinfo=dt_timezone.utc))
+
+    def _dump(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv_streams_every_row_with_a_header(self):
+        response, body = self._dump("/api/reports/sales.csv/")
+        self.assertEqual(response["Content-Type"], exports.STREAM_CONTENT_TYPES["csv"])
+        self.assertIn('filename="sales.csv"', response["Content-Disposition"])
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[0], [field.attname for field in Sale._meta.concrete_fields])
+        invoice = rows[0].index("invoice_no")
+        self.assertEqual([row[invoice] for row in rows[1:]], ["INV-0", "INV-1", "INV-2", "INV-3"])
+
+    def test_ndjson_filters_by_date_range_and_branch(self):
+        response, body = self._dump(
+            "/api/reports/sale-items.ndjson/", start="2025-01-02", end="2025-01-03", branch=self.branch.pk
+        )
+        self.assertEqual(response["Content-Type"], exports.STREAM_CONTENT_TYPES["ndjson"])
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["quantity"] for row in rows], [2, 4])
+        # Decimals keep their decimal places; datetimes are ISO 8601 in UTC
+        self.assertEqual(rows[0]["unit_price"], "100.00")
+        item = SaleItem.objects.get(pk=rows[0]["id"])
+        self.assertEqual(rows[0]["updated_at"], item.updated_at.isoformat().replace("+00:00", "Z"))
+        self.assertEqual(datetime.fromisoformat(rows[0]["updated_at"]), item.updated_at)
+
+    def test_decimals_are_written_with_their_decimal_places(self):
+        LedgerEntry.objects.all().delete()
+        for amount in ("100", "12.5", "-0.25", "0.1", "9999999999.99"):
+            LedgerEntry.objects.create(description=amount, transaction_type="credit", amount=Decimal(amount), branch=self.branch)
+        _, body = self._dump("/api/reports/ledger-entries.csv/")
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([row["amount"] for row in rows], ["100.00", "12.50", "-0.25", "0.10", "9999999999.99"])
+        _, body = self._dump("/api/reports/ledger-entries.ndjson/")
+        self.assertEqual([json.loads(line)["amount"] for line in body.splitlines()],
+                         ["100.00", "12.50", "-0.25", "0.10", "9999999999.99"])
+
+    def test_managers_only_dump_their_branch(self):
+        manager = User.objects.create_user(username="manager1", password="password123", role="manager", branch=self.other)
+        self.client.force_authenticate(manager)
+        _, body = self._dump("/api/reports/sales.ndjson/", branch=self.branch.pk)
+        self.assertEqual([json.loads(line)["invoice_no"] for line in body.splitlines()], ["INV-2"])
+
+    def test_rows_are_read_in_chunks(self):
+        LedgerEntry.objects.all().delete()
+        for n in range(5):
+            LedgerEntry.objects.create(description=f"Entry {n}", transaction_type="credit", amount=n, branch=self.branch)
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            _, body = self._dump("/api/reports/ledger-entries.ndjson/")
+        self.assertEqual([json.loads(line)["description"] for line in body.splitlines()], [f"Entry {n}" for n in range(5)])
+
+    def test_requires_admin_or_manager(self):
+        cashier = User.objects.create_user(username="cashier1", password="password123", role="cashier", branch=self.branch)
+        self.client.force_authenticate(cashier)
+        self.assertEqual(self.client.get("/api/reports/stock-movements.csv/").status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/reports/stock-movements.csv/").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get("/api/reports/products.csv/").status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LedgerPdfTestCase(AuthenticatedTestCase):
+    username = "manager1"
+
+    def setUp(self):
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+
+    def _entries(self, branch, day, amounts):
+        for n, amount in enumerate(amounts):
+            entry = LedgerEntry.objects.create(
+                description=f"Entry {day}-{n}",
+                transaction_type="debit" if amount < 0 else "credit",
+                amount=abs(amount),
+                branch=branch,
+            )
+            LedgerEntry.objects.filter(pk=entry.pk).update(date=datetime(2025, 1, day, 12, tzinfo=dt_timezone.utc) + timedelta(minutes=n))
+
+    def _pdf(self, **params):
+        with mock.patch.object(ledger_report, "PAGE_COMPRESSION", 0):
+            response = self.client.get("/api/reports/ledger_pdf/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        body = b"".join(response.streaming_content)
+        self.assertTrue(body.startswith(b"%PDF"))
+        return body
+
+    def test_long_ledgers_break_onto_pages_with_running_totals(self):
+        self._entries(self.branch, 1, [10] * 120)
+        body = self._pdf()
+        pages = len(re.findall(rb"/Type /Page\b(?!s)", body))
+        self.assertGreater(pages, 2)
+        self.assertEqual(body.count(b"(Carried forward) Tj"), pages - 1)
+        self.assertEqual(body.count(b"(Brought forward) Tj"), pages - 1)
+        self.assertIn(f"(Page {pages}) Tj".encode(), body)
+        self.assertIn(b"(1,200.00) Tj", body)
+
+    def test_batches_of_pages_join_into_one_document(self):
+        self._entries(self.branch, 1, [10] * 250)
+        with mock.patch.object(ledger_report, "BATCH_PAGES", 2):
+            body = self._pdf()
+        pages = len(re.findall(rb"/Type /Page\b(?!s)", body))
+        self.assertGreater(pages, 4)
+        # One page tree and catalog, whose kids are every page in order
+        self.assertEqual(len(re.findall(rb"/Type /Pages\b", body)), 1)
+        self.assertEqual(len(re.findall(rb"/Type /Catalog\b", body)), 1)
+        self.assertIn(b"/Count %d " % pages, body)
+        self.assertEqual([f"(Page {n}) Tj".encode() in body for n in range(1, pages + 1)], [True] * pages)
+        self.assertIn(b"(2,500.00) Tj", body)
+        # Every cross-reference entry points at its object
+        xref = int(body[body.rindex(b"startxref") + 9:].split()[0])
+        lines = body[xref:body.index(b"trailer", xref)].split(b"\n")
+        size = int(lines[1].split()[1])
+        self.assertIn(b"/Size %d " % size, body)
+        for number, line in enumerate(lines[3:2 + size], 1):
+            offset = int(line.split()[0])
+            self.assertTrue(body[offset:].startswith(b"%d 0 obj" % number), number)
+
+    def test_filters_by_date_and_branch_from_an_opening_balance(self):
+        self._entries(self.branch, 1, [100, -30])
+        self._entries(self.branch, 2, [5, -1])
+        self._entries(self.other, 2, [1000])
+        body = self._pdf(start="2025-01-02", end="2025-01-02", branch=self.other.pk)
+        self.assertIn(b"(Main Branch", body)
+        self.assertIn(b"(Entry 2-0) Tj", body)
+        self.assertNotIn(b"(Entry 1-0) Tj", body)
+        # Opening 70.00, then +5 and -1
+        self.assertIn(b"(70.00) Tj", body)
+        self.assertIn(b"(74.00) Tj", body)
+        self.assertNotIn(b"1,000.00", body)
+
+    def test_sales_and_purchases_recorded_through_the_api(self):
+        product = Product.objects.create(name="Burger", sku="BRG", price=10, branch=self.branch, quantity=10)
+        purchase = {"invoice_no": "PUR-1", "branch": self.branch.id, "items": [{"product": product.id, "quantity": 5, "unit_cost": "4.00"}]}
+        sale = {"invoice_no": "INV-1", "branch": self.branch.id, "items": [{"product": product.id, "quantity": 3, "unit_price": "10.00"}]}
+        self.assertEqual(self.client.post("/api/purchases/", purchase, format="json").status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post("/api/sales/", sale, format="json").status_code, status.HTTP_201_CREATED)
+
+        # Debits 20.00 (purchase), credits 30.00 (sale)
+        body = self._pdf()
+        self.assertIn(b"(20.00) Tj", body)
+        self.assertIn(b"(30.00) Tj", body)
+        self.assertIn(b"(10.00) Tj", body)
+        self.assertNotIn(b"(50.00) Tj", body)
+
+        LedgerEntry.objects.update(date=datetime(2025, 1, 1, 12, tzinfo=dt_timezone.utc))
+        body = self._pdf(start="2025-01-02")
+        self.assertEqual(body.count(b"(10.00) Tj"), 2)  # opening and closing balance
+
+    def test_compressed_pages_decode(self):
+        # The production path: reportlab's pageCompression (ASCII85, then Flate)
+        self._entries(self.branch, 1, [10] * 120)
+        response = self.client.get("/api/reports/ledger_pdf/")
+        body = b"".join(response.streaming_content)
+        self.assertNotIn(b"(Carried forward) Tj", body)
+        pages = []
+        # Follow each page's /Contents to its object and inflate the stream
+        for ref in re.findall(rb"/Contents (\d+) 0 R", body):
+            header = re.search(rb"\n" + ref + rb" 0 obj\s*<<(.*?)>>\s*stream\r?\n", body, re.S)
+            self.assertIn(b"/FlateDecode", header.group(1))
+            length = int(re.search(rb"/Length (\d+)", header.group(1)).group(1))
+            stream = body[header.end():header.end() + length]
+            if b"/ASCII85Decode" in header.group(1):
+                stream = base64.a85decode(stream.strip(), adobe=True)
+            pages.append(zlib.decompress(stream))
+        self.assertEqual(len(pages), len(re.findall(rb"/Type /Page\b(?!s)", body)))
+        self.assertGreater(len(pages), 1)
+        self.assertIn(b"(Carried forward) Tj", pages[0])
+        self.assertIn(b"(1,200.00) Tj", pages[-1])
+        self.assertIn(b"(Closing balance) Tj", pages[-1])
+
+    def test_empty_ledger_still_renders_a_page(self):
+        body = self._pdf()
+        self.assertEqual(len(re.findall(rb"/Type /Page\b(?!s)", body)), 1)
+        self.assertIn(b"(Closing balance) Tj", body)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/reports/ledger_pdf/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ReportJobTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, REPORT_WORKERS=0))
+        self.reports = f"{media.name}/reports"
+        self.branch = Branch.objects.create(name="Main Branch")
+        self.other = Branch.objects.create(name="Other Branch")
+        self.manager = User.objects.create_user(username="manager1", password="password123", role="manager", branch=self.branch)
+        self.api = APIClient()
+        self.api.force_authenticate(self.manager)
+        LedgerEntry.objects.create(description="Opening", transaction_type="credit", amount=50, branch=self.branch)
+
+    def _queue(self, url, **data):
+        # REPORT_WORKERS=0: the job is rendered when the request's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post(url, data, format="json")
+        return response
+
+    def test_post_queues_a_job_polled_until_its_artifact_is_ready(self):
+        response = self._queue("/api/reports/ledger_pdf/", start="2000-01-01")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertEqual(response.data["params"], {"branch": self.branch.id, "end": None, "start": "2000-01-01"})
+        self.assertTrue(response["Location"].endswith(f"/api/report-jobs/{response.data['id']}/"))
+
+        job = self.api.get(response["Location"]).data
+        self.assertEqual(job["status"], "done")
+        download = self.api.get(job["download"])
+        self.assertEqual(download["Content-Type"], "application/pdf")
+        self.assertIn('filename="ledger_report.pdf"', download["Content-Disposition"])
+        self.assertTrue(b"".join(download.streaming_content).startswith(b"%PDF"))
+        self.assertEqual(len(os.listdir(self.reports)), 1)
+
+    def test_identical_request_over_unchanged_data_reuses_the_artifact(self):
+        first = self._queue("/api/reports/ledger_pdf/")
+        with mock.patch.object(ledger_report, "render") as render:
+            again = self._queue("/api/reports/ledger_pdf/")
+        render.assert_not_called()
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data["id"], first.data["id"])
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+        # Different filters are a different report
+        self.assertEqual(self._queue("/api/reports/ledger_pdf/", end="2000-01-01").status_code, status.HTTP_202_ACCEPTED)
+
+    def test_changed_data_renders_again_and_expires_the_old_artifact(self):
+        first = self._queue("/api/reports/ledger_pdf/").data
+        old = ReportJob.objects.get(pk=first["id"]).artifact.path
+        LedgerEntry.objects.create(description="Later", transaction_type="debit", amount=5, branch=self.branch)
+
+        second = self._queue("/api/reports/ledger_pdf/")
+        self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+        self.assertNotEqual(second.data["id"], first["id"])
+        self.assertEqual(ReportJob.objects.get(pk=first["id"]).status, "expired")
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(self.api.get(f"/api/report-jobs/{first['id']}/download/").status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.api.get(f"/api/report-jobs/{second.data['id']}/").data["status"], "done")
+
+    def test_failed_jobs_are_recorded_and_not_reused(self):
+        with mock.patch.object(ledger_report, "render", side_effect=RuntimeError("out of paper")):
+            failed = self._queue("/api/reports/ledger_pdf/").data
+        job = self.api.get(f"/api/report-jobs/{failed['id']}/").data
+        self.assertEqual((job["status"], job["error"], job["download"]), ("failed", "out of paper", None))
+        self.assertEqual(os.listdir(self.reports), [])
+        self.assertNotEqual(self._queue("/api/reports/ledger_pdf/").data["id"], failed["id"])
+
+    def test_dumps_and_branch_scope(self):
+        Sale.objects.create(invoice_no="INV-1", branch=self.branch, created_by=self.manager)
+        Sale.objects.create(invoice_no="INV-2", branch=self.other, created_by=self.manager)
+        response = self._queue("/api/reports/sales.csv/", branch=self.other.id)
+        self.assertEqual(response.data["params"]["branch"], self.branch.id)
+        download = self.api.get(f"/api/report-jobs/{response.data['id']}/download/")
+        rows = list(csv.DictReader(StringIO(b"".join(download.streaming_content).decode())))
+        self.assertEqual([row["invoice_no"] for row in rows], ["INV-1"])
+
+        staff = User.objects.create_user(username="staff1", password="password123", role="staff", branch=self.branch)
+        outsider = User.objects.create_user(username="staff2", password="password123", role="staff", branch=self.other)
+        self.api.force_authenticate(staff)
+        self.assertEqual(self.api.post("/api/reports/sales.csv/").status_code, status.HTTP_403_FORBIDDEN)
+        # Nor do they see dumps queued by managers, only other reports of their branch
+        self.assertEqual(self.api.get(f"/api/report-jobs/{response.data['id']}/").status_code, status.HTTP_404_NOT_FOUND)
+        ledger = self._queue("/api/reports/ledger_pdf/").data
+        self.assertEqual(self.api.get(f"/api/report-jobs/{ledger['id']}/").status_code, status.HTTP_200_OK)
+        self.api.force_authenticate(outsider)
+        self.assertEqual(self.api.get(f"/api/report-jobs/{ledger['id']}/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_run_report_jobs_picks_up_jobs_of_a_stopped_worker(self):
+        with override_settings(REPORT_WORKERS=2), mock.patch.object(reports, "_submit"):
+            job_id = self._queue("/api/reports/ledger_pdf/").data["id"]
+        # A worker that died mid-render
+        ReportJob.objects.filter(pk=job_id).update(status="running", started_at=timezone.now() - timedelta(hours=2))
+        call_command("run_report_jobs", stdout=StringIO())
+        self.assertEqual(ReportJob.objects.get(pk=job_id).status, "done")
+
+    def test_admin_export_actions_queue_jobs(self):
+        from openpyxl import load_workbook
+        admin_user = User.objects.create_superuser(username="root", password="password123", email="root@example.com")
+        sale = Sale.objects.create(invoice_no="INV-9", branch=self.branch, created_by=self.manager)
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/admin/api/sale/", {"action": "export_excel", "_selected_action": [sale.pk]}, follow=True
+            )
+        job = ReportJob.objects.get(kind="admin_export")
+        self.assertContains(response, f"report job #{job.pk}")
+        download = self.client.get(f"/admin/api/reportjob/{job.pk}/download/")
+        self.assertIn('filename="sales.xlsx"', download["Content-Disposition"])
+        rows = list(load_workbook(BytesIO(b"".join(download.streaming_content)), read_only=True)["sales"].values)
+        self.assertEqual(rows[1][:3], (sale.pk, "INV-9", "Main Branch"))
+
+    def test_admin_export_of_a_large_selection_stores_id_runs(self):
+        from openpyxl import load_workbook
+        admin_user = User.objects.create_superuser(username="root", password="password123", email="root@example.com")
+        sales = [Sale.objects.create(invoice_no=f"INV-{n}", branch=self.branch, created_by=self.manager) for n in range(6)]
+        picked = [sale.pk for sale in sales[:3] + sales[4:]]
+        self.assertEqual(reports.pk_ranges(picked), [[picked[0], picked[2]], [picked[3], picked[4]]])
+        self.client.force_login(admin_user)
+        # One run per query, as a selection too sparse for one statement would be read
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(reports, "RUNS_PER_QUERY", 1):
+            self.client.post("/admin/api/sale/", {"action": "export_excel", "_selected_action": picked})
+        job = ReportJob.objects.get(kind="admin_export")
+        self.assertEqual(job.params["pk_ranges"], [[picked[0], picked[2]], [picked[3], picked[4]]])
+        download = self.client.get(f"/admin/api/reportjob/{job.pk}/download/")
+        rows = list(load_workbook(BytesIO(b"".join(download.streaming_content)), read_only=True)["sales"].values)
+        self.assertEqual([row[0] for row in rows[1:]], picked)
+
+    def test_missing_artifact_is_gone(self):
+        job_id = self._queue("/api/reports/ledger_pdf/").data["id"]
+        os.remove(ReportJob.objects.get(pk=job_id).artifact.path)
+        admin_user = User.objects.create_superuser(username="root", password="password123", email="root@example.com")
+        self.client.force_login(admin_user)
+        self.assertEqual(self.client.get(f"/admin/api/reportjob/{job_id}/download/").status_code, status.HTTP_410_GONE)
+        self.assertEqual(ReportJob.objects.get(pk=job_id).status, "expired")
+
+        job_id = self._queue("/api/reports/ledger_pdf/").data["id"]
+        os.remove(ReportJob.objects.get(pk=job_id).artifact.path)
+        self.assertEqual(self.api.get(f"/api/report-jobs/{job_id}/download/").status_code, status.HTTP_410_GONE)
+        self.assertEqual(self._queue("/api/reports/ledger_pdf/").status_code, status.HTTP_202_ACCEPTED)
+
+    def test_admin_exports_are_per_user(self):
+        from django.contrib.auth.models import Permission
+        sale = Sale.objects.create(invoice_no="INV-9", branch=self.branch, created_by=self.manager)
+        views = Permission.objects.filter(codename__in=["view_sale", "view_reportjob"])
+        clerks = [
+            User.objects.create_user(username=name, password="password123", branch=self.branch, is_staff=True)
+            for name in ("clerk1", "clerk2")
+        ]
+        jobs = []
+        for clerk in clerks:
+            clerk.user_permissions.set(views)
+            self.client.force_login(clerk)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post("/admin/api/sale/", {"action": "export_pdf", "_selected_action": [sale.pk]})
+            job = ReportJob.objects.filter(kind="admin_export").first()
+            self.assertEqual(job.created_by, clerk)
+            self.assertEqual(self.client.get(f"/admin/api/reportjob/{job.pk}/download/").status_code, 200)
+            jobs.append(job.pk)
+        self.assertNotEqual(jobs[0], jobs[1])
+
+
+class QueryBudgetTestCase(AuthenticatedTestCase):
+    username = "root"
+    role = "admin"
+
+    # Queries per request, however many rows there are
+    budgets = {
+        "/api/branches/": 2,
+        "/api/products/": 2,
+        "/api/products/low-stock/": 1,
+        "/api/vendors/": 2,
+        "/api/purchases/": 3,
+        "/api/purchase-items/": 2,
+        "/api/sales/": 3,
+        "/api/sales/daily-report/": 1,
+        "/api/sale-items/": 2,
+        "/api/ledger-entries/": 2,
+        "/api/stock-movements/": 2,
+        "/api/audit-logs/": 2,
+        "/api/users/": 2,
+        "/api/report-jobs/": 2,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.rows = 0
+
+    def _grow(self, n):
+        for _ in range(n):
+            i = self.rows = self.rows + 1
+            branch = Branch.objects.create(name=f"Branch {i}")
+            user = User.objects.create_user(username=f"user{i}", password="password123", branch=branch)
+            vendor = Vendor.objects.create(name=f"Vendor {i}")
+            product = Product.objects.create(name=f"Item {i}", sku=f"SKU-{i}", price=10, branch=branch, quantity=0)
+            purchase = Purchase.objects.create(invoice_no=f"PUR-{i}", vendor=vendor, branch=branch, created_by=user)
+            PurchaseItem.objects.create(purchase=purchase, product=product, quantity=5, unit_cost=5)
+            sale = Sale.objects.create(invoice_no=f"INV-{i}", branch=branch, created_by=user)
+            SaleItem.objects.create(sale=sale, product=product, quantity=1, unit_price=10)
+            StockMovement.objects.create(product=product, branch=branch, movement_type="in", quantity=5, created_by=user)
+            LedgerEntry.objects.create(description=f"Entry {i}", transaction_type="credit", amount=10, branch=branch, created_by=user)
+
+    def _measure(self):
+        counts = {}
+        for url in self.budgets:
+            with QueryRecorder() as recorder:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertEqual(recorder.repeated(3), [], f"{url}: {recorder.repeated(3)}")
+            counts[url] = recorder.count
+        return counts
+
+    def test_endpoints_stay_within_budget_as_data_grows(self):
+        self._grow(2)
+        small = self._measure()
+        self._grow(8)
+        large = self._measure()
+        for url, budget in self.budgets.items():
+            self.assertLessEqual(large[url], budget, url)
+            self.assertEqual(large[url], small[url], url)
+
+    def test_middleware_reports_and_flags_repeats(self):
+        self._grow(6)
+        with override_settings(QUERY_INSPECTION=True):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            with self.assertNoLogs("api.queries", "WARNING"):
+                response = client.get("/api/sale-items/")
+        self.assertEqual(response["X-Query-Count"], str(self._measure()["/api/sale-items/"]))
+
+        with QueryRecorder() as recorder:
+            for product in Product.objects.all():
+                Branch.objects.filter(pk=product.branch_id).first()
+        self.assertEqual(recorder.repeated(5)[0][1], Product.objects.count())
+
+    def test_templates_ignore_list_lengths(self):
+        self.assertEqual(
+            sql_template('SELECT 1 FROM "t" WHERE "id" IN (%s, %s, %s)'),
+            sql_template('SELECT 1 FROM "t" WHERE "id" IN (%s, %s)'),
+        )
+        self.assertEqual(
+            sql_template('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)'),
+            sql_template('INSERT INTO "t" ("a", "b") VALUES (%s, %s)'),
+        )
+
+
+class TokenClaimsTestCase(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        shared = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "token-tests"},
+            "shared": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": root.name},
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        self.branch = Branch.objects.create(name="Main Branch")
+        self.user = User.objects.create_user(
+            username="till", password="password123", branch=self.branch, role="cashier"
+        )
+        self.product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=10)
+        self.client = APIClient()
+
+    def _login(self):
+        response = self.client.post("/api/token/", {"username": "till", "password": "password123"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _use(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_tokens_carry_claims_and_gets_skip_the_user_row(self):
+        tokens = self._login()
+        access = AccessToken(tokens["access"])
+        self.assertEqual((access["role"], access["branch_id"], access["username"]), ("cashier", self.branch.id, "till"))
+        self._use(tokens["access"])
+        self.assertEqual(self.client.get("/api/products/").data["results"][0]["name"], "Burger")
+        with self.assertNumQueries(0):
+            self.client.get("/api/products/")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/api/sales/").status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "api_customuser"' in q["sql"]])
+
+    def test_writes_record_the_token_user(self):
+        self._use(self._login()["access"])
+        payload = {"invoice_no": "INV-1", "branch": self.branch.id, "items": [{"product": self.product.id, "quantity": 1, "unit_price": "100.00"}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/sales/", payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created_by_name"], "till")
+        self.assertTrue(AuditLog.objects.filter(model_name="Sale", user=self.user).exists())
+
+    def test_stale_claims_are_refused(self):
+        tokens = self._login()
+        self._use(tokens["access"])
+        self.user.role = "manager"
+        self.user.save()
+        self.assertEqual(self.client.get("/api/sales/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+        refreshed = self.client.post("/api/token/refresh/", {"refresh": tokens["refresh"]}, format="json").data
+        self.assertEqual(AccessToken(refreshed["access"])["role"], "manager")
+        self._use(refreshed["access"])
+        self.assertEqual(self.client.get("/api/sales/").status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/sales/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_without_claims_load_the_user(self):
+        self._use(str(RefreshToken.for_user(self.user).access_token))
+        self.assertEqual(self.client.get("/api/products/").status_code, status.HTTP_200_OK)
+
+
+class ProductSearchTestCase(AuthenticatedTestCase):
+    username = "till"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.other = Branch.objects.create(name="Other Branch")
+        self.burger = Product.objects.create(name="Cheese Burger", sku="BRG-01", price=100, branch=self.branch)
+        self.wrap = Product.objects.create(
+            name="Chicken Wrap", sku="WRP-01", description="Comes with cheese sauce", price=80, branch=self.branch
+        )
+        Product.objects.create(name="Cheese Fries", sku="FRI-01", price=50, branch=self.other)
+
+    def _search(self, q):
+        response = self.client.get("/api/products/search/", {"q": q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["name"] for row in response.data["results"]]
+
+    def test_prefix_and_ranked_within_branch(self):
+        self.assertEqual(self._search("chee"), ["Cheese Burger", "Chicken Wrap"])
+        self.assertEqual(self._search("brg-0"), ["Cheese Burger"])
+        self.assertEqual(self._search("chick wr"), ["Chicken Wrap"])
+        self.assertEqual(self._search('"*) OR ('), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.burger.name = "Veggie Burger"
+        self.burger.save()
+        self.assertEqual(self._search("veg"), ["Veggie Burger"])
+        self.assertEqual(self._search("cheese burger"), [])
+        self.wrap.delete()
+        self.assertEqual(self._search("chicken"), [])
+
+    def test_admin_search_uses_index(self):
+        admin_user = User.objects.create_superuser(username="root", password="password123", email="root@example.com")
+        self.client.force_login(admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/api/product/", {"q": "wrap"})
+        self.assertContains(response, "Chicken Wrap")
+        self.assertNotContains(response, "Cheese Burger")
+        self.assertTrue(any("api_product_fts MATCH" in query["sql"] for query in queries.captured_queries))
+
+    def test_query_is_sanitised(self):
+        self.assertEqual(fts_query('BRG-01 "x" OR'), '"BRG"* "01"* "x"* "OR"*')
+        self.assertEqual(fts_query("--"), "")
+
+
+class OutboxTestCase(AuthenticatedTestCase):
+    username = "cashier"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=10)
+
+    def _sell(self, invoice_no):
+        payload = {
+            "invoice_no": invoice_no,
+            "branch": self.branch.id,
+            "items": [{"product": self.product.id, "quantity": 1, "unit_price": "100.00"}],
+        }
+        return self.client.post("/api/sales/", payload, format="json")
+
+    def test_sale_queues_mail_instead_of_sending(self):
+        self.assertEqual(self._sell("INV-1").status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, "pending")
+
+        call_command("drain_outbox", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "New Sale Recorded (Invoice INV-1)")
+        message.refresh_from_db()
+        self.assertEqual(message.status, "sent")
+
+    def test_failed_sale_queues_nothing(self):
+        self.product.quantity = 0
+        self.product.save()
+        self.assertEqual(self._sell("INV-1").status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failed_send_is_retried_then_given_up(self):
+        message = enqueue_mail("Hello", "Body")
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=SMTPException("down")
+        ):
+            self.assertEqual(drain(max_attempts=2), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), ("pending", 1))
+            self.assertGreater(message.available_at, timezone.now())
+
+            OutboxMessage.objects.filter(pk=message.pk).update(available_at=timezone.now())
+            self.assertEqual(drain(max_attempts=2), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.last_error), ("failed", "down"))
+
+        self.assertEqual(drain(), (0, 0))
+
+    def test_unreachable_server_counts_as_a_failed_attempt(self):
+        messages = [enqueue_mail("Hello", "Body"), enqueue_mail("Again", "Body")]
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.open", side_effect=ConnectionRefusedError("refused")
+        ):
+            self.assertEqual(drain(max_attempts=2), (0, 2))
+        for message in messages:
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts, message.last_error), ("pending", 1, "refused"))
+            self.assertGreater(message.available_at, timezone.now())
+        self.assertEqual(drain(), (0, 0))
+
+
+class AuditBufferTestCase(AuthenticatedTestCase):
+    username = "cashier"
+    role = "cashier"
+
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(name=f"Item {i}", sku=f"SKU-{i}", price=10, branch=self.branch, quantity=100)
+            for i in range(20)
+        ]
+
+    def _audit_inserts(self, invoice_no, lines):
+        payload = {
+            "invoice_no": invoice_no,
+            "branch": self.branch.id,
+            "items": [{"product": p.id, "quantity": 1, "unit_price": "10.00"} for p in self.products[:lines]],
+        }
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/sales/", payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return statements(ctx, 'INSERT INTO "api_auditlog"')
+
+    def test_sale_audit_inserts_do_not_grow_with_basket(self):
+        self.assertEqual(self._audit_inserts("INV-1", 1), 1)
+        self.assertEqual(self._audit_inserts("INV-20", 20), 1)
+        self.assertTrue(AuditLog.objects.filter(model_name="Sale", object_id=str(Sale.objects.get(invoice_no="INV-20").pk)).exists())
+
+    def test_events_are_flushed_once_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Branch.objects.create(name="North")
+                Branch.objects.create(name="South")
+            self.assertFalse(AuditLog.objects.filter(model_name="Branch").exists())
+        # The audit flush and the catalog version bump
+        self.assertEqual(len(callbacks), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(statements(ctx, 'INSERT INTO "api_auditlog"'), 1)
+        self.assertEqual(AuditLog.objects.filter(model_name="Branch", action="create").count(), 2)
+
+    def test_rolled_back_events_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            try:
+                with transaction.atomic():
+                    Branch.objects.create(name="Ghost")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            Branch.objects.create(name="Real")
+        changes = AuditLog.objects.filter(model_name="Branch").values_list("changes", flat=True)
+        self.assertEqual(len(changes), 1)
+        self.assertIn("Real", changes[0])
+
+    def test_commit_buffers_are_kept_per_kind_and_savepoint(self):
+        flushed = []
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            commit_buffer("a", list, flushed.append).append(1)
+            commit_buffer("b", set, flushed.append).add(2)
+            try:
+                with transaction.atomic():
+                    commit_buffer("a", list, flushed.append).append("rolled back")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            commit_buffer("a", list, flushed.append).append(3)
+        self.assertEqual(flushed, [[1, 3], {2}])
+
+    @override_settings(AUDIT_LOG_MODELS={"Branch": ["delete"]})
+    def test_per_model_configuration(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            branch = Branch.objects.create(name="North")
+            branch.delete()
+        self.assertEqual(
+            list(AuditLog.objects.filter(model_name="Branch").values_list("action", flat=True)), ["delete"]
+        )
+
+
+class AuditDiffTestCase(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Main Branch")
+
+    def _logged(self, action):
+        entries = AuditLog.objects.filter(model_name="Product", action=action)
+        return [json.loads(entry.changes) for entry in entries]
+
+    def test_update_records_only_changed_fields(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            product = Product.objects.create(name="Burger", sku="BRG", price="100.00", branch=self.branch, quantity=10)
+            product = Product.objects.get(pk=product.pk)
+            product.quantity = 7
+            product.price = "100.00"  # same value, different type
+            product.save()
+            product.save()  # nothing changed since the last save
+
+        (created,) = self._logged("create")
+        self.assertEqual(created["sku"], "BRG")
+        self.assertEqual(created["branch"], self.branch.pk)
+        self.assertEqual(self._logged("update"), [{"quantity": [10, 7]}])
+
+    def test_update_of_deferred_instance(self):
+        product = Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=10)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            product = Product.objects.only("id", "name").get(pk=product.pk)
+            product.name = "Cheeseburger"
+            product.save(update_fields=["name"])
+        self.assertEqual(self._logged("update"), [{"name": ["Burger", "Cheeseburger"]}])
+
+    def test_payload_is_compact(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Product.objects.create(name="Burger", sku="BRG", price=100, branch=self.branch, quantity=10)
+        raw = AuditLog.objects.get(model_name="Product").changes
+        self.assertNotIn(", ", raw)
+        self.assertNotIn('": ', raw)
+
+
+class AuditArchiveTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(AUDIT_ARCHIVE_ROOT=self.tmp.name, AUDIT_ARCHIVE_AFTER_DAYS=90)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.manager = User.objects.create_user(username="manager", password="password123", role="manager")
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _entry(self, model_name, object_id, when):
+        entry = AuditLog.objects.create(
+            user=self.manager, action="update", model_name=model_name, object_id=object_id, changes='{"quantity":[1,2]}'
+        )
+        AuditLog.objects.filter(pk=entry.pk).update(timestamp=when)
+        return entry
+
+    def test_old_rows_move_to_monthly_segments(self):
+        self._entry("Product", "1", datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+        self._entry("Product", "2", datetime(2024, 1, 20, tzinfo=dt_timezone.utc))
+        self._entry("Sale", "1", datetime(2024, 2, 5, tzinfo=dt_timezone.utc))
+        recent = self._entry("Product", "1", timezone.now())
+
+        call_command("archive_audit_logs", stdout=StringIO())
+
+        self.assertEqual(list(AuditLog.objects.values_list("pk", flat=True)), [recent.pk])
+        manifest = archive.load_manifest()
+        self.assertEqual(sorted(manifest["segments"]), ["2024-01", "2024-02"])
+        self.assertEqual(manifest["segments"]["2024-01"]["rows"], 2)
+        self.assertEqual(manifest["segments"]["2024-02"]["models"], ["Sale"])
+
+        # A later run appends to the existing segment instead of rewriting it
+        self._entry("Product", "3", datetime(2024, 1, 25, tzinfo=dt_timezone.utc))
+        call_command("archive_audit_logs", stdout=StringIO())
+        self.assertEqual(archive.load_manifest()["segments"]["2024-01"]["rows"], 3)
+
+    def test_archive_pages_walk_across_segments(self):
+        when = datetime(2024, 1, 30, tzinfo=dt_timezone.utc)
+        for n in range(5):
+            self._entry("Product", str(n), when + timedelta(days=n))
+        # Two rows share a timestamp: the id keeps them in order
+        self._entry("Product", "5", when + timedelta(days=4))
+        archive.archive_audit_logs()
+        self.assertEqual(sorted(archive.load_manifest()["segments"]), ["2024-01", "2024-02"])
+
+        pages, url, params = [], "/api/audit-logs/archive/", {"limit": 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row["object_id"] for row in response.data["results"]])
+            url, params = response.data["next"], None
+        self.assertEqual(pages, [["5", "4"], ["3", "2"], ["1", "0"]])
+
+        # Back from the last page
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([row["object_id"] for row in response.data["results"]], ["3", "2"])
+        self.assertEqual(self.client.get("/api/audit-logs/archive/", {"cursor": "bogus"}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_run_that_dies_before_deleting_is_not_counted_twice(self):
+        self._entry("Product", "1", datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+        self._entry("Product", "2", datetime(2024, 1, 20, tzinfo=dt_timezone.utc))
+        save = archive._save_manifest
+
+        def save_then_die(manifest):
+            save(manifest)
+            raise RuntimeError("killed")
+
+        with mock.patch.object(archive, "_save_manifest", save_then_die), self.assertRaises(RuntimeError):
+            archive.archive_audit_logs()
+        self.assertEqual(AuditLog.objects.filter(timestamp__year=2024).count(), 2)
+
+        self.assertEqual(archive.archive_audit_logs(), 2)
+        self.assertFalse(AuditLog.objects.filter(timestamp__year=2024).exists())
+        segment = archive.load_manifest()["segments"]["2024-01"]
+        self.assertEqual(segment["rows"], 2)
+        with gzip.open(os.path.join(self.tmp.name, segment["file"]), "rt") as fh:
+            self.assertEqual(len(fh.readlines()), 2)
+
+    def test_archive_is_queryable_through_the_api(self):
+        self._entry("Product", "1", datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+        self._entry("Product", "2", datetime(2024, 1, 20, tzinfo=dt_timezone.utc))
+        self._entry("Product", "1", datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+        archive.archive_audit_logs()
+
+        response = self.client.get("/api/audit-logs/archive/", {"model_name": "Product", "object_id": "1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data["results"]
+        self.assertEqual([row["timestamp"][:10] for row in rows], ["2024-03-01", "2024-01-10"])
+        self.assertEqual(rows[0]["user_name"], "manager")
+        self.assertEqual(rows[0]["changes"], {"quantity": [1, 2]})
+        self.assertIsNone(response.data["next"])
+
+        response = self.client.get("/api/audit-logs/archive/", {"start": "2024-01-15", "end": "2024-01-31"})
+        self.assertEqual([row["object_id"] for row in response.data["results"]], ["2"])
+
+        # Limits below 1 still return the newest row
+        for limit in ("0", "-5"):
+            response = self.client.get("/api/audit-logs/archive/", {"limit": limit})
+            self.assertEqual([row["timestamp"][:10] for row in response.data["results"]], ["2024-03-01"])
+
+        response = self.client.get("/api/audit-logs/", {"model_name": "Product"})
+        self.assertEqual(response.data["results"], [])
@@ -0,0 +1,52 @@
+"""
+Per-savepoint buffers flushed on commit.
+
+``commit_buffer`` hands out a container (a list, a set) for the current
+transaction and registers one on_commit callback that passes it to a flush
+function. Callers add to it as they go, so a transaction that records many
+events still flushes them once.
+
+There is one buffer per savepoint level: Django discards the callbacks
+registered inside a savepoint that rolls back, so that savepoint's buffer
+is dropped with it while its parents' buffers are kept. A buffer is reused
+until it has been flushed or its callback is no longer queued.
+"""
+import threading
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+class _Pending:
+    flushed = False
+
+    def __init__(self, items, flush):
+        self.items = items
+        self._flush = flush
+
+    def run(self):
+        self.flushed = True
+        self._flush(self.items)
+
+
+def commit_buffer(kind, factory, flush):
+    """
+    The ``kind`` buffer of the current savepoint, created with ``factory()``
+    and passed to ``flush`` when the transaction commits. Call it inside an
+    atomic block.
+    """
+    connection = transaction.get_connection()
+    queued = [func for _, func, _ in connection.run_on_commit]
+    key = (kind, connection.alias, tuple(connection.savepoint_ids))
+    buffers = getattr(_local, "buffers", {})
+    pending = buffers.get(key)
+    if pending is None or pending.flushed or pending.run not in queued:
+        buffers = {
+            k: p for k, p in buffers.items()
+            if k[1] != connection.alias or (not p.flushed and p.run in queued)
+        }
+        pending = buffers[key] = _Pending(factory(), flush)
+        _local.buffers = buffers
+        transaction.on_commit(pending.run)
+    return pending.items
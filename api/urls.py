@@ -17,6 +17,7 @@ from .views import (
     AuditLogViewSet,
     LedgerEntryViewSet,
     ReportViewSet,
+    ReportJobViewSet,
 )
 
 # Create DRF Router
@@ -43,6 +44,7 @@ router.register(r"audit-logs", AuditLogViewSet, basename="auditlog")
 
 # Reports (Excel/PDF generation endpoints)
 router.register(r"reports", ReportViewSet, basename="report")
+router.register(r"report-jobs", ReportJobViewSet, basename="reportjob")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -1,15 +1,24 @@
 from rest_framework import viewsets, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from django.db import transaction
-from django.core.mail import send_mail
-from django.http import HttpResponse
-from django.db.models import F, Sum
-from django.db.models.functions import TruncDate
-import pandas as pd
-from io import BytesIO
-from reportlab.pdfgen import canvas
+from rest_framework.reverse import reverse
+from rest_framework.validators import UniqueValidator
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, HttpResponse
+from django.db.models import Count, F, Max, Prefetch, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date, parse_datetime
+from abc import ABC, abstractmethod
+from datetime import timedelta
+import hashlib
 
 from .models import (
     Branch,
@@ -19,10 +28,13 @@ from .models import (
     PurchaseItem,
     Sale,
     SaleItem,
+    DailySalesRollup,
     LedgerEntry,
     StockMovement,
     AuditLog,
     CustomUser,
+    ProductTombstone,
+    ReportJob,
 )
 from .serializers import (
     BranchSerializer,
@@ -36,22 +48,269 @@ from .serializers import (
     StockMovementSerializer,
     AuditLogSerializer,
     UserSerializer,
+    ReportJobSerializer,
+    create_sales,
+    quantities_by_product,
 )
+from . import catalog, ledger_report, offline_catalog
+from .archive import query_archive
+from .caches import catalog_version, scan_cache
+from .exports import spooled_response, start_of_day, stream_response, within, xlsx_response
+from .reports import DUMPS, REPORTS, open_artifact, request_job
+from .rowplan import RowPlan
+from .search import search_products
+from .exceptions import ArtifactGone, InsufficientStock
+from .stock import rebuild_on_hand, stock_as_of, verify_on_hand
+from .outbox import enqueue_mail
+from .pagination import KeysetPagination
 from .permissions import IsAdminOrManager, ReadOnly, IsStaff, IsAdminOrReadOnly
 
 
+def _date_param(params, name):
+    """Parse an optional YYYY-MM-DD query parameter."""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Use the YYYY-MM-DD format."})
+    return parsed
+
+
+class FieldSelectionMixin:
+    """
+    Narrows read querysets to the columns a ``?fields=`` / ``?omit=``
+    selection actually serializes (see SparseFieldsMixin), joining and
+    prefetching only the relations it still needs.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.selecting():
+            return queryset
+        serializer = self.get_serializer()
+        sources = {field.source.split(".")[0] for field in serializer.fields.values()}
+        prefetch = [
+            lookup
+            for lookup in queryset._prefetch_related_lookups
+            if getattr(lookup, "prefetch_to", lookup).split("__")[0] in sources
+        ]
+        queryset = queryset.prefetch_related(None).prefetch_related(*prefetch)
+
+        only = serializer.only_fields()
+        if only is None:
+            return queryset
+        only += [field.lstrip("-") for field in self.ordering_fields()]
+        relations = {path.rsplit("__", 1)[0] for path in only if "__" in path}
+        return queryset.select_related(None).select_related(*relations).only(*only)
+
+    def ordering_fields(self):
+        """Fields the response is keyed on, loaded even when not selected."""
+        return getattr(self, "cursor_ordering", ())
+
+    def selecting(self):
+        params = self.request.query_params
+        return self.request.method in SAFE_METHODS and bool(params.get("fields") or params.get("omit"))
+
+    def selected_sources(self):
+        """Model attributes the selected fields read from, or None when nothing is selected."""
+        if not self.selecting():
+            return None
+        return {field.source.split(".")[0] for field in self.get_serializer().fields.values()}
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified on ``list`` and ``retrieve``, answering
+    If-None-Match / If-Modified-Since with 304 before anything is fetched
+    or serialized. The validator is one aggregate over the rows the request
+    reads: their count and the latest of ``modified_fields`` (which may
+    follow foreign keys and nested items whose values appear in the response;
+    relations a field selection leaves out are skipped).
+    """
+
+    modified_fields = ("updated_at",)
+
+    def shown_modified_fields(self):
+        """``modified_fields`` whose relation a ?fields= / ?omit= selection (FieldSelectionMixin) still shows."""
+        selected = getattr(self, "selected_sources", None)
+        sources = selected and selected()
+        if sources is None:
+            return self.modified_fields
+        return tuple(field for field in self.modified_fields if "__" not in field or field.split("__")[0] in sources)
+
+    def validators(self, queryset, allow_empty=True):
+        fields = self.shown_modified_fields()
+        opts = queryset.model._meta
+        # Deleting a child moves no timestamp (unless it was the latest), so
+        # relations to many rows are counted as well
+        children = sorted({
+            field.split("__")[0] for field in fields
+            if "__" in field and opts.get_field(field.split("__")[0]).one_to_many
+        })
+        row = queryset.order_by().aggregate(
+            # distinct: modified_fields over a reverse relation join one row per child
+            count=Count("pk", distinct=True),
+            **{f"c{i}": Count(relation, distinct=True) for i, relation in enumerate(children)},
+            **{f"m{i}": Max(field) for i, field in enumerate(fields)},
+        )
+        if not (row["count"] or allow_empty):
+            return None, None
+        stamps = [row[f"m{i}"] for i in range(len(fields))]
+        key = "|".join([
+            self.request.get_full_path(),
+            self.request.accepted_renderer.format,
+            str(row["count"]),
+            *(str(row[f"c{i}"]) for i in range(len(children))),
+            *(stamp.isoformat() if stamp else "" for stamp in stamps),
+        ])
+        latest = max((stamp for stamp in stamps if stamp), default=None)
+        return f'"{hashlib.md5(key.encode()).hexdigest()}"', latest and int(latest.timestamp())
+
+    def list_validators(self):
+        # Listings cached per catalog version keep their validators alongside
+        cache_key = getattr(self, "list_cache_key", None)
+        key = cache_key and f"{cache_key(self.request)}:validators"
+        validators = key and cache.get(key)
+        if not validators:
+            validators = self.validators(self.filter_queryset(self.get_queryset()))
+            if key:
+                cache.set(key, validators, settings.CATALOG_CACHE_TIMEOUT)
+        return validators
+
+    def retrieve_validators(self):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: lookup})
+        except (TypeError, ValueError, DjangoValidationError):
+            return None, None
+        # Nothing to validate against a 404
+        return self.validators(queryset, allow_empty=False)
+
+    def conditional(self, validators, render, request, *args, **kwargs):
+        etag, last_modified = validators
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                not_modified["ETag"] = etag
+                return not_modified
+        response = render(request, *args, **kwargs)
+        if etag is not None and response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.list_validators(), super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(self.retrieve_validators(), super().retrieve, request, *args, **kwargs)
+
+
+class FastListMixin:
+    """
+    Renders ``list`` pages from ``.values()`` rows through a RowPlan instead
+    of a serializer per object; the JSON is the same. Falls back to the
+    serializer when a selected field can't be expressed as a column.
+    """
+
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        plan = RowPlan.compile(self.get_serializer()) if self.fast_list else None
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        ordering = [field.lstrip("-") for field in self.ordering_fields()]
+        rows = plan.values(self.filter_queryset(self.get_queryset()), *ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(list(rows)))
+
+
+class CachedListMixin(ABC):
+    """
+    Serves repeat ``list`` requests from the cache. Keys carry the catalog
+    version of every scope the listing reads (see api.caches), so the
+    save/delete signals retire stale pages without touching the cache here.
+    """
+
+    @abstractmethod
+    def catalog_scopes(self):
+        """Catalog scopes (see api.caches) the listing is built from."""
+
+    def list_cache_key(self, request):
+        versions = ",".join(f"{scope}={catalog_version(scope)}" for scope in self.catalog_scopes())
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        return f"listing:{self.basename}:{versions}:{url}"
+
+    def list(self, request, *args, **kwargs):
+        key = self.list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+
+def _branch_scope(request, params=None):
+    """Branch a request is limited to: the user's own unless admin, else ?branch= (or None for all)."""
+    user = request.user
+    if getattr(user, "role", None) != "admin" and user.branch_id:
+        return user.branch_id
+    params = request.query_params if params is None else params
+    try:
+        return int(params["branch"]) if params.get("branch") else None
+    except ValueError:
+        raise ValidationError({"branch": "Expected a branch id."})
+
+
+def _prefetch_bulk_sale_relations(payloads):
+    """Load every branch and product referenced by a bulk payload in one query each."""
+    branch_ids, product_ids = set(), set()
+    for payload in payloads:
+        if not isinstance(payload, dict):
+            continue
+        branch_ids.add(payload.get("branch"))
+        for item in payload.get("items") or []:
+            if isinstance(item, dict):
+                product_ids.add(item.get("product"))
+
+    def as_ints(values):
+        return [int(v) for v in values if isinstance(v, int) or (isinstance(v, str) and v.isdigit())]
+
+    return {
+        Branch: Branch.objects.in_bulk(as_ints(branch_ids)),
+        Product: Product.objects.in_bulk(as_ints(product_ids)),
+    }
+
+
 # ---------- BRANCH ----------
-class BranchViewSet(viewsets.ModelViewSet):
+class BranchViewSet(ConditionalGetMixin, CachedListMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Branch.objects.all()
     serializer_class = BranchSerializer
+    cursor_ordering = ("-created_at", "-id")
     permission_classes = [IsAuthenticated & (IsAdminOrManager | ReadOnly)]
 
+    def catalog_scopes(self):
+        return ["branches"]
+
 
 # ---------- PRODUCT ----------
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CachedListMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    cursor_ordering = ("-created_at", "-id")
+    modified_fields = ("updated_at", "branch__updated_at")
     permission_classes = [IsAuthenticated & (IsAdminOrManager | ReadOnly)]
+    search_max_limit = 200
 
     def get_queryset(self):
         qs = super().get_queryset().select_related("branch")
@@ -60,28 +319,166 @@ class ProductViewSet(viewsets.ModelViewSet):
             return qs.filter(branch_id=user.branch_id)
         return qs
 
+    def catalog_scopes(self):
+        # Same split as get_queryset: a branch user's catalog, or every product
+        user = self.request.user
+        if getattr(user, "role", None) != "admin" and user.branch_id:
+            return [user.branch_id]
+        return ["all"]
+
     @action(detail=False, methods=["get"], url_path="low-stock")
     def low_stock(self, request):
         low_stock_qs = self.get_queryset().filter(quantity__lte=F("reorder_level"))
-        serializer = self.get_serializer(low_stock_qs, many=True, context={"request": request})
-        return Response(serializer.data)
+        page = self.paginate_queryset(low_stock_qs)
+        serializer = self.get_serializer(page, many=True, context={"request": request})
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Ranked full-text search: ?q= matches word prefixes in name, sku, barcode and description."""
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 50)), self.search_max_limit))
+        except ValueError:
+            raise ValidationError({"limit": "Expected a number."})
+        ids = search_products(request.query_params.get("q", ""), _branch_scope(request), limit)
+        products = self.filter_queryset(self.get_queryset()).in_bulk(ids)
+        ranked = [products[pk] for pk in ids if pk in products]
+        return Response({"results": self.get_serializer(ranked, many=True).data})
+
+    @action(detail=False, methods=["get"], url_path=r"scan/(?P<code>[^/]+)")
+    def scan(self, request, code=None):
+        """Product by barcode, or by SKU when no barcode matches; cached per branch scope."""
+        branch_id = _branch_scope(request)
+        params = request.query_params
+        key = (branch_id, code, params.get("fields"), params.get("omit"))
+        data = scan_cache.get(key)
+        if data is None:
+            # Probe the barcode index, then the unique sku; branch is checked in
+            # Python so the planner can't prefer the much wider branch index
+            product = None
+            for lookup in ({"barcode": code}, {"sku": code}):
+                matches = Product.objects.select_related("branch").filter(**lookup).order_by("pk")
+                product = next((p for p in matches if branch_id is None or p.branch_id == branch_id), None)
+                if product is not None:
+                    break
+            if product is None:
+                return Response({"detail": "No product with this barcode or SKU."}, status=status.HTTP_404_NOT_FOUND)
+            data = dict(self.get_serializer(product).data)
+            # Dropped when the product changes, or when any product takes or gives up this code
+            scan_cache.set(key, data, tags=[product.pk, ("code", code)])
+        return Response(data)
+
+    @action(detail=False, methods=["get"], url_path="stock-as-of")
+    def stock_as_of(self, request):
+        """Quantity of each product at the end of ?date=YYYY-MM-DD (optionally ?branch=)."""
+        day = _date_param(request.query_params, "date")
+        if day is None:
+            raise ValidationError({"date": "This query parameter is required."})
+        branch_id = _branch_scope(request)
+
+        quantities, snapshot = stock_as_of(day, branch_id)
+        products = Product.objects.all() if branch_id is None else Product.objects.filter(branch_id=branch_id)
+        products = products.order_by("pk").values_list("pk", "name", "sku", "branch_id")
+        return Response({
+            "date": day,
+            "branch": branch_id,
+            "snapshot": snapshot,
+            "results": [
+                {"product": pk, "name": name, "sku": sku, "branch": branch, "quantity": quantities[pk]}
+                for pk, name, sku, branch in products
+                if pk in quantities
+            ],
+        })
+
+    def ordering_fields(self):
+        if self.action == "changes":
+            return ("sync_seq",)
+        return super().ordering_fields()
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Products created, updated or deactivated since ?since=<cursor>, plus
+        the products deleted since. Without a cursor every product is
+        returned (the initial load). Store ``next`` and call again while
+        ``more`` is true. Honours ?fields= / ?omit= and ?branch= (admins).
+        """
+        try:
+            cursor = catalog.decode_cursor(request.query_params.get("since"))
+        except ValueError:
+            raise ValidationError({"since": "Invalid cursor."})
+        branch_id = _branch_scope(request)
+        products = self.filter_queryset(self.get_queryset())
+        tombstones = ProductTombstone.objects.all()
+        if branch_id is not None:
+            products = products.filter(branch_id=branch_id)
+            tombstones = tombstones.filter(branch_id=branch_id)
+        else:
+            # Across branches a product that only moved was not deleted
+            tombstones = tombstones.exclude(product_id__in=Product.objects.values("pk"))
+
+        changed, deleted, next_cursor, more = catalog.changes_since(
+            products,
+            tombstones,
+            cursor,
+            limit=settings.CATALOG_SYNC_PAGE_SIZE,
+        )
+        return Response({
+            "changed": self.get_serializer(changed, many=True).data,
+            "deleted": [{"id": row["product_id"], "sku": row["sku"]} for row in deleted],
+            "next": catalog.encode_cursor(next_cursor),
+            "more": more,
+        })
+
+    @action(detail=False, methods=["get"], url_path="offline-catalog")
+    def offline_catalog(self, request):
+        """
+        The branch's prebuilt SQLite catalog (active products, barcode index).
+        Sends 304 when If-None-Match still matches the catalog fingerprint.
+        """
+        branch_id = _branch_scope(request)
+        if branch_id is None:
+            raise ValidationError({"branch": "This query parameter is required."})
+        etag = f'"{offline_catalog.fingerprint(branch_id)}"'
+        if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            catalog_file, fingerprint = offline_catalog.open_catalog(branch_id)
+            etag = f'"{fingerprint}"'
+            response = FileResponse(
+                catalog_file,
+                as_attachment=True,
+                filename=f"catalog-branch-{branch_id}.sqlite3",
+                content_type="application/vnd.sqlite3",
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
 
 # ---------- VENDOR ----------
-class VendorViewSet(viewsets.ModelViewSet):
+class VendorViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Vendor.objects.all()
     serializer_class = VendorSerializer
+    cursor_ordering = ("-created_at", "-id")
     permission_classes = [IsAuthenticated & IsAdminOrReadOnly]
 
 
 # ---------- PURCHASE ----------
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
+    cursor_ordering = ("-created_at", "-id")
+    modified_fields = (
+        "updated_at", "vendor__updated_at", "branch__updated_at", "created_by__updated_at",
+        "items__updated_at", "items__product__updated_at",
+    )
     permission_classes = [IsAuthenticated & (IsAdminOrManager | IsStaff)]
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related("vendor", "branch", "created_by").prefetch_related("items")
+        qs = super().get_queryset().select_related("vendor", "branch", "created_by").prefetch_related(
+            Prefetch("items", queryset=PurchaseItem.objects.select_related("product"))
+        )
         user = self.request.user
         if getattr(user, "role", None) != "admin" and user.branch_id:
             return qs.filter(branch_id=user.branch_id)
@@ -91,27 +488,33 @@ class PurchaseViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         purchase = serializer.save(created_by=self.request.user)
         # ⚠️ StockMovement and LedgerEntry are handled in serializer/signal
-        send_mail(
+        enqueue_mail(
             subject=f"New Purchase Recorded (Invoice {purchase.invoice_no})",
             message=f"A new purchase from {getattr(purchase.vendor, 'name', 'Unknown Vendor')} was recorded.",
-            from_email="noreply@retailm.com",
-            recipient_list=["admin@retailm.com"],
-            fail_silently=True,
         )
 
 
 # ---------- PURCHASE ITEMS ----------
-class PurchaseItemViewSet(viewsets.ModelViewSet):
-    queryset = PurchaseItem.objects.all()
+class PurchaseItemViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    queryset = PurchaseItem.objects.select_related("product")
     serializer_class = PurchaseItemSerializer
+    cursor_ordering = ("-id",)
+    modified_fields = ("updated_at", "product__updated_at")
     permission_classes = [IsAuthenticated & (IsAdminOrManager | IsStaff)]
 
 
 # ---------- SALE ----------
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(ConditionalGetMixin, FastListMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
+    cursor_ordering = ("-created_at", "-id")
+    modified_fields = (
+        "updated_at", "branch__updated_at", "created_by__updated_at",
+        "items__updated_at", "items__product__updated_at",
+    )
     permission_classes = [IsAuthenticated & (IsAdminOrManager | IsStaff)]
+    bulk_chunk_size = 500
+    bulk_max_sales = 5000
 
     def get_queryset(self):
         qs = super().get_queryset().select_related("branch", "created_by").prefetch_related("items__product")
@@ -124,91 +527,387 @@ class SaleViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         sale = serializer.save(created_by=self.request.user)
         # ⚠️ StockMovement and LedgerEntry are handled in serializer/signal
-        send_mail(
+        enqueue_mail(
             subject=f"New Sale Recorded (Invoice {sale.invoice_no})",
             message=f"A new sale for {sale.customer_name or 'Walk-in Customer'} was recorded.",
-            from_email="noreply@retailm.com",
-            recipient_list=["admin@retailm.com"],
-            fail_silently=True,
         )
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Ingest a batch of sales queued by an offline till.
+
+        Every sale is validated on its own and gets its own result; valid sales
+        are written ``bulk_chunk_size`` at a time, one transaction per chunk.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({"detail": "Expected a list of sales."})
+        if len(request.data) > self.bulk_max_sales:
+            raise ValidationError({"detail": f"At most {self.bulk_max_sales} sales per request."})
+
+        context = self.get_serializer_context()
+        context["prefetched"] = _prefetch_bulk_sale_relations(request.data)
+        serializer = self.get_serializer_class()(context=context)
+        stock = {pk: product.quantity for pk, product in context["prefetched"][Product].items()}
+
+        # invoice_no uniqueness is checked for the whole batch with a single query
+        invoice_field = serializer.fields["invoice_no"]
+        invoice_field.validators = [v for v in invoice_field.validators if not isinstance(v, UniqueValidator)]
+        invoice_numbers = set(
+            Sale.objects.filter(
+                invoice_no__in=[p.get("invoice_no") for p in request.data if isinstance(p, dict)]
+            ).values_list("invoice_no", flat=True)
+        )
+
+        results = [None] * len(request.data)
+        valid = []
+        for index, payload in enumerate(request.data):
+            try:
+                data = serializer.run_validation(payload)
+                if data["invoice_no"] in invoice_numbers:
+                    raise ValidationError({"invoice_no": ["A sale with this invoice_no already exists."]})
+                requested = quantities_by_product(
+                    (item_data["product"], item_data["quantity"]) for item_data in data["items"]
+                )
+                for product_id, (product, quantity) in requested.items():
+                    if stock.setdefault(product_id, product.quantity) < quantity:
+                        raise ValidationError({"items": [f"Not enough stock for {product.name}"]})
+            except ValidationError as exc:
+                results[index] = {"index": index, "status": "error", "errors": exc.detail}
+                continue
+            for product_id, (_, quantity) in requested.items():
+                stock[product_id] -= quantity
+            invoice_numbers.add(data["invoice_no"])
+            valid.append((index, data))
+
+        chunks = [valid[start:start + self.bulk_chunk_size] for start in range(0, len(valid), self.bulk_chunk_size)]
+        created = 0
+        while chunks:
+            chunk = chunks.pop(0)
+            try:
+                with transaction.atomic():
+                    sales = create_sales([data for _, data in chunk], request.user, request.META.get("REMOTE_ADDR"))
+            except (InsufficientStock, IntegrityError) as exc:
+                # Stock moved or an invoice was written (e.g. the same batch re-sent while
+                # this one was in flight) since validation: retry each half, down to single
+                # sales, so only those fail and the rest still go in a few transactions
+                if len(chunk) > 1:
+                    middle = len(chunk) // 2
+                    chunks[:0] = [chunk[:middle], chunk[middle:]]
+                    continue
+                index, data = chunk[0]
+                if isinstance(exc, InsufficientStock):
+                    errors = {"items": [exc.detail]}
+                elif Sale.objects.filter(invoice_no=data["invoice_no"]).exists():
+                    errors = {"invoice_no": ["A sale with this invoice_no already exists."]}
+                else:
+                    errors = {"non_field_errors": ["The sale could not be saved."]}
+                results[index] = {"index": index, "status": "error", "errors": errors}
+                continue
+            for (index, _), sale in zip(chunk, sales):
+                results[index] = {"index": index, "status": "created", "id": sale.id, "invoice_no": sale.invoice_no}
+            created += len(sales)
+
+        if created:
+            enqueue_mail(
+                subject=f"{created} Sales Synced",
+                message=f"{created} sales were uploaded in a batch sync.",
+            )
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results},
+            status=status.HTTP_200_OK,
+        )
+
+    # Days covered when ?start= is omitted; reports read DailySalesRollup, so
+    # their cost follows the window asked for, not the size of the Sale table.
+    report_windows = {"day": 30, "week": 12 * 7, "month": 366}
+    report_periods = {"day": F("day"), "week": TruncWeek("day"), "month": TruncMonth("day")}
+
+    def _rollup_report(self, request, period):
+        params = request.query_params
+        end = _date_param(params, "end") or timezone.localdate()
+        start = _date_param(params, "start")
+        if start is None:
+            start = end - timedelta(days=self.report_windows[period] - 1)
+            start = {"week": start - timedelta(days=start.weekday()), "month": start.replace(day=1)}.get(period, start)
+        rows = DailySalesRollup.objects.filter(day__range=(start, end))
+        branch = _branch_scope(request)
+        if branch:
+            rows = rows.filter(branch_id=branch)
+        if params.get("payment_method"):
+            rows = rows.filter(payment_method=params["payment_method"])
+        if params.get("cashier"):
+            try:
+                rows = rows.filter(cashier_id=int(params["cashier"]))
+            except ValueError:
+                raise ValidationError({"cashier": "Expected a user id."})
+        rows = (
+            rows.annotate(**{f"{period}_": self.report_periods[period]})
+            .values(f"{period}_")
+            .annotate(
+                total=Sum("total_amount"),
+                subtotal=Sum("subtotal"),
+                discount=Sum("discount"),
+                sales=Sum("sale_count"),
+                items=Sum("item_quantity"),
+            )
+            .order_by(f"-{period}_")
+        )
+        return Response([{period: row.pop(f"{period}_"), **row} for row in rows])
+
     @action(detail=False, methods=["get"], url_path="daily-report")
     def daily_report(self, request):
-        qs = (
-            self.get_queryset()
-            .annotate(day=TruncDate("created_at"))
-            .values("day")
-            .annotate(total=Sum("total_amount"))
-            .order_by("-day")
-        )
-        return Response(list(qs))
+        return self._rollup_report(request, "day")
+
+    @action(detail=False, methods=["get"], url_path="weekly-report")
+    def weekly_report(self, request):
+        return self._rollup_report(request, "week")
+
+    @action(detail=False, methods=["get"], url_path="monthly-report")
+    def monthly_report(self, request):
+        return self._rollup_report(request, "month")
 
 
 # ---------- SALE ITEMS ----------
-class SaleItemViewSet(viewsets.ModelViewSet):
-    queryset = SaleItem.objects.all()
+class SaleItemViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    queryset = SaleItem.objects.select_related("product")
     serializer_class = SaleItemSerializer
+    cursor_ordering = ("-id",)
+    modified_fields = ("updated_at", "product__updated_at")
     permission_classes = [IsAuthenticated & (IsAdminOrManager | IsStaff)]
 
 
 # ---------- LEDGER ----------
-class LedgerEntryViewSet(viewsets.ModelViewSet):
-    queryset = LedgerEntry.objects.all()
+class LedgerEntryViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    queryset = LedgerEntry.objects.select_related("branch", "created_by")
     serializer_class = LedgerEntrySerializer
+    cursor_ordering = ("-date", "-id")
+    modified_fields = ("updated_at", "branch__updated_at", "created_by__updated_at")
     permission_classes = [IsAuthenticated & (IsAdminOrManager | ReadOnly)]
 
 
 # ---------- STOCK MOVEMENT ----------
-class StockMovementViewSet(viewsets.ModelViewSet):
-    queryset = StockMovement.objects.all()
+class StockMovementViewSet(ConditionalGetMixin, FastListMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    """
+    Movements are append-only: they can be listed and created, never edited
+    or deleted. ``verify`` and ``rebuild`` compare/repair Product.quantity
+    against the movement log (optionally for ``?products=1,2,3`` only).
+    """
+
+    queryset = StockMovement.objects.select_related("product", "branch", "created_by")
     serializer_class = StockMovementSerializer
+    cursor_ordering = ("-created_at", "-id")
+    modified_fields = ("created_at", "product__updated_at", "branch__updated_at", "created_by__updated_at")
     permission_classes = [IsAuthenticated & IsAdminOrManager]
+    http_method_names = ["get", "post", "head", "options"]
+
+    def _product_ids(self):
+        """?products=1,2, or a body of {"products": [1, 2]} or just [1, 2]; None for every product."""
+        data = self.request.data
+        if isinstance(data, list):
+            raw = data
+        elif hasattr(data, "get"):
+            raw = data.get("products")
+        else:
+            raise ValidationError({"products": "Expected a list of product ids."})
+        raw = self.request.query_params.get("products") or raw
+        if not raw:
+            return None
+        if isinstance(raw, str):
+            raw = raw.split(",")
+        try:
+            return [int(pk) for pk in raw]
+        except (TypeError, ValueError):
+            raise ValidationError({"products": "Expected a list of product ids."})
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        # The movement and its stock change commit or roll back together
+        serializer.save()
+
+    @action(detail=False, methods=["get"])
+    def verify(self, request):
+        mismatches = verify_on_hand(self._product_ids())
+        return Response({"mismatches": mismatches, "count": len(mismatches)})
+
+    @action(detail=False, methods=["post"])
+    def rebuild(self, request):
+        return Response(rebuild_on_hand(self._product_ids()))
 
 
 # ---------- AUDIT LOG ----------
-class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+class AuditArchivePagination(KeysetPagination):
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = "limit"
+
+
+class AuditLogViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Recent audit rows come from the database; rows moved to cold storage by
+    ``archive_audit_logs`` are served by ``/audit-logs/archive/`` with the
+    same filters (model_name, object_id, start, end), the same format and
+    the same keyset pages on (timestamp, id).
+    """
+
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
+    cursor_ordering = ("-timestamp", "-id")
+    modified_fields = ("timestamp", "user__updated_at")
     permission_classes = [IsAuthenticated & IsAdminOrManager]
 
+    def _filters(self):
+        params = self.request.query_params
+        start, end = _date_param(params, "start"), _date_param(params, "end")
+        return {
+            "model_name": params.get("model_name") or None,
+            "object_id": params.get("object_id") or None,
+            "start": start_of_day(start) if start else None,
+            "end": start_of_day(end + timedelta(days=1)) if end else None,
+        }
+
+    def get_queryset(self):
+        qs = super().get_queryset().select_related("user")
+        filters = self._filters()
+        if filters["model_name"]:
+            qs = qs.filter(model_name=filters["model_name"])
+        if filters["object_id"]:
+            qs = qs.filter(object_id=filters["object_id"])
+        if filters["start"]:
+            qs = qs.filter(timestamp__gte=filters["start"])
+        if filters["end"]:
+            qs = qs.filter(timestamp__lt=filters["end"])
+        return qs
+
+    @action(detail=False, methods=["get"])
+    def archive(self, request):
+        """Archived rows, paged like the live list: ``{next, previous, results}``, ?limit= rows a page."""
+        paginator = AuditArchivePagination()
+        filters = self._filters()
+
+        def fetch(position, reverse, limit):
+            if position is not None:
+                try:
+                    timestamp = parse_datetime(position[0])
+                except (TypeError, ValueError):
+                    timestamp = None
+                if timestamp is None or not isinstance(position[1], int):
+                    raise NotFound(paginator.invalid_cursor_message)
+                position = (timestamp, position[1])
+            return query_archive(limit=limit, position=position, reverse=reverse, **filters)
+
+        return paginator.get_paginated_response(paginator.paginate(fetch, request, self))
+
 
 # ---------- USER ----------
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = CustomUser.objects.all()
+class UserViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ModelViewSet):
+    queryset = CustomUser.objects.select_related("branch")
     serializer_class = UserSerializer
+    cursor_ordering = ("-date_joined", "-id")
+    modified_fields = ("updated_at", "branch__updated_at")
     permission_classes = [IsAuthenticated & (IsAdminOrManager | ReadOnly)]
 
 
 # ---------- REPORT ----------
 class ReportViewSet(viewsets.ViewSet):
     """
-    API endpoints for exporting reports (Excel/PDF).
+    API endpoints for exporting reports (Excel/PDF) and raw CSV/NDJSON dumps.
+    GET renders the report in the request; POST queues a report job with
+    the same filters (see ReportJobViewSet) and answers with its status.
     """
 
-    @action(detail=False, methods=["get"])
-    def sales_excel(self, request):
-        qs = Sale.objects.all().values()
-        df = pd.DataFrame(qs)
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Sales")
-        response = HttpResponse(
-            output.getvalue(),
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    def _filters(self, request):
+        """?start= / ?end= (inclusive days) and the request's branch scope, read from the body on POST."""
+        params = request.query_params if request.method in SAFE_METHODS else request.data
+        return _date_param(params, "start"), _date_param(params, "end"), _branch_scope(request, params)
+
+    def _scoped(self, request, rows, date_field, branch_field):
+        return within(rows, date_field, branch_field, *self._filters(request))
+
+    def _queue(self, request, kind, **params):
+        start, end, branch_id = self._filters(request)
+        job, _ = request_job(
+            kind,
+            {"start": start, "end": end, "branch": branch_id, **params},
+            user_id=request.user.pk,
+            branch=branch_id,
         )
-        response["Content-Disposition"] = 'attachment; filename="sales_report.xlsx"'
+        data = ReportJobSerializer(job, context={"request": request}).data
+        # 202 until the artifact can be downloaded
+        done = job.status == "done"
+        response = Response(data, status=status.HTTP_200_OK if done else status.HTTP_202_ACCEPTED)
+        response["Location"] = reverse("reportjob-detail", args=[job.pk], request=request)
         return response
 
-    @action(detail=False, methods=["get"])
+    @action(
+        detail=False,
+        methods=["get", "post"],
+        url_path=r"(?P<resource>sales|sale-items|stock-movements|ledger-entries)\.(?P<fmt>csv|ndjson)",
+        permission_classes=[IsAuthenticated & IsAdminOrManager],
+    )
+    def dump(self, request, resource=None, fmt=None):
+        """Every row of ``resource`` as it is sent, optionally within ?start= / ?end= and ?branch=."""
+        if request.method == "POST":
+            return self._queue(request, "dump", resource=resource, format=fmt)
+        model, date_field, branch_field = DUMPS[resource]
+        rows = self._scoped(request, model.objects.order_by("pk"), date_field, branch_field)
+        fields = [field.attname for field in model._meta.concrete_fields]
+        return stream_response(rows, fields, f"{resource}.{fmt}", fmt)
+
+    @action(detail=False, methods=["get", "post"], permission_classes=[IsAuthenticated])
+    def sales_excel(self, request):
+        if request.method == "POST":
+            return self._queue(request, "sales_excel")
+        sales = self._scoped(request, Sale.objects.order_by("id"), "created_at", "branch_id")
+        fields = [field.attname for field in Sale._meta.concrete_fields]
+        return xlsx_response(sales, fields, "sales_report.xlsx", "Sales")
+
+    @action(detail=False, methods=["get", "post"], permission_classes=[IsAuthenticated])
     def ledger_pdf(self, request):
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer)
-        y = 800
-        for entry in LedgerEntry.objects.all():
-            p.drawString(50, y, f"{entry.date} - {entry.description} - {entry.amount}")
-            y -= 20
-        p.save()
-        buffer.seek(0)
-        response = HttpResponse(buffer, content_type="application/pdf")
-        response["Content-Disposition"] = 'attachment; filename="ledger_report.pdf"'
-        return response
+        """Ledger entries with page totals and a running balance, optionally within ?start= / ?end= and ?branch=."""
+        if request.method == "POST":
+            return self._queue(request, "ledger_pdf")
+        start, end, branch_id = self._filters(request)
+        return spooled_response(
+            lambda out: ledger_report.render(out, start, end, branch_id), "ledger_report.pdf", "application/pdf"
+        )
+
+
+# ---------- REPORT JOBS ----------
+class ReportJobViewSet(ConditionalGetMixin, FieldSelectionMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Status of reports queued with POST on /reports/ (pending, running, done,
+    failed, or expired once a newer job replaced its artifact); ``download``
+    serves the artifact of a done job.
+    """
+
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    cursor_ordering = ("-id",)
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        # Exports queued from the admin are listed there
+        qs = super().get_queryset().exclude(kind="admin_export")
+        user = self.request.user
+        if getattr(user, "role", None) not in ("admin", "manager"):
+            qs = qs.exclude(kind="dump")
+        if getattr(user, "role", None) != "admin" and user.branch_id:
+            return qs.filter(branch_id=user.branch_id)
+        return qs
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != "done":
+            raise NotFound("The report is not ready.")
+        artifact = open_artifact(job)
+        if artifact is None:
+            raise ArtifactGone()
+        report = REPORTS[job.kind]
+        return FileResponse(
+            artifact,
+            as_attachment=True,
+            filename=report.filename(job.params),
+            content_type=report.content_type(job.params),
+        )
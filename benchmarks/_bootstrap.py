@@ -0,0 +1,50 @@
+"""
+Shared setup for the benchmark scripts.
+
+Each script boots Django against a throwaway test database so that running a
+benchmark never touches ``db.sqlite3``. Run them from the project root, e.g.::
+
+    python -m benchmarks.bench_sale_totals
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "retailm.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+
+@contextmanager
+def test_database(name=None):
+    """Create a fresh test database (in-memory unless ``name`` is a file path)."""
+    setup_test_environment()
+    if name:
+        connection.settings_dict["TEST"]["NAME"] = str(name)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer(label, units=None, unit_name="ops"):
+    """Print wall time for the block, and a rate when ``units`` is given."""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    if units:
+        print(f"{label}: {elapsed:.3f}s ({units / elapsed:,.0f} {unit_name}/s)")
+    else:
+        print(f"{label}: {elapsed:.3f}s")
@@ -0,0 +1,84 @@
+"""
+Audit payload size and encoding CPU: full-row snapshots vs diffs.
+
+Replays a POS-like update mix (mostly quantity changes, some price and
+reorder-level edits) over in-memory Product instances; no database writes.
+
+    python -m benchmarks.bench_audit_payload [updates]
+"""
+import json
+import random
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks._bootstrap import test_database
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+
+def full_snapshot(instance):
+    # What log_save used to store on every update
+    changes = {}
+    for field in instance._meta.fields:
+        value = getattr(instance, field.name)
+        changes[field.name] = value.pk if hasattr(value, "pk") else str(value)
+    return json.dumps(changes, cls=DjangoJSONEncoder)
+
+
+def main(updates=1_000_000):
+    from api import audit
+    from api.models import Branch, Product
+
+    branch = Branch.objects.create(name="Bench Branch")
+    now = timezone.now()
+    products = [
+        Product(
+            pk=i, name=f"Product {i}", sku=f"BENCH-{i}", barcode=f"{i:013d}", description="Imported stock item",
+            price=Decimal("10.00"), cost_price=Decimal("7.50"), quantity=1000, reorder_level=10,
+            branch=branch, created_at=now, updated_at=now,
+        )
+        for i in range(1000)
+    ]
+    rng = random.Random(42)
+    edits = []
+    for _ in range(updates):
+        roll = rng.random()
+        field = "quantity" if roll < 0.9 else "price" if roll < 0.97 else "reorder_level"
+        edits.append((rng.randrange(len(products)), field))
+
+    def run(encode):
+        size = 0
+        start = time.process_time()
+        for index, field in edits:
+            product = products[index]
+            if field == "quantity":
+                product.quantity -= 1
+            elif field == "price":
+                product.price += Decimal("0.01")
+            else:
+                product.reorder_level += 1
+            size += len(encode(product))
+        return size, time.process_time() - start
+
+    def encode_diff(product):
+        payload = json.dumps(audit.diff(product), cls=DjangoJSONEncoder, separators=(",", ":"))
+        audit.remember_loaded(product)
+        return payload
+
+    for product in products:
+        audit.remember_loaded(product)
+    full_bytes, full_cpu = run(full_snapshot)
+    diff_bytes, diff_cpu = run(encode_diff)
+
+    print(f"{updates:,} updates")
+    print(f"full snapshot: {full_bytes / 2**20:8.1f} MiB {full_cpu:6.2f}s CPU  {full_bytes / updates:6.1f} B/row")
+    print(f"diff:          {diff_bytes / 2**20:8.1f} MiB {diff_cpu:6.2f}s CPU  {diff_bytes / updates:6.1f} B/row")
+    print(f"storage x{full_bytes / diff_bytes:.1f} smaller, CPU x{full_cpu / diff_cpu:.1f} faster")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,47 @@
+"""
+Throughput of POST /api/sales/bulk/ against file-backed SQLite.
+
+    python -m benchmarks.bench_bulk_sales [batch_size] [batches]
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks._bootstrap import test_database, timer
+
+from rest_framework.test import APIClient
+
+
+def main(batch_size=1000, batches=5):
+    from api.models import Branch, CustomUser, Product
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", branch=branch, role="cashier")
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=10**9, branch=branch)
+        for i in range(200)
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    invoice = 0
+    total = batch_size * batches
+    with timer(f"{total} sales x 3 items", units=total, unit_name="sales"):
+        for _ in range(batches):
+            payload = []
+            for _ in range(batch_size):
+                invoice += 1
+                items = [
+                    {"product": products[(invoice + n) % len(products)].pk, "quantity": 1, "unit_price": "10.00"}
+                    for n in range(3)
+                ]
+                payload.append({"invoice_no": f"B-{invoice}", "branch": branch.pk, "items": items})
+            response = client.post("/api/sales/bulk/", payload, format="json")
+            assert response.data["created"] == batch_size, response.data["failed"]
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(Path(tmp) / "bench.sqlite3"):
+            main(*args)
@@ -0,0 +1,81 @@
+"""
+Latency of GET /api/products/ for a branch cashier, cached vs uncached.
+
+Several tills refresh the same branch catalog page; a product in the branch
+is edited every ``edit_every`` refreshes, which retires the cached pages.
+
+    python -m benchmarks.bench_catalog_cache [products] [requests] [edit_every]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks._bootstrap import test_database
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def run(client, requests, edit_every, product_ids, cached):
+    from api.models import Product
+    from api.views import ProductViewSet
+
+    original = ProductViewSet.list_cache_key
+    if not cached:
+        # A fresh key per request: every refresh misses and rebuilds the page
+        ProductViewSet.list_cache_key = lambda self, request: f"uncached:{time.perf_counter_ns()}"
+    timings, queries = [], 0
+    try:
+        for n in range(requests):
+            if n % edit_every == 0:
+                product = Product.objects.get(pk=product_ids[n // edit_every % len(product_ids)])
+                product.price += 1
+                product.save()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.get("/api/products/", {"page_size": 100})
+                timings.append(time.perf_counter() - start)
+            queries += len(ctx.captured_queries)
+            assert response.status_code == 200
+    finally:
+        ProductViewSet.list_cache_key = original
+        cache.clear()
+    label = "cached" if cached else "uncached"
+    print(
+        f"{label:>8}: p50 {percentile(timings, 50):.2f} ms  p99 {percentile(timings, 99):.2f} ms  "
+        f"mean {statistics.mean(timings) * 1000:.2f} ms  {queries / requests:.2f} queries/request"
+    )
+
+
+def main(products=20_000, requests=2_000, edit_every=100):
+    from api.models import Branch, CustomUser, Product
+
+    branches = [Branch.objects.create(name=f"Bench Branch {i}") for i in range(4)]
+    user = CustomUser.objects.create_user(username="till", password="x", branch=branches[0], role="cashier")
+    Product.objects.bulk_create(
+        (
+            Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=100, branch=branches[i % 4])
+            for i in range(products)
+        ),
+        batch_size=2000,
+    )
+    product_ids = list(Product.objects.filter(branch=branches[0]).values_list("pk", flat=True)[:100])
+    client = APIClient()
+    client.force_authenticate(user)
+
+    print(f"{requests:,} refreshes of a {products // 4:,}-product branch, an edit every {edit_every}")
+    run(client, requests, edit_every, product_ids, cached=False)
+    run(client, requests, edit_every, product_ids, cached=True)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,70 @@
+"""
+Catalog sync for a till: initial load, then a delta after a few edits.
+
+    python -m benchmarks.bench_catalog_sync [products] [edits]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks._bootstrap import test_database, timer
+
+from rest_framework.test import APIClient
+
+POS_FIELDS = "id,name,sku,barcode,price,quantity,is_active"
+
+
+def sync(client, since=None):
+    changed = deleted = 0
+    while True:
+        params = {"fields": POS_FIELDS}
+        if since:
+            params["since"] = since
+        data = client.get("/api/products/changes/", params).data
+        changed += len(data["changed"])
+        deleted += len(data["deleted"])
+        since = data["next"]
+        if not data["more"]:
+            return since, changed, deleted
+
+
+def main(products=50_000, edits=20):
+    from api.models import Branch, CustomUser, Product
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="till", password="x", branch=branch, role="cashier")
+    Product.objects.bulk_create(
+        (
+            Product(name=f"Product {i}", sku=f"BENCH-{i}", barcode=f"{i:013d}", price=10, quantity=100, branch=branch)
+            for i in range(products)
+        ),
+        batch_size=2000,
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    with timer(f"initial load of {products:,} products", products, "products"):
+        cursor, changed, _ = sync(client)
+    assert changed == products
+
+    for product in Product.objects.order_by("?")[:edits]:
+        product.price += 1
+        product.save()
+    Product.objects.filter(pk__in=Product.objects.order_by("?").values("pk")[:2]).delete()
+
+    start = time.perf_counter()
+    cursor, changed, deleted = sync(client, cursor)
+    print(f"delta sync: {(time.perf_counter() - start) * 1000:.1f} ms ({changed} changed, {deleted} deleted)")
+
+    timings = []
+    for _ in range(20):
+        start = time.perf_counter()
+        sync(client, cursor)
+        timings.append(time.perf_counter() - start)
+    print(f"up-to-date sync: median {statistics.median(timings) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
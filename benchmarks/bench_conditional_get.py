@@ -0,0 +1,59 @@
+"""
+Polling cost of GET /api/sales/ and /api/vendors/: full 200 vs 304.
+
+Each endpoint is polled with and without the ETag of the previous
+response; the data doesn't change between polls.
+
+    python -m benchmarks.bench_conditional_get [sales] [polls]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks._bootstrap import test_database
+
+from rest_framework.test import APIClient
+
+
+def poll(client, url, polls, **headers):
+    timings = []
+    for _ in range(polls):
+        start = time.perf_counter()
+        response = client.get(url, **headers)
+        timings.append(time.perf_counter() - start)
+    return response, statistics.median(timings) * 1000
+
+
+def main(sales=20_000, polls=200):
+    from api.models import Branch, CustomUser, Product, Sale, SaleItem, Vendor
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="manager", password="x", branch=branch, role="manager")
+    product = Product.objects.create(name="Bench Product", sku="BENCH", price=10, quantity=0, branch=branch)
+    Vendor.objects.bulk_create(Vendor(name=f"Vendor {i}") for i in range(500))
+    Sale.objects.bulk_create(
+        (Sale(invoice_no=f"INV-{i}", branch=branch, created_by=user, subtotal=30, total_amount=30) for i in range(sales)),
+        batch_size=2000,
+    )
+    SaleItem.objects.bulk_create(
+        (
+            SaleItem(sale_id=sale_id, product=product, quantity=3, unit_price=10, total_price=30)
+            for sale_id in Sale.objects.values_list("pk", flat=True)
+        ),
+        batch_size=2000,
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    print(f"{sales:,} sales, 500 vendors, median of {polls} polls")
+    for url in ("/api/sales/", "/api/vendors/"):
+        response, full = poll(client, url, polls)
+        not_modified, conditional = poll(client, url, polls, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert (response.status_code, not_modified.status_code) == (200, 304)
+        print(f"{url:<16} 200: {full:6.2f} ms   304: {conditional:6.2f} ms   ({len(response.content):,} bytes saved)")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,52 @@
+"""
+GET /api/reports/sales.csv/ and /api/reports/sales.ndjson/ over a large
+Sale table (file-backed SQLite): time to the first block, rows per second
+for the whole dump, and peak resident memory growth while it streams.
+
+    python -m benchmarks.bench_dump_export [rows]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks._bootstrap import test_database
+from benchmarks.bench_sales_excel import grow_sales, measure
+
+from rest_framework.test import APIClient
+
+
+def main(rows=1_000_000):
+    from api.models import Branch, CustomUser
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    client = APIClient()
+    client.force_authenticate(user)
+    grow_sales(rows, branch.pk, user.pk)
+    # First request pays for URL resolution and imports
+    client.get("/api/reports/sales.csv/", {"end": "2000-01-01"}).close()
+
+    for fmt in ("csv", "ndjson"):
+        def dump():
+            start = time.perf_counter()
+            response = client.get(f"/api/reports/sales.{fmt}/")
+            blocks = iter(response.streaming_content)
+            size = len(next(blocks))
+            first = time.perf_counter() - start
+            size += sum(len(block) for block in blocks)
+            response.close()
+            return first, size
+
+        elapsed, peak, (first, size) = measure(dump)
+        print(
+            f"{rows:>9,} rows  {fmt:>6}: first block {first * 1000:6.1f} ms  {rows / elapsed:>9,.0f} rows/s  "
+            f"peak +{peak / 2**20:6.1f} MiB  ({size / 2**20:.0f} MiB)"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(Path(tmp) / "bench.sqlite3"):
+            main(*args)
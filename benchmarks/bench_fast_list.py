@@ -0,0 +1,82 @@
+"""
+Rows/sec of /api/sales/ and /api/stock-movements/ page rendering:
+SaleSerializer / StockMovementSerializer vs the RowPlan fast path.
+
+Both walk every page (page_size=500) through the full DRF stack, and the
+bodies are checked to be identical.
+
+    python -m benchmarks.bench_fast_list [sales] [items_per_sale]
+"""
+import sys
+import time
+from unittest import mock
+
+from benchmarks._bootstrap import test_database
+
+from rest_framework.test import APIClient
+
+
+def walk(client, url):
+    bodies, rows, elapsed = [], 0, 0.0
+    while url:
+        start = time.perf_counter()
+        response = client.get(url, {"page_size": 500} if not bodies else None)
+        elapsed += time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+        bodies.append(response.content)
+        rows += len(response.data["results"])
+        url = response.data["next"]
+    return bodies, rows, elapsed
+
+
+def main(sales=10_000, items_per_sale=3):
+    from api.models import Branch, CustomUser, Product, Sale, SaleItem, StockMovement
+    from api.views import FastListMixin
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=0, branch=branch) for i in range(50)
+    )
+    Sale.objects.bulk_create(
+        (
+            Sale(invoice_no=f"INV-{i}", branch=branch, created_by=user, subtotal=30, total_amount=30, customer_name="Walk-in")
+            for i in range(sales)
+        ),
+        batch_size=2000,
+    )
+    sale_ids = list(Sale.objects.values_list("pk", flat=True))
+    SaleItem.objects.bulk_create(
+        (
+            SaleItem(sale_id=sale_id, product=products[(sale_id + n) % 50], product_name="x", quantity=1, unit_price=10, total_price=10)
+            for sale_id in sale_ids
+            for n in range(items_per_sale)
+        ),
+        batch_size=5000,
+    )
+    StockMovement.objects.bulk_create(
+        (
+            StockMovement(product=products[i % 50], branch=branch, movement_type="out", quantity=1, reference=f"SAL-{i}", created_by=user)
+            for i in range(sales * items_per_sale)
+        ),
+        batch_size=5000,
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    print(f"{sales:,} sales x {items_per_sale} items, {sales * items_per_sale:,} stock movements")
+    for url in ("/api/sales/", "/api/stock-movements/"):
+        with mock.patch.object(FastListMixin, "fast_list", False):
+            slow, rows, slow_time = walk(client, url)
+        fast, _, fast_time = walk(client, url)
+        assert fast == slow, "fast path output differs from the serializer"
+        print(
+            f"{url:<22} serializer {rows / slow_time:9,.0f} rows/s   "
+            f"row plan {rows / fast_time:9,.0f} rows/s   ({slow_time / fast_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
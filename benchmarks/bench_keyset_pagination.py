@@ -0,0 +1,63 @@
+"""
+Page latency of GET /api/audit-logs/ by depth: keyset cursor vs OFFSET.
+
+    python -m benchmarks.bench_keyset_pagination [rows]
+"""
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from benchmarks._bootstrap import test_database
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+def median_ms(fn, repeat=10):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main(rows=500_000):
+    from api.models import AuditLog, CustomUser
+    from api.pagination import KeysetPagination
+
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    table = connection.ops.quote_name("api_auditlog")
+    start = timezone.now() - timedelta(seconds=rows)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (user_id, action, model_name, object_id, changes, timestamp) "
+            "VALUES (%s, 'update', 'Product', %s, '{}', %s)",
+            ((user.pk, str(i % 1000), start + timedelta(seconds=i // 2)) for i in range(rows)),
+        )
+
+    client = APIClient()
+    client.force_authenticate(user)
+    page_size = 50
+    ordered = AuditLog.objects.order_by("-timestamp", "-id")
+    print(f"{rows:,} audit rows, {page_size} per page")
+    for depth in (0, rows // 10, rows // 2, rows - page_size):
+        if depth:
+            boundary = ordered.values("timestamp", "id")[depth - 1]
+            paginator = KeysetPagination()
+            paginator.ordering = ("-timestamp", "-id")
+            paginator.base_url = "/api/audit-logs/"
+            url = paginator.encode_cursor(paginator.position(boundary)) + f"&page_size={page_size}"
+        else:
+            url = f"/api/audit-logs/?page_size={page_size}"
+        keyset = median_ms(lambda: client.get(url))
+        offset = median_ms(lambda: list(ordered.select_related("user")[depth:depth + page_size]))
+        print(f"row {depth:>9,}: keyset page {keyset:7.1f} ms   OFFSET query alone {offset:7.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
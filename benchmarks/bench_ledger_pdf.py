@@ -0,0 +1,80 @@
+"""
+GET /api/reports/ledger_pdf/ as the ledger grows (file-backed SQLite):
+pages rendered per second and peak resident memory growth per report.
+Pages are drawn in batches of ledger_report.BATCH_PAGES, so the peak
+should stay near one batch (a few MiB) plus the response spool
+(EXPORT_SPOOL_MAX_SIZE in memory, on disk beyond) however long the
+ledger is.
+
+    python -m benchmarks.bench_ledger_pdf [max_entries]
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks._bootstrap import test_database
+from benchmarks.bench_sales_excel import measure
+
+from django.db import connection
+from rest_framework.test import APIClient
+
+
+def grow_ledger(rows, branch_id, user_id):
+    """Insert ledger entries until there are ``rows`` of them (one statement, no model instances)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM api_ledgerentry")
+        have = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            INSERT INTO api_ledgerentry (date, description, transaction_type, amount, reference,
+                                         branch_id, created_by_id, updated_at)
+            WITH RECURSIVE n(i) AS (SELECT %s UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+            SELECT '2025-01-01 09:00:00', 'Sale INV-' || i || ' to Customer ' || (i %% 997),
+                   CASE i %% 3 WHEN 0 THEN 'debit' ELSE 'credit' END, (i %% 500) + 0.25, 'INV-' || i,
+                   %s, %s, '2025-01-01 09:00:00'
+            FROM n
+            """,
+            [have + 1, rows, branch_id, user_id],
+        )
+
+
+def main(max_entries=500_000):
+    from api.models import Branch, CustomUser
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def report():
+        response = client.get("/api/reports/ledger_pdf/")
+        assert response.status_code == 200, response.status_code
+        # Read the blocks as they come rather than joining them, so the PDF
+        # itself is not counted in the peak; ``carry`` is too short to hold
+        # a whole marker, so one split across blocks is counted once
+        marker = b"/Type /Page\n"
+        pages = size = 0
+        carry = b""
+        for block in response.streaming_content:
+            size += len(block)
+            pages += (carry + block).count(marker)
+            carry = block[-(len(marker) - 1):]
+        response.close()
+        return pages, size
+
+    sizes = [size for size in (10_000, 50_000, 100_000) if size < max_entries] + [max_entries]
+    for entries in sizes:
+        grow_ledger(entries, branch.pk, user.pk)
+        elapsed, peak, (pages, size) = measure(report)
+        print(
+            f"{entries:>9,} entries  {pages:>6,} pages: {elapsed:6.1f}s  {pages / elapsed:6.0f} pages/s  "
+            f"peak +{peak / 2**20:6.1f} MiB  ({size / 2**20:.1f} MiB pdf)",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(Path(tmp) / "bench.sqlite3"):
+            main(*args)
@@ -0,0 +1,72 @@
+"""
+Product search on a large catalog: FTS5 index vs icontains scans.
+
+    python -m benchmarks.bench_product_search [products]
+"""
+import random
+import statistics
+import sys
+import time
+
+from benchmarks._bootstrap import test_database, timer
+
+from django.db.models import Q
+
+WORDS = (
+    "cheese burger chicken wrap fries cola lemon soda water rice beans coffee tea milk bread butter jam "
+    "apple banana mango orange grape melon salt sugar flour pepper chili garlic onion tomato potato"
+).split()
+
+
+def median_ms(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main(products=500_000):
+    from api.models import Branch, Product
+    from api.search import search_products
+
+    branch = Branch.objects.create(name="Bench Branch")
+    rng = random.Random(42)
+    with timer(f"insert {products:,} products (FTS triggers included)", products, "products"):
+        Product.objects.bulk_create(
+            (
+                Product(
+                    name=" ".join(rng.sample(WORDS, 3)).title() + f" {i}",
+                    sku=f"SKU-{i:07d}",
+                    barcode=f"{i:013d}",
+                    description=" ".join(rng.sample(WORDS, 8)),
+                    price=10,
+                    branch=branch,
+                )
+                for i in range(products)
+            ),
+            batch_size=5000,
+        )
+
+    # A typed-as-you-go POS query, a rare exact match and a sku prefix
+    queries = ["chee", "cheese burg", "mango chili 4242", "SKU-00012"]
+    print(f"{'query':<20}{'icontains':>12}{'fts5':>12}")
+    for q in queries:
+        words = q.split()
+
+        def icontains():
+            condition = Q()
+            for word in words:
+                condition &= Q(name__icontains=word) | Q(sku__icontains=word)
+            return list(Product.objects.filter(condition).values_list("pk", flat=True)[:50])
+
+        slow = median_ms(icontains)
+        fast = median_ms(lambda: search_products(q, branch.id, 50))
+        print(f"{q!r:<20}{slow:>10.1f}ms{fast:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
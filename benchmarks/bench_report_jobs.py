@@ -0,0 +1,60 @@
+"""
+POST /api/reports/ledger_pdf/ (a report job rendered by the worker pool)
+against GET on the same URL (rendered in the request), as the ledger grows
+(file-backed SQLite): how long the request is held, how long until the
+artifact is ready, and how long a repeat request over unchanged data takes.
+
+    python -m benchmarks.bench_report_jobs [max_entries]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks._bootstrap import test_database
+from benchmarks.bench_ledger_pdf import grow_ledger
+
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+
+def main(max_entries=200_000):
+    from api.models import Branch, CustomUser
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def timed(call):
+        start = time.perf_counter()
+        response = call()
+        return time.perf_counter() - start, response
+
+    sizes = [size for size in (10_000, 50_000) if size < max_entries] + [max_entries]
+    for entries in sizes:
+        grow_ledger(entries, branch.pk, user.pk)
+        rendered, response = timed(lambda: b"".join(client.get("/api/reports/ledger_pdf/").streaming_content))
+
+        queued, response = timed(lambda: client.post("/api/reports/ledger_pdf/"))
+        assert response.status_code == 202, response.status_code
+        start = time.perf_counter()
+        while (job := client.get(response["Location"]).data)["status"] in ("pending", "running"):
+            time.sleep(0.05)
+        assert job["status"] == "done", job
+        ready = queued + time.perf_counter() - start
+
+        cached, again = timed(lambda: client.post("/api/reports/ledger_pdf/"))
+        assert again.status_code == 200 and again.data["id"] == job["id"], again.status_code
+        print(
+            f"{entries:>9,} entries  GET {rendered * 1000:8.0f} ms  POST {queued * 1000:6.1f} ms  "
+            f"ready {ready * 1000:8.0f} ms  repeat POST {cached * 1000:6.1f} ms",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(Path(tmp) / "bench.sqlite3"), override_settings(MEDIA_ROOT=tmp):
+            main(*args)
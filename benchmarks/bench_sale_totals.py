@@ -0,0 +1,50 @@
+"""
+Queries and wall time per sale, by basket size.
+
+    python -m benchmarks.bench_sale_totals
+"""
+import time
+
+from benchmarks._bootstrap import test_database
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+BASKET_SIZES = [1, 5, 10, 20, 40]
+ROUNDS = 20
+
+
+def main():
+    from api.models import Branch, CustomUser, Product
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", branch=branch, role="cashier")
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=10**9, branch=branch)
+        for i in range(max(BASKET_SIZES))
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    print(f"{'items':>6} {'queries':>8} {'ms/sale':>9}")
+    invoice = 0
+    for size in BASKET_SIZES:
+        items = [{"product": p.pk, "quantity": 1, "unit_price": "10.00"} for p in products[:size]]
+        queries = 0
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            invoice += 1
+            payload = {"invoice_no": f"B-{invoice}", "branch": branch.pk, "items": items}
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.post("/api/sales/", payload, format="json")
+            assert response.status_code == 201, response.data
+            queries = len(ctx.captured_queries)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / ROUNDS
+        print(f"{size:>6} {queries:>8} {elapsed_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    with test_database():
+        main()
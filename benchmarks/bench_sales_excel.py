@@ -0,0 +1,115 @@
+"""
+Peak memory of GET /api/reports/sales_excel/ (file-backed SQLite):
+the old pandas DataFrame + BytesIO export vs the streaming write-only export.
+
+Memory is resident set size sampled while each export runs, minus the size
+before it. The pandas export strips time zones first (to_excel refuses
+aware datetimes), and only runs up to ``pandas_rows``: it grows with the
+table and needs several GB beyond that.
+
+    python -m benchmarks.bench_sales_excel [max_rows] [pandas_rows]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+from benchmarks._bootstrap import test_database
+
+from django.db import connection
+from rest_framework.test import APIClient
+
+PAGE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * PAGE
+
+
+def measure(export):
+    """Run ``export()``; return (seconds, peak RSS growth in bytes, result)."""
+    baseline, peak, done = rss(), [0], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], rss())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = export()
+    finally:
+        done.set()
+        sampler.join()
+    return time.perf_counter() - start, max(peak[0], rss()) - baseline, result
+
+
+def grow_sales(rows, branch_id, user_id):
+    """Insert sales until there are ``rows`` of them (one statement, no model instances)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM api_sale")
+        have = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            INSERT INTO api_sale (invoice_no, customer_name, customer_phone, branch_id, subtotal, discount,
+                                  total_amount, paid_amount, payment_method, created_by_id, created_at, updated_at, notes)
+            WITH RECURSIVE n(i) AS (SELECT %s UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+            SELECT 'INV-' || i, 'Customer ' || (i %% 997), '0300' || i, %s, 30, 0, 30, 30,
+                   CASE i %% 2 WHEN 0 THEN 'cash' ELSE 'card' END, %s,
+                   '2025-01-01 09:00:00', '2025-01-01 09:00:00', NULL
+            FROM n
+            """,
+            [have + 1, rows, branch_id, user_id],
+        )
+
+
+def main(max_rows=5_000_000, pandas_rows=250_000):
+    import pandas as pd
+
+    from api.models import Branch, CustomUser, Sale
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def streaming():
+        response = client.get("/api/reports/sales_excel/")
+        assert response.status_code == 200, response.status_code
+        size = sum(len(block) for block in response.streaming_content)
+        response.close()
+        return size
+
+    def dataframe():
+        df = pd.DataFrame(Sale.objects.all().values())
+        for column in ("created_at", "updated_at"):
+            df[column] = df[column].dt.tz_localize(None)
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False, sheet_name="Sales")
+        return len(output.getvalue())
+
+    sizes = [size for size in (100_000, 250_000, 1_000_000, 5_000_000) if size < max_rows] + [max_rows]
+    results = []
+    for rows in sizes:
+        grow_sales(rows, branch.pk, user.pk)
+        elapsed, peak, size = measure(streaming)
+        results.append((rows, "streaming", elapsed, peak, size))
+        print(f"{rows:>9,} rows  streaming: {elapsed:7.1f}s  peak +{peak / 2**20:7.1f} MiB  ({size / 2**20:.0f} MiB xlsx)", flush=True)
+    # pandas last: memory it frees is not all returned to the OS
+    Sale.objects.filter(pk__gt=pandas_rows).delete()
+    elapsed, peak, size = measure(dataframe)
+    print(f"{pandas_rows:>9,} rows     pandas: {elapsed:7.1f}s  peak +{peak / 2**20:7.1f} MiB  ({size / 2**20:.0f} MiB xlsx)")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(Path(tmp) / "bench.sqlite3"):
+            main(*args)
@@ -0,0 +1,72 @@
+"""
+/api/sales/daily-report/ latency as history grows: TruncDate + Sum over
+every Sale row vs reading DailySalesRollup for the last 30 days.
+
+    python -m benchmarks.bench_sales_rollup [sales_per_day] [requests]
+"""
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from benchmarks._bootstrap import test_database
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+def timed(call, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main(sales_per_day=50, requests=50):
+    from api.models import Branch, CustomUser, Sale
+    from api.rollups import backfill
+
+    branches = [Branch.objects.create(name=f"Bench Branch {n}") for n in range(3)]
+    user = CustomUser.objects.create_user(username="bench", password="x", role="admin")
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def truncdate():
+        return list(
+            Sale.objects.annotate(day=TruncDate("created_at")).values("day").annotate(total=Sum("total_amount")).order_by("-day")
+        )
+
+    def rollup():
+        response = client.get("/api/sales/daily-report/")
+        assert response.status_code == 200, response.status_code
+
+    now, days = timezone.now(), 0
+    print(f"{sales_per_day} sales/day over {len(branches)} branches")
+    for years in (1, 2, 4):
+        sales = []
+        for day in range(days, years * 365):
+            for n in range(sales_per_day):
+                sales.append(
+                    Sale(invoice_no=f"INV-{day}-{n}", branch=branches[n % 3], created_by=user, payment_method=("cash", "card")[n % 2],
+                         subtotal=10, total_amount=10)
+                )
+        Sale.objects.bulk_create(sales, batch_size=5000)
+        # auto_now_add ignores the value passed in; spread the new sales over their days
+        for day in range(days, years * 365):
+            Sale.objects.filter(invoice_no__startswith=f"INV-{day}-").update(created_at=now - timedelta(days=day))
+        days = years * 365
+        backfill()
+        print(
+            f"{years} year(s), {Sale.objects.count():>7,} sales: "
+            f"TruncDate {timed(truncdate, requests):8.2f} ms   rollup report {timed(rollup, requests):6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,68 @@
+"""
+Latency of GET /api/products/scan/<code>/ through the full DRF stack.
+
+Scans follow a skewed mix (80% of scans hit 5% of the catalog), with a
+price edit every 500 scans to exercise invalidation.
+
+    python -m benchmarks.bench_scan_lookup [products] [scans]
+"""
+import random
+import statistics
+import sys
+import time
+
+from benchmarks._bootstrap import test_database
+
+from rest_framework.test import APIClient
+
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def main(products=50_000, scans=20_000):
+    from api.caches import scan_cache
+    from api.models import Branch, CustomUser, Product
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="till", password="x", branch=branch, role="cashier")
+    Product.objects.bulk_create(
+        (
+            Product(name=f"Product {i}", sku=f"BENCH-{i}", barcode=f"{i:013d}", price=10, quantity=100, branch=branch)
+            for i in range(products)
+        ),
+        batch_size=2000,
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    rng = random.Random(42)
+    hot = products // 20
+    codes = [
+        f"{rng.randrange(hot) if rng.random() < 0.8 else rng.randrange(products):013d}" for _ in range(scans)
+    ]
+    edit_ids = list(Product.objects.order_by("?").values_list("pk", flat=True)[: scans // 500 + 1])
+
+    timings = []
+    for n, code in enumerate(codes):
+        if n % 500 == 0:
+            product = Product.objects.get(pk=edit_ids[n // 500])
+            product.price += 1
+            product.save()
+        start = time.perf_counter()
+        response = client.get(f"/api/products/scan/{code}/")
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+
+    print(f"{scans:,} scans over {products:,} products, cache hit rate {scan_cache.hits / scans:.0%}")
+    print(
+        f"p50 {percentile(timings, 50):.2f} ms  p99 {percentile(timings, 99):.2f} ms  "
+        f"mean {statistics.mean(timings) * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
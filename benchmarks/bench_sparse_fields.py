@@ -0,0 +1,54 @@
+"""
+Payload size and latency of a full /api/products/ catalog walk, with and
+without the POS field selection.
+
+    python -m benchmarks.bench_sparse_fields [products]
+"""
+import sys
+
+from benchmarks._bootstrap import test_database, timer
+
+from rest_framework.test import APIClient
+
+POS_FIELDS = "id,name,sku,barcode,price,quantity"
+
+
+def walk(client, params):
+    url, pages, size = "/api/products/", 0, 0
+    while url:
+        response = client.get(url, params if pages == 0 else None)
+        assert response.status_code == 200, response.status_code
+        size += len(response.content)
+        pages += 1
+        url = response.data["next"]
+    return pages, size
+
+
+def main(products=50_000):
+    from api.models import Branch, CustomUser, Product
+
+    branch = Branch.objects.create(name="Bench Branch", location="High Street", phone="0123")
+    user = CustomUser.objects.create_user(username="bench", password="x", branch=branch, role="admin")
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=f"Product {i}", sku=f"BENCH-{i}", barcode=f"{i:013d}", price=10, cost_price=7,
+                quantity=100, branch=branch, description="Imported stock item " * 10, image=f"products/{i}.jpg",
+            )
+            for i in range(products)
+        ),
+        batch_size=2000,
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    for label, params in [("full", {"page_size": 500}), ("?fields=" + POS_FIELDS, {"page_size": 500, "fields": POS_FIELDS})]:
+        with timer(f"{label}", products, "products"):
+            pages, size = walk(client, params)
+        print(f"  {pages} pages, {size / 2**20:.1f} MiB, {size / products:.0f} B/product")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,68 @@
+"""
+Point-in-time stock latency against history size.
+
+Spreads ``movements`` over ``days`` days for 500 products, snapshots every
+day, then times stock_as_of() for a month end. With daily snapshots only
+one day of movements is replayed, so latency stays flat as history grows.
+
+    python -m benchmarks.bench_stock_as_of [movements] [days]
+"""
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from benchmarks._bootstrap import test_database
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+def main(movements=500_000, days=120):
+    from api.models import Branch, InventorySnapshot, Product
+    from api.stock import snapshot_inventory, stock_as_of
+
+    branch = Branch.objects.create(name="Bench Branch")
+    Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=movements, branch=branch)
+        for i in range(500)
+    )
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    start = timezone.now() - timedelta(days=days)
+    Product.objects.update(created_at=start)
+
+    rng = random.Random(42)
+    table = connection.ops.quote_name("api_stockmovement")
+    sql = (
+        f"INSERT INTO {table} (product_id, branch_id, movement_type, quantity, reference, note, created_at) "
+        "VALUES (%s, %s, %s, %s, '', '', %s)"
+    )
+    step = timedelta(days=days) / movements
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            sql,
+            (
+                (rng.choice(product_ids), branch.id, rng.choice(["in", "out"]), rng.randint(1, 5), start + step * i)
+                for i in range(movements)
+            ),
+        )
+
+    first_day = timezone.localdate(start)
+    for offset in range(days + 1):
+        snapshot_inventory(first_day + timedelta(days=offset), branch.id)
+    print(f"{movements:,} movements over {days} days, {InventorySnapshot.objects.count():,} snapshot rows")
+
+    month_end = (timezone.localdate() - timedelta(days=days // 2)).replace(day=1) - timedelta(days=1)
+    timings = []
+    for _ in range(20):
+        began = time.perf_counter()
+        stock_as_of(month_end, branch.id)
+        timings.append(time.perf_counter() - began)
+    print(f"stock as of {month_end}: median {statistics.median(timings) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,61 @@
+"""
+Concurrent cashiers selling the same products (file-backed SQLite).
+
+Checks that stock never goes negative and reports sales/s.
+
+    python -m benchmarks.bench_stock_contention [threads] [sales_per_thread]
+"""
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks._bootstrap import test_database, timer
+
+from django.db import connection
+from rest_framework.test import APIClient
+
+STOCK = 500
+
+
+def main(threads=8, sales_per_thread=100):
+    from api.models import Branch, CustomUser, Product, Sale
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="bench", password="x", branch=branch, role="cashier")
+    products = Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=STOCK, branch=branch) for i in range(3)
+    )
+
+    def cashier(worker):
+        client = APIClient()
+        client.force_authenticate(user)
+        codes = []
+        try:
+            for n in range(sales_per_thread):
+                payload = {
+                    "invoice_no": f"T{worker}-{n}",
+                    "branch": branch.pk,
+                    "items": [{"product": p.pk, "quantity": 1, "unit_price": "10.00"} for p in products],
+                }
+                codes.append(client.post("/api/sales/", payload, format="json").status_code)
+        finally:
+            connection.close()
+        return codes
+
+    attempts = threads * sales_per_thread
+    with timer(f"{threads} threads, {attempts} checkouts", units=attempts, unit_name="checkouts"):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            codes = [code for result in pool.map(cashier, range(threads)) for code in result]
+
+    quantities = list(Product.objects.values_list("quantity", flat=True))
+    print(f"created={codes.count(201)} conflicts={codes.count(409)} other={len(codes) - codes.count(201) - codes.count(409)}")
+    print(f"sales rows={Sale.objects.count()} remaining stock={quantities}")
+    assert min(quantities) >= 0 and Sale.objects.count() == min(attempts, STOCK)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        with test_database(Path(tmp) / "bench.sqlite3"):
+            main(*args)
@@ -0,0 +1,80 @@
+"""
+Rebuilding Product.quantity from the stock movement log.
+
+Loads ``movements`` random movements over ``products`` products, then times
+a full replay (opening balances only), taking a checkpoint, and a rebuild
+that only replays the movements recorded after it.
+
+    python -m benchmarks.bench_stock_rebuild [movements] [products]
+"""
+import random
+import sys
+
+from benchmarks._bootstrap import test_database, timer
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+def load_movements(count, product_ids, branch_id, first_id=1):
+    rng = random.Random(42)
+    types = ["in", "out", "out", "out", "return", "damage", "adjustment"]
+    now = timezone.now()
+    rows = []
+    table = connection.ops.quote_name("api_stockmovement")
+    sql = (
+        f"INSERT INTO {table} (id, product_id, branch_id, movement_type, quantity, reference, note, created_at) "
+        "VALUES (%s, %s, %s, %s, %s, '', '', %s)"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        for movement_id in range(first_id, first_id + count):
+            movement_type = rng.choice(types)
+            quantity = rng.randint(-3, 3) if movement_type == "adjustment" else rng.randint(1, 5)
+            rows.append((movement_id, rng.choice(product_ids), branch_id, movement_type, quantity, now))
+            if len(rows) == 50_000:
+                cursor.executemany(sql, rows)
+                rows = []
+        if rows:
+            cursor.executemany(sql, rows)
+
+
+def main(movements=1_000_000, products=1000):
+    from api.models import Branch, Product, StockCheckpoint
+    from api.stock import checkpoint_stock, rebuild_on_hand, verify_on_hand
+
+    branch = Branch.objects.create(name="Bench Branch")
+    # Large opening balances so the random log never goes negative
+    Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=movements, branch=branch)
+        for i in range(products)
+    )
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    StockCheckpoint.objects.bulk_create(
+        StockCheckpoint(product_id=pk, quantity=movements, movement_id=0) for pk in product_ids
+    )
+
+    with timer(f"load {movements:,} movements", movements, "rows"):
+        load_movements(movements, product_ids, branch.id)
+
+    with timer("full rebuild from opening balances", movements, "movements"):
+        result = rebuild_on_hand()
+    print(f"  updated {result['updated']:,} products")
+
+    with timer("checkpoint", movements, "movements"):
+        checkpoint_stock()
+
+    tail = max(movements // 100, 1)
+    load_movements(tail, product_ids, branch.id, first_id=movements + 1)
+    with timer(f"rebuild after checkpoint ({tail:,} new movements)", tail, "movements"):
+        result = rebuild_on_hand()
+    print(f"  updated {result['updated']:,} products")
+
+    with timer("verify"):
+        mismatches = verify_on_hand()
+    print(f"  {len(mismatches)} mismatches")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
@@ -0,0 +1,52 @@
+"""
+Authentication cost per GET: legacy tokens (user row loaded every request)
+vs tokens carrying role/branch_id claims.
+
+    python -m benchmarks.bench_token_auth [requests]
+"""
+import statistics
+import sys
+import time
+
+from benchmarks._bootstrap import test_database
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+def run(label, access, requests):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+    client.get("/api/products/")
+    timings, queries = [], 0
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = client.get("/api/products/")
+            timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        queries += len(ctx.captured_queries)
+    print(f"{label:>7}: median {statistics.median(timings) * 1000:.2f} ms  {queries / requests:.2f} queries/request")
+
+
+def main(requests=2_000):
+    from api.authentication import ClaimsTokenObtainPairSerializer
+    from api.models import Branch, CustomUser, Product
+
+    branch = Branch.objects.create(name="Bench Branch")
+    user = CustomUser.objects.create_user(username="till", password="x", branch=branch, role="cashier")
+    Product.objects.bulk_create(
+        Product(name=f"Product {i}", sku=f"BENCH-{i}", price=10, quantity=100, branch=branch) for i in range(200)
+    )
+
+    print(f"{requests:,} cached GET /api/products/ as a branch cashier")
+    run("legacy", str(RefreshToken.for_user(user).access_token), requests)
+    run("claims", str(ClaimsTokenObtainPairSerializer.get_token(user).access_token), requests)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    with test_database():
+        main(*args)
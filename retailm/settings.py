@@ -52,6 +52,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.queries.QueryCountMiddleware",  # only when QUERY_INSPECTION is on
 ]
 
 # ----------------------------------------------------
@@ -84,6 +85,14 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock at BEGIN so concurrent checkouts queue on the
+            # busy timeout instead of failing to upgrade a read lock mid-transaction
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # A file (not the shared in-memory db) so threaded tests can contend for locks
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -129,11 +138,15 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ----------------------------------------------------
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # JWTAuthentication that trusts role/branch_id claims instead of loading the user
+        "api.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ),
+    # Keyset pagination; each viewset sets its own cursor_ordering
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": 50,
 }
 
 # JWT settings (tokens lifetime)
@@ -142,8 +155,93 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
+    "TOKEN_OBTAIN_SERIALIZER": "api.authentication.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.authentication.ClaimsTokenRefreshSerializer",
+}
+# Holds the current claims of users whose role, branch or active flag changed,
+# for one access-token lifetime, so their older tokens are refused
+TOKEN_REVOCATION_CACHE = "shared"
+
+# ----------------------------------------------------
+# AUDIT LOG
+# ----------------------------------------------------
+# Actions recorded per model; unlisted models record create/update/delete,
+# an empty list disables auditing for that model.
+AUDIT_LOG_MODELS = {
+    "OutboxMessage": [],
+    "StockCheckpoint": [],
+    "ProductTombstone": [],
+    "DailySalesRollup": [],
 }
 
+# Rows older than this move to compressed monthly segments (archive_audit_logs)
+AUDIT_ARCHIVE_AFTER_DAYS = int(os.getenv("AUDIT_ARCHIVE_AFTER_DAYS", "90"))
+AUDIT_ARCHIVE_ROOT = BASE_DIR / "archive" / "audit"
+
+# ----------------------------------------------------
+# CATALOG SYNC
+# ----------------------------------------------------
+# Rows per /api/products/changes/ page; cursors are commit-ordered sync_seq
+# positions (see api/catalog.py), so no settle window is needed.
+CATALOG_SYNC_PAGE_SIZE = 1000
+
+# Prebuilt per-branch SQLite catalogs for offline tills (build_offline_catalogs)
+OFFLINE_CATALOG_ROOT = BASE_DIR / "catalogs"
+
+# ----------------------------------------------------
+# SCAN LOOKUPS
+# ----------------------------------------------------
+# Per-process LRU for /api/products/scan/<code>/; other workers see a change
+# after at most SCAN_CACHE_TTL seconds.
+SCAN_CACHE_SIZE = 10000
+SCAN_CACHE_TTL = 300
+
+# ----------------------------------------------------
+# CACHES
+# ----------------------------------------------------
+# "default" holds cached list responses per worker; "shared" is seen by every
+# worker on the host and holds the catalog version tokens that retire them.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "retailm",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache",
+    },
+}
+CATALOG_VERSION_CACHE = "shared"
+CATALOG_CACHE_TIMEOUT = 300
+
+# Gives the test run its own "shared" cache directory
+TEST_RUNNER = "retailm.test_runner.TestRunner"
+
+# ----------------------------------------------------
+# QUERY INSPECTION
+# ----------------------------------------------------
+# Adds X-Query-Count to responses and logs SQL templates a request runs
+# QUERY_REPEAT_THRESHOLD times or more (likely N+1s).
+QUERY_INSPECTION = os.getenv("QUERY_INSPECTION", str(DEBUG)) == "True"
+QUERY_REPEAT_THRESHOLD = 5
+
+# ----------------------------------------------------
+# EXPORTS
+# ----------------------------------------------------
+# Rows fetched per query by streaming exports, and how much of a finished
+# file is kept in memory before it spills to a temporary file.
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# ----------------------------------------------------
+# REPORT JOBS
+# ----------------------------------------------------
+# Threads per process rendering queued reports into MEDIA_ROOT/reports/
+# (0 renders them when the queuing transaction commits, in the request);
+# run_report_jobs requeues a job still running after REPORT_JOB_LEASE seconds.
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_JOB_LEASE = 3600
+
 # ----------------------------------------------------
 # CORS
 # ----------------------------------------------------
@@ -0,0 +1,21 @@
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests against a throwaway "shared" cache instead of BASE_DIR/cache."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._shared_cache = tempfile.TemporaryDirectory(prefix="retailm-cache-")
+        caches = {**settings.CACHES, "shared": {**settings.CACHES["shared"], "LOCATION": self._shared_cache.name}}
+        self._caches_override = override_settings(CACHES=caches)
+        self._caches_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches_override.disable()
+        self._shared_cache.cleanup()
+        super().teardown_test_environment(**kwargs)